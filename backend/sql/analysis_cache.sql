@@ -0,0 +1,11 @@
+-- Gemini の解析結果キャッシュ（ANALYSIS_CACHE_BACKEND=sql のときに使う）
+-- cache_key は画像の SHA-256 とプロンプト・モデル名のハッシュ（src/services/ai/analysis_cache.py の make_key）
+CREATE TABLE IF NOT EXISTS analysis_cache (
+  cache_key    CHAR(64) PRIMARY KEY,
+  result       JSONB NOT NULL,
+  expires_at   TIMESTAMPTZ NOT NULL,
+  created_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- 期限切れの行と古い行の削除（prune）に使う
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_expires_at ON analysis_cache(expires_at);
@@ -0,0 +1,17 @@
+-- 非同期の画像解析ジョブ（/api/image_analyze?mode=job。ANALYZE_JOB_BACKEND=sql のときに使う）
+-- ジョブは受け付けたプロセスで実行し、状態をここに書くので、どのプロセス・インスタンスからでも参照できる
+CREATE TABLE IF NOT EXISTS analyze_jobs (
+  job_id        UUID PRIMARY KEY,
+  img_id        VARCHAR(64) NOT NULL,
+  status        VARCHAR(16) NOT NULL,  -- queued / running / succeeded / failed
+  ai_response   JSONB,
+  location      TEXT,
+  error         TEXT,
+  error_status  INTEGER,
+  created_at    TIMESTAMPTZ NOT NULL,
+  finished_at   TIMESTAMPTZ,
+  expires_at    TIMESTAMPTZ NOT NULL   -- 最後に保存した時刻 + ANALYZE_JOB_TTL_SECONDS
+);
+
+-- 期限切れの行の削除（prune）に使う
+CREATE INDEX IF NOT EXISTS idx_analyze_jobs_expires_at ON analyze_jobs(expires_at);
@@ -0,0 +1,19 @@
+-- 逆ジオコーディングの住所キャッシュ（GEOCODE_CACHE_BACKEND=sql のときに使う）
+-- cell_key は GEOCODE_CELL_METERS 四方のグリッドのセル（src/services/geo/geocode.py の cell_of）
+-- 住所が見つからなかったセルは address = '' で記録する
+CREATE TABLE IF NOT EXISTS geocode_cache (
+  cell_key     TEXT PRIMARY KEY,
+  address      TEXT NOT NULL,
+  expires_at   TIMESTAMPTZ NOT NULL,
+  created_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- 期限切れの行を定期的に削除する場合に使う
+CREATE INDEX IF NOT EXISTS idx_geocode_cache_expires_at ON geocode_cache(expires_at);
+
+-- Nominatim への問い合わせ間隔を全プロセスで共有する（GEOCODE_RATE_LIMIT_BACKEND=sql のときに使う）
+-- 行は最初の問い合わせ時に作られる（name = 'nominatim'）
+CREATE TABLE IF NOT EXISTS geocode_rate_limit (
+  name          TEXT PRIMARY KEY,
+  last_call_at  TIMESTAMPTZ NOT NULL
+);
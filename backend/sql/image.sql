@@ -5,10 +5,33 @@ CREATE TABLE IF NOT EXISTS images (
   size_bytes   BIGINT NOT NULL,
   sha256_hex   CHAR(64) NOT NULL,
   status       TEXT NOT NULL CHECK (status IN ('pending','stored','failed')),
+  ref_count    INTEGER NOT NULL DEFAULT 1 CHECK (ref_count >= 1),
   created_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
   updated_at   TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
+-- 既存環境向け（ref_count 追加前に作成したテーブル）
+ALTER TABLE images ADD COLUMN IF NOT EXISTS ref_count INTEGER NOT NULL DEFAULT 1;
+
+-- 重複排除: 同じ内容（sha256_hex, size_bytes）の保存済み画像を引く
+CREATE INDEX IF NOT EXISTS idx_images_sha256_size ON images(sha256_hex, size_bytes) WHERE status = 'stored';
+
+-- 掃除（reap_images）: 古い pending / failed の行を引く
+CREATE INDEX IF NOT EXISTS idx_images_dead_updated ON images(status, updated_at) WHERE status <> 'stored';
+
+-- サムネイル等のレンディション（size は長辺の px）
+CREATE TABLE IF NOT EXISTS image_renditions (
+  img_id       UUID NOT NULL REFERENCES images(img_id) ON DELETE CASCADE,
+  size         INTEGER NOT NULL CHECK (size > 0),
+  gcs_uri      TEXT NOT NULL,
+  mime_type    TEXT NOT NULL,
+  width        INTEGER NOT NULL,
+  height       INTEGER NOT NULL,
+  size_bytes   BIGINT NOT NULL,
+  created_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (img_id, size)
+);
+
 -- updated_at の自動更新（拡張を使わない素朴な方法の例）
 CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS TRIGGER AS $$
 BEGIN
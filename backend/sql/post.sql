@@ -30,6 +30,18 @@ CREATE INDEX IF NOT EXISTS idx_posts_user_id   ON posts(user_id);
 CREATE INDEX IF NOT EXISTS idx_posts_date      ON posts(date);
 CREATE INDEX IF NOT EXISTS idx_posts_img_id    ON posts(img_id);
 CREATE INDEX IF NOT EXISTS idx_posts_lat_lng   ON posts(latitude, longitude);
+-- 公開投稿のキーセットページング用（ORDER BY date DESC, post_id DESC）
+CREATE INDEX IF NOT EXISTS idx_posts_public_date_id ON posts(date DESC, post_id DESC) WHERE is_public;
+-- 住所の補完待ち（POST_GEOCODE_MODE=deferred）の投稿を古い順に取り出す用（値は location_worker.LOCATION_PENDING）
+CREATE INDEX IF NOT EXISTS idx_posts_location_pending ON posts(date) WHERE location = '位置情報を取得中';
+
+-- 住所の補完の予約（location_worker が複数のプロセスで同じ投稿を逆ジオコーディングしないように）
+-- claimed_until を過ぎた予約は他のプロセスが引き継ぐ。attempts は問い合わせを試みた回数
+CREATE TABLE IF NOT EXISTS post_location_claims (
+  post_id        UUID PRIMARY KEY REFERENCES posts(post_id) ON DELETE CASCADE,
+  claimed_until  TIMESTAMPTZ NOT NULL,
+  attempts       INTEGER NOT NULL DEFAULT 0
+);
 
 -- updated_at の自動更新トリガ（FUNCTION を使用）
 CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
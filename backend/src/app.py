@@ -1,8 +1,9 @@
 from flask import Flask, jsonify
 from src.routes.image_route import image_bp
 from src.routes.img_analyze_route import img_analyze_bp
-from src.routes.post_route import post_bp
+from src.routes.post_route import POST_GEOCODE_MODE, post_bp
 from src.routes.search_route import search_bp
+from src.services.post.location_worker import location_worker
 from src.utils.config import CONFIG
 
 app = Flask(__name__)
@@ -12,6 +13,10 @@ app.register_blueprint(img_analyze_bp)
 app.register_blueprint(image_bp)
 app.register_blueprint(search_bp)
 
+# 住所を後から補完するモードでは、起動時にワーカーを動かす（再起動前に溜まった補完待ちの投稿も処理する）
+if POST_GEOCODE_MODE == "deferred":
+    location_worker.start()
+
 
 # プロセスが生きているかの確認用
 @app.get("/health")
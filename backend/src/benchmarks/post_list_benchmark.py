@@ -0,0 +1,89 @@
+# 投稿一覧のシリアライズ方式を比較するマイクロベンチマーク
+# - orm:       session.query(Post) で ORM エンティティを読み込み dict に詰め替える（従来方式）
+# - projected: session.query(*POST_COLUMNS) で列だけをタプルとして読み込み dict に変換する（現行方式）
+# Cloud SQL には接続せず、SQLite のインメモリ DB で計測する
+#
+# 実行例: python -m src.benchmarks.post_list_benchmark --rows 5000 --page 100 --repeat 200
+import argparse
+import datetime
+import time
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from src.services.post.post import POST_COLUMNS, Post, PostService
+
+
+def _seed(session, rows: int) -> None:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    session.add_all(
+        Post(
+            post_id=uuid.uuid4(),
+            user_id=f"user-{i % 50}",
+            img_id=uuid.uuid4(),
+            user_question="これは何ですか？",
+            object_label="エゾリス",
+            ai_answer="北海道に生息するリスの一種で、冬でも冬眠せずに活動します。" * 4,
+            ai_question="なぜエゾリスは冬眠しないのでしょうか？",
+            ai_reference=None,
+            location="札幌市 中央区",
+            latitude=43.0 + i * 1e-4,
+            longitude=141.3 + i * 1e-4,
+            is_public=True,
+            post_rarity=i % 4,
+            date=now - datetime.timedelta(minutes=i),
+            updated_at=now,
+        )
+        for i in range(rows)
+    )
+    session.commit()
+
+
+def _list_orm(session, page: int):
+    rows = session.query(Post).filter(Post.is_public.is_(True)).order_by(Post.date.desc()).limit(page).all()
+    return [PostService._serialize(p) for p in rows]
+
+
+def _list_projected(session, page: int):
+    rows = session.query(*POST_COLUMNS).filter(Post.is_public.is_(True)).order_by(Post.date.desc()).limit(page).all()
+    return [PostService._serialize(p) for p in rows]
+
+
+def _measure(fn, Session, page: int, repeat: int) -> float:
+    """1リクエスト = 1セッションとして repeat 回実行し、1秒あたりの一覧取得回数を返す"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with Session() as session:
+            fn(session, page)
+    return repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿一覧のシリアライズ方式（ORM / 列射影）を比較する")
+    parser.add_argument("--rows", type=int, default=5000, help="投入する投稿数")
+    parser.add_argument("--page", type=int, default=100, help="1回の一覧取得件数")
+    parser.add_argument("--repeat", type=int, default=200, help="計測回数")
+    args = parser.parse_args()
+
+    engine = sa.create_engine("sqlite://")
+    Post.metadata.create_all(engine, tables=[Post.__table__])
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    with Session() as session:
+        _seed(session, args.rows)
+
+    with Session() as session:
+        assert _list_orm(session, args.page) == _list_projected(session, args.page)
+
+    # ウォームアップ
+    _measure(_list_orm, Session, args.page, 10)
+    _measure(_list_projected, Session, args.page, 10)
+
+    orm_rps = _measure(_list_orm, Session, args.page, args.repeat)
+    projected_rps = _measure(_list_projected, Session, args.page, args.repeat)
+    print(f"rows={args.rows} page={args.page} repeat={args.repeat}")
+    print(f"orm:       {orm_rps:8.1f} lists/s")
+    print(f"projected: {projected_rps:8.1f} lists/s  (x{projected_rps / orm_rps:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 import uuid
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from flask import Blueprint, jsonify, request
-from src.services.image.image import ImageService
+from src.services.image.image import RENDITION_SIZES, ImageService
 
 image_bp = Blueprint("image_bp", __name__)
 
+# /api/images/batch で一度に指定できる img_id の上限
+BATCH_MAX_IMAGES = 100
+
 
 # --- ヘルパー関数 ---
 def _bad_request(msg: str, detail: str | None = None) -> tuple[Any, int]:
@@ -15,6 +18,20 @@ def _bad_request(msg: str, detail: str | None = None) -> tuple[Any, int]:
     return jsonify(payload), 400
 
 
+def _parse_size(raw: Any) -> Optional[int]:
+    """size（レンディションの長辺 px）をパース。未指定 / "original" なら None（元画像）"""
+    if raw is None or raw == "" or raw == "original":
+        return None
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        size = None
+    if size not in RENDITION_SIZES:
+        allowed = ", ".join(str(s) for s in RENDITION_SIZES)
+        raise ValueError(f"size は {allowed} または original で指定してください")
+    return size
+
+
 @image_bp.route("/api/images", methods=["POST"])
 def save_image():
     """画像を新規アップロード"""
@@ -25,32 +42,100 @@ def save_image():
     if not file or file.filename == "":
         return _bad_request("ファイルが空です")
 
-    # Pillowなどを使ったより厳密な検証をサービス層で行うのが望ましい
+    # 申告値での簡易チェック（実データの MIME はサービス層で先頭チャンクから判定する）
     if not (file.mimetype and file.mimetype.startswith("image/")):
         return _bad_request("ファイル形式が不正です", "画像ファイルを指定してください")
 
     try:
-        # サービス層を呼び出し
-        file_data = file.read()
-        created = ImageService.save_image(
-            file_data=file_data,
-            mime_type=file.mimetype,
-        )
+        # ファイル全体を読み込まず、ストリームのままサービス層に渡す
+        created = ImageService.save_image_stream(file.stream, mime_type=file.mimetype)
         if created is None:
             return jsonify({"error": "画像の保存に失敗しました"}), 500
         return jsonify({"image": created}), 201
 
+    except ValueError as e:
+        return _bad_request("ファイル形式が不正です", str(e))
     except RuntimeError as e:
         return jsonify({"error": "サービス初期化エラー", "detail": str(e)}), 503
     except Exception as e:
         return jsonify({"error": "予期せぬエラーが発生しました", "detail": str(e)}), 500
 
 
+@image_bp.route("/api/images/upload_url", methods=["POST"])
+def create_upload_url():
+    """ブラウザから GCS へ直接アップロードするための署名付き PUT URL を発行（2段階アップロードの1段目）
+    入力: { "mime_type": "image/jpeg", "size_bytes": 123456, "sha256_hex": "..."（任意） }
+    出力: { "img_id": "...", "upload_url": "...", "method": "PUT", "headers": {...}, "expires_in": 900 }
+    """
+    data = request.get_json(silent=True) or {}
+    size_raw = data.get("size_bytes")
+    if isinstance(size_raw, bool) or not isinstance(size_raw, int):
+        return _bad_request("size_bytes は整数で指定してください")
+    sha256_hex = data.get("sha256_hex")
+    if sha256_hex is not None and not isinstance(sha256_hex, str):
+        return _bad_request("sha256_hex は文字列で指定してください")
+
+    try:
+        upload = ImageService.create_upload_url(data.get("mime_type"), size_raw, sha256_hex)
+        return jsonify(upload), 201
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
+    except RuntimeError as e:
+        return jsonify({"error": "サービス初期化エラー", "detail": str(e)}), 503
+
+
+@image_bp.route("/api/images/<uuid:img_id>/finalize", methods=["POST"])
+def finalize_upload(img_id: uuid.UUID):
+    """署名付き URL へのアップロード完了を通知し、サイズ・ハッシュを検証して保存を確定（2段階アップロードの2段目）"""
+    try:
+        image = ImageService.finalize_upload(img_id)
+        if image is None:
+            return jsonify({"error": "指定された画像は存在しないか、確定処理に失敗しました"}), 404
+        return jsonify({"image": image}), 200
+    except ValueError as e:
+        return jsonify({"error": "アップロードされた画像を検証できません", "detail": str(e)}), 409
+    except RuntimeError as e:
+        return jsonify({"error": "サービス初期化エラー", "detail": str(e)}), 503
+
+
+@image_bp.route("/api/images/batch", methods=["POST"])
+def get_images_batch():
+    """複数の img_id の画像情報（署名付きURL含む）をまとめて取得
+    入力: { "img_ids": ["<uuid>", ...], "size": 128 }（size は任意）
+    出力: { "images": { "<img_id>": {...} }, "missing": ["<img_id>", ...] }
+    """
+    data = request.get_json(silent=True) or {}
+    raw_ids = data.get("img_ids")
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return _bad_request("img_ids は空でない配列で指定してください")
+    if len(raw_ids) > BATCH_MAX_IMAGES:
+        return _bad_request(f"img_ids は最大 {BATCH_MAX_IMAGES} 件までです")
+    try:
+        img_ids = [uuid.UUID(str(v)) for v in raw_ids]
+    except ValueError as e:
+        return _bad_request("img_ids はUUID形式で指定してください", str(e))
+    try:
+        size = _parse_size(data.get("size"))
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
+
+    try:
+        images = ImageService.get_images(img_ids, size=size)
+        missing = [str(i) for i in dict.fromkeys(img_ids) if str(i) not in images]
+        return jsonify({"images": images, "missing": missing}), 200
+    except RuntimeError as e:
+        return jsonify({"error": "サービス初期化エラー", "detail": str(e)}), 503
+
+
 @image_bp.route("/api/images/<uuid:img_id>", methods=["GET"])
 def get_image(img_id: uuid.UUID):
-    """img_id(UUID)で画像情報（署名付きURL含む）を1件取得"""
+    """img_id(UUID)で画像情報（署名付きURL含む）を1件取得（size でレンディションを指定可）"""
+    try:
+        size = _parse_size(request.args.get("size"))
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
     try:
-        image = ImageService.get_image(img_id)
+        image = ImageService.get_image(img_id, size=size)
         if image is None:
             return jsonify({"error": "指定された画像は存在しないか、保存処理に失敗しています"}), 404
         return jsonify({"image": image}), 200
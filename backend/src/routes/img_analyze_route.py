@@ -1,18 +1,31 @@
 from __future__ import annotations
 
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Any, Dict, Tuple
+from typing import IO, Any, Dict, Iterator, Tuple
+from zoneinfo import ZoneInfo
 
-from flask import Blueprint, jsonify, request
-from geopy.geocoders import Nominatim
+from flask import Blueprint, Response, jsonify, request
 from src.services.ai.analyze import AnalyzeService
-from src.services.image.image import ImageService
-from timezonefinder import TimezoneFinder
-from werkzeug.exceptions import BadRequest
-from zoneinfo import ZoneInfo
+from src.services.ai.analyze_job import AnalyzeJob, AnalyzeJobService, poll_intervals
+from src.services.geo.geocode import geocoder
+from src.services.image.image import UPLOAD_CHUNK_SIZE, ImageService
+from src.utils.config import CONFIG
+from src.utils.timezones import timezone_at
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge
 
 img_analyze_bp = Blueprint("img_analyze", __name__)
 
+# /api/image_analyze で画像の保存（GCS + Cloud SQL）を逆ジオコーディング・解析と並行して行うスレッドプール
+IMAGE_SAVE_MAX_WORKERS = int(os.environ.get("IMAGE_SAVE_MAX_WORKERS", "8"))
+_save_executor = ThreadPoolExecutor(max_workers=IMAGE_SAVE_MAX_WORKERS, thread_name_prefix="img-save")
+
 
 def _bad_request(msg: str, detail: str | None = None) -> Tuple[Any, int]:
     payload: Dict[str, Any] = {"error": msg}
@@ -24,17 +37,13 @@ def _bad_request(msg: str, detail: str | None = None) -> Tuple[Any, int]:
 def _reverse_geocode_location(lat: float, lon: float) -> str | None:
     """緯度経度から日本語住所を取得（失敗時は None を返す）。
 
-    - Nominatim を利用
+    - 共有の geocoder（セル単位のキャッシュ付き）を利用
     - 例外は握りつぶして None を返す
     """
     try:
-        geolocator = Nominatim(user_agent="image_analyze_geocoder")
-        loc = geolocator.reverse((lat, lon), language="ja")
-        if loc:
-            return loc.address
+        return geocoder.reverse(lat, lon)
     except Exception:
-        pass
-    return None
+        return None
 
 
 def _get_location_and_time(lat: float, lon: float) -> Tuple[str, str]:
@@ -55,8 +64,7 @@ def _get_location_and_time(lat: float, lon: float) -> Tuple[str, str]:
 
             # タイムゾーン取得とローカル時刻
             try:
-                tf = TimezoneFinder()
-                tzname = tf.timezone_at(lat=lat, lng=lon)
+                tzname = timezone_at(lat, lon)
                 if tzname:
                     now_local = datetime.now(ZoneInfo(tzname))
                 else:
@@ -71,6 +79,105 @@ def _get_location_and_time(lat: float, lon: float) -> Tuple[str, str]:
     return location_text, local_time_iso
 
 
+def _spool_image(file: Any) -> IO[bytes]:
+    """
+    アップロードされた画像を UPLOAD_CHUNK_SIZE ずつ読み、SpooledTemporaryFile に書き出して先頭に戻して返す
+    （UPLOAD_CHUNK_SIZE を超える分はディスクに退避する）。保存と解析はこの1つのスプールを読む
+    空・画像以外なら ValueError、ANALYZE_UPLOAD_MAX_BYTES を超えたら RequestEntityTooLarge（全体を読む前に打ち切る）
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE)
+    try:
+        chunk = file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            raise ValueError("空の画像データです")
+        if not AnalyzeService.sniff_mime(chunk[:2048]).startswith("image/"):
+            raise ValueError("画像ファイルではありません")
+        size = 0
+        while chunk:
+            size += len(chunk)
+            if size > CONFIG.ANALYZE_UPLOAD_MAX_BYTES:
+                raise RequestEntityTooLarge(f"画像は {CONFIG.ANALYZE_UPLOAD_MAX_BYTES} バイト以下にしてください")
+            spool.write(chunk)
+            chunk = file.read(UPLOAD_CHUNK_SIZE)
+        spool.seek(0)
+        return spool
+    except Exception:
+        spool.close()
+        raise
+
+
+def _analyze_with_context(raw: bytes, user_question: str, lat: Any, lon: Any) -> Tuple[Dict[str, Any], str | None]:
+    """逆ジオコーディング（任意）をしてから、読み込み済みの画像データを Gemini で解析する"""
+    # プロンプトに住所・現地時刻を含めるため、解析は逆ジオコーディングの後に行う
+    location_text, local_time_iso = _get_location_and_time(lat, lon)
+    ai_response = AnalyzeService.analyze(
+        file=None,
+        image_url=None,
+        user_question=user_question,
+        location=location_text,
+        local_time_iso=local_time_iso,
+        image_bytes=raw,
+    )
+    return ai_response, location_text
+
+
+def _analyze_while_saving(
+    save_future: Future, raw: bytes, user_question: str, lat: Any, lon: Any
+) -> Tuple[Dict[str, Any] | None, Dict[str, Any] | None, str | None]:
+    """
+    保存（save_future）と並行して解析し、保存の完了を待って (saved, ai_response, location_text) を返す
+    保存に失敗した場合は解析の結果・失敗にかかわらず saved=None を返す（保存できなかった画像の解析結果は返さない）
+    """
+    try:
+        ai_response, location_text = _analyze_with_context(raw, user_question, lat, lon)
+    except Exception:
+        if not save_future.result():
+            return None, None, None
+        raise
+    return save_future.result(), ai_response, location_text
+
+
+def _save_and_analyze(spool: IO[bytes], mime_type: str, user_question: str, lat: Any, lon: Any) -> Tuple[Any, int]:
+    """画像の保存と解析を並行して行い、両方の完了を待って結果を返す（mode=sync）"""
+    # Gemini には画像をバイト列で渡すので、解析用に一度だけ読み出す。保存はスプールを先頭から読み直す
+    raw = spool.read()
+    spool.seek(0)
+    save_future = _save_executor.submit(ImageService.save_image_stream, spool, mime_type=mime_type)
+    saved, ai_response, location_text = _analyze_while_saving(save_future, raw, user_question, lat, lon)
+    if not saved:
+        # 保存失敗時 (GCSアップロード or DB更新失敗)
+        return jsonify({"error": "画像の保存に失敗しました"}), 502
+    return jsonify({"img_id": saved["img_id"], "ai_response": ai_response, "location": location_text}), 200
+
+
+def _start_analyze_job(
+    spool: IO[bytes], mime_type: str, user_question: str, lat: Any, lon: Any
+) -> Tuple[Any, int, Any]:
+    """画像を保存してから解析をジョブとして登録し、Gemini の応答を待たずに 202 を返す（mode=job）"""
+    saved = ImageService.save_image_stream(spool, mime_type=mime_type)
+    if not saved:
+        return jsonify({"error": "画像の保存に失敗しました"}), 502, {}
+
+    # スプールはリクエストの終わりに閉じるので、ジョブには画像をバイト列で渡す
+    spool.seek(0)
+    raw = spool.read()
+    job = AnalyzeJobService.submit(
+        saved["img_id"], functools.partial(_analyze_with_context, raw, user_question, lat, lon)
+    )
+    status_url = f"/api/analyze_jobs/{job.job_id}"
+    body = {
+        "img_id": saved["img_id"],
+        "job": job.to_dict(),
+        "status_url": status_url,
+        "events_url": f"{status_url}/events",
+    }
+    return jsonify(body), 202, {"Location": status_url}
+
+
+# /api/image_analyze の処理方式（sync: 解析結果まで待って返す / job: 解析をジョブにして job_id をすぐ返す）
+ANALYZE_MODES = {"sync": _save_and_analyze, "job": _start_analyze_job}
+
+
 @img_analyze_bp.post("/v1/analyze")
 def post_analyze():
     """
@@ -105,14 +212,16 @@ def create_image_and_analyze():
     """
     画像と質問文を受け取り、以下を実施するAPI:
     1) img_id を発行して Cloud Storage + Cloud SQL に保存
-    2) 保存に成功したら、gs:// と質問文をもとに Gemini を呼び出す
-    3) img_analyze_route と同形式の ai_response に img_id を添えて返す
+    2) 1 と並行して、受け取った画像データと質問文をもとに Gemini を呼び出す（GCS から取得し直さない）
+    3) img_analyze_route と同形式の ai_response に img_id を添えて返す（保存に失敗した場合はエラー）
 
     リクエスト (multipart/form-data):
     - file: 画像ファイル (必須)
     - user_question: テキスト質問 (必須)
     - latitude: 緯度 (任意: 解析の文脈付与用)
     - longitude: 経度 (任意: 解析の文脈付与用)
+    - mode: "sync"（既定）/ "job"（クエリ文字列でも可）
+      job なら画像の保存後すぐに 202 と job_id を返し、結果は GET /api/analyze_jobs/<job_id> で取得する
 
     レスポンス (200):
     {
@@ -138,41 +247,25 @@ def create_image_and_analyze():
         return _bad_request("画像ファイル(img_file)は必須です")
     if not user_question:
         return _bad_request("質問文(user_question)は必須です")
+    handler = ANALYZE_MODES.get((request.values.get("mode") or "sync").strip().lower())
+    if handler is None:
+        return _bad_request(f"mode は {' / '.join(ANALYZE_MODES)} のいずれかで指定してください")
 
     try:
-        # 1) まず画像を GCS + Cloud SQL に保存
-        file_data = file.read()
-        if not file_data:
-            return _bad_request("空の画像データです")
-
-        # mimetype はクライアント申告なので、必要に応じて python-magic で厳密化しても良い
+        # 1) 画像を上限まで一度だけスプールに読み込み、保存と解析の両方に使う（解析のために GCS から取得し直さない）
+        try:
+            spool = _spool_image(file)
+        except ValueError as e:
+            return _bad_request(str(e))
         mime_type = getattr(file, "mimetype", None) or "application/octet-stream"
 
-        saved = ImageService.save_image(file_data=file_data, mime_type=mime_type)
-        if not saved:
-            # 保存失敗時 (GCSアップロード or DB更新失敗)
-            return jsonify({"error": "画像の保存に失敗しました"}), 502
-
-        img_id = saved["img_id"]
-        gcs_uri = saved["gcs_uri"]
-
-        # 2) 位置情報の逆ジオコーディングとローカル時刻の算出（任意）
-        location_text, local_time_iso = _get_location_and_time(lat_raw, lon_raw)
-
-        # 3) 保存に成功したので、Gemini で解析
-        #    AnalyzeService.analyze は image_url に gs:// を渡せば内部でダウンロードして処理します
-        ai_response = AnalyzeService.analyze(
-            file=None,
-            image_url=gcs_uri,
-            user_question=user_question,
-            location=location_text,
-            local_time_iso=local_time_iso,
-        )
-
-        # 4) フロントへ img_id と location を添えて返却
-        return jsonify({"img_id": img_id, "ai_response": ai_response, "location": location_text}), 200
+        # 2) job: 保存後に解析をジョブとして登録して 202 を返す
+        #    sync: 保存と逆ジオコーディング・Gemini の解析を並行して行い、img_id と location を添えて返す
+        with spool:
+            return handler(spool, mime_type, user_question, lat_raw, lon_raw)
 
-    except BadRequest as e:
+    except HTTPException as e:
+        # BadRequest・RequestEntityTooLarge（画像が ANALYZE_UPLOAD_MAX_BYTES を超えた）など
         return jsonify({"error": str(e)}), e.code
     except TimeoutError as e:
         # 上流(API)のタイムアウト扱い
@@ -183,3 +276,65 @@ def create_image_and_analyze():
     except Exception as e:
         # 予期しないエラーは 502 として返す
         return jsonify({"error": f"upstream error: {e}"}), 502
+
+
+@img_analyze_bp.get("/api/analyze_jobs/<uuid:job_id>")
+def get_analyze_job(job_id):
+    """解析ジョブの状態と（完了していれば）結果を返す"""
+    job = AnalyzeJobService.get(str(job_id))
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    return jsonify(job.to_dict()), 200
+
+
+# このプロセスで同時に開いている SSE の枠（ANALYZE_JOB_SSE_MAX_STREAMS）
+_sse_slots = threading.BoundedSemaphore(CONFIG.ANALYZE_JOB_SSE_MAX_STREAMS)
+
+
+def _sse(event: str, job: AnalyzeJob) -> str:
+    return f"event: {event}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+
+
+def _job_events(job: AnalyzeJob, max_seconds: float | None = None) -> Iterator[str]:
+    """
+    現在の状態を送り、完了まで keep-alive のコメントを送り続けてから結果を送る
+    接続は max_seconds（ANALYZE_JOB_SSE_MAX_SECONDS）で閉じる。同期ワーカーが timeout で落とされないようにするためで、
+    EventSource は retry のミリ秒後に自動で再接続し、再接続先では最新の状態から送り直す
+    """
+    if max_seconds is None:
+        max_seconds = CONFIG.ANALYZE_JOB_SSE_MAX_SECONDS
+    yield f"retry: {CONFIG.ANALYZE_JOB_SSE_RETRY_MS}\n\n"
+    yield _sse("status", job)
+    deadline = time.monotonic() + max_seconds
+    # ストアを読み直す間隔は接続中ずっと伸ばしていく（keep-alive のたびに短い間隔に戻さない）
+    backoff = poll_intervals()
+    while not job.finished:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        latest = AnalyzeJobService.wait(
+            job.job_id, min(CONFIG.ANALYZE_JOB_SSE_HEARTBEAT_SECONDS, remaining), backoff=backoff
+        )
+        if latest is None:
+            # 期限切れで消えた（再接続すると 404 になり、EventSource は再接続をやめる）
+            return
+        job = latest
+        if not job.finished:
+            yield ": keep-alive\n\n"
+    yield _sse(job.status, job)
+
+
+@img_analyze_bp.get("/api/analyze_jobs/<uuid:job_id>/events")
+def stream_analyze_job(job_id):
+    """解析ジョブの完了を Server-Sent Events で通知する（完了イベントを送ったら接続を閉じる）"""
+    job = AnalyzeJobService.get(str(job_id))
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    # SSE の接続はその間ワーカー（のスレッド）を1つ占有するので、プロセスごとの同時接続数を抑える
+    if not _sse_slots.acquire(blocking=False):
+        body = {"error": "SSE の同時接続数が上限に達しています。status_url をポーリングしてください"}
+        return jsonify(body), 503, {"Retry-After": "5"}
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(_job_events(job), mimetype="text/event-stream", headers=headers)
+    response.call_on_close(_sse_slots.release)
+    return response
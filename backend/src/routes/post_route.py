@@ -1,16 +1,42 @@
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
 from flask import Blueprint, jsonify, request
-from geopy.geocoders import Nominatim
+from src.services.geo.geocode import geocoder
 from src.services.image.image import ImageService
-from src.services.post.post import PostService
+from src.services.post.location_worker import LOCATION_PENDING, location_worker
+from src.services.post.post import TILE_GRID, PostService
 from src.services.vertex_ai.search import SearchService
+from src.utils.cache import TTLCache
+from src.utils.config import CONFIG
 
 post_bp = Blueprint("post_bp", __name__)
 
+# /api/posts/recent の1ページあたりの件数（デフォルト / 上限）
+RECENT_DEFAULT_LIMIT = 100
+RECENT_MAX_LIMIT = 500
+
+# /api/posts/in_bbox の取得件数（デフォルト / 上限）
+BBOX_DEFAULT_LIMIT = 200
+BBOX_MAX_LIMIT = 500
+
+# location 未指定の投稿の住所の補完方法（sync / deferred）
+POST_GEOCODE_MODES = ("sync", "deferred")
+POST_GEOCODE_MODE = CONFIG.POST_GEOCODE_MODE
+if POST_GEOCODE_MODE not in POST_GEOCODE_MODES:
+    print(f"WARN: unsupported POST_GEOCODE_MODE: {POST_GEOCODE_MODE} -> fallback to sync")
+    POST_GEOCODE_MODE = "sync"
+
+# include= で指定できる関連リソース
+INCLUDE_OPTIONS = ("image",)
+
+# /api/posts/tiles のタイル単位キャッシュ（(z, x, y) -> レスポンス）
+_tile_cache: TTLCache[Dict[str, Any]] = TTLCache(
+    maxsize=CONFIG.TILE_CACHE_MAX_ENTRIES, ttl=CONFIG.TILE_CACHE_TTL_SECONDS
+)
+
 
 @dataclass(frozen=True)
 class CreatePostDTO:
@@ -49,11 +75,8 @@ def _get_request_data() -> Dict[str, Any]:
 
 
 def _reverse_geocode(lat: float, lon: float) -> str:
-    geolocator = Nominatim(user_agent="my_geocoder")
-    location = geolocator.reverse((lat, lon), language="ja")
-    if location:
-        return location.address
-    return "不明な場所"
+    """共有の geocoder で住所を引く（見つからない・取得に失敗したら「不明な場所」。緯度経度が不正なら ValueError）"""
+    return geocoder.reverse(lat, lon) or "不明な場所"
 
 
 def _parse_float(name: str, v: Any) -> float:
@@ -168,6 +191,86 @@ def _parse_iso8601(ts: str) -> datetime:
     return dt
 
 
+def _parse_include(raw: Any) -> bool:
+    """include=image（カンマ区切り）をパースし、画像を埋め込むかを返す"""
+    if raw is None or raw == "":
+        return False
+    if isinstance(raw, str):
+        names = [n.strip() for n in raw.split(",") if n.strip()]
+    elif isinstance(raw, (list, tuple)) and all(isinstance(n, str) for n in raw):
+        names = [n.strip() for n in raw if n.strip()]
+    else:
+        raise ValueError("include はカンマ区切りの文字列で指定してください")
+    unknown = [n for n in names if n not in INCLUDE_OPTIONS]
+    if unknown:
+        raise ValueError(f"include に指定できない値: {', '.join(unknown)}（指定可能: {', '.join(INCLUDE_OPTIONS)}）")
+    return "image" in names
+
+
+def _attach_images(posts: list[Dict[str, Any]], include_image: bool) -> None:
+    """include=image のとき、結合済みの画像に署名付きURLを付ける"""
+    if include_image:
+        ImageService.attach_signed_urls(posts)
+
+
+def _parse_recent_page_args(
+    source: Dict[str, Any],
+) -> Tuple[int, str | None, datetime | None, Tuple[str, ...] | None, bool]:
+    """/api/posts/recent 用のページング引数（limit, cursor, since, fields, include）をパース"""
+    try:
+        limit = int(source.get("limit", RECENT_DEFAULT_LIMIT))
+    except (TypeError, ValueError):
+        raise ValueError("limit は整数で指定してください")
+    if not (1 <= limit <= RECENT_MAX_LIMIT):
+        raise ValueError(f"limit は 1〜{RECENT_MAX_LIMIT} の範囲で指定してください")
+
+    cursor = source.get("cursor") or None
+    if cursor is not None and not isinstance(cursor, str):
+        raise ValueError("cursor は文字列で指定してください")
+
+    since_raw = source.get("since")
+    since = _parse_iso8601(since_raw) if isinstance(since_raw, str) and since_raw.strip() else None
+    fields = PostService.parse_fields(source.get("fields"))
+    include_image = _parse_include(source.get("include"))
+    return limit, cursor, since, fields, include_image
+
+
+def _parse_bbox_args(source: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """ビューポート矩形（min_lat, min_lng, max_lat, max_lng）をパース"""
+    missing = [k for k in ("min_lat", "min_lng", "max_lat", "max_lng") if source.get(k) in (None, "")]
+    if missing:
+        raise ValueError(f"必須パラメータ不足: {', '.join(missing)}")
+    min_lat = _parse_float("min_lat", source.get("min_lat"))
+    min_lng = _parse_float("min_lng", source.get("min_lng"))
+    max_lat = _parse_float("max_lat", source.get("max_lat"))
+    max_lng = _parse_float("max_lng", source.get("max_lng"))
+    for name, v in (("min_lat", min_lat), ("max_lat", max_lat)):
+        if not (-90.0 <= v <= 90.0):
+            raise ValueError(f"{name} は -90〜90 の範囲で指定してください")
+    for name, v in (("min_lng", min_lng), ("max_lng", max_lng)):
+        if not (-180.0 <= v <= 180.0):
+            raise ValueError(f"{name} は -180〜180 の範囲で指定してください")
+    if min_lat > max_lat:
+        raise ValueError("min_lat は max_lat 以下で指定してください")
+    # min_lng > max_lng は日付変更線をまたぐ矩形として許容する
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def _recent_payload(
+    posts: list[Dict[str, Any]], cutoff: datetime, now: datetime, limit: int, since: datetime | None
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "posts": posts,
+        "before": cutoff.isoformat(),
+        "now": now.isoformat(),
+        "limit": limit,
+        "next_cursor": PostService.next_cursor(posts, limit),
+    }
+    if since is not None:
+        payload["since"] = since.isoformat()
+    return payload
+
+
 @post_bp.route("/api/posts", methods=["POST"])
 def create_post():
     """投稿を新規作成"""
@@ -178,9 +281,14 @@ def create_post():
         # post_id を作成
         data["post_id"] = str(uuid.uuid4())
         # 位置情報の住所を補完: リクエストに location があればそれを優先。無ければ逆ジオコーディング。
+        # deferred では仮の値で保存し、住所はワーカーが後から埋める（外部サービスの応答を待たない）
         req_location = data.get("location")
+        location_pending = False
         if isinstance(req_location, str) and req_location.strip():
             data["location"] = req_location.strip()
+        elif POST_GEOCODE_MODE == "deferred":
+            data["location"] = LOCATION_PENDING
+            location_pending = True
         else:
             location = _reverse_geocode(data["latitude"], data["longitude"])
             data["location"] = location
@@ -207,6 +315,8 @@ def create_post():
         )
         if created is None:
             return jsonify({"error": "保存に失敗しました"}), 500
+        if location_pending:
+            location_worker.notify()
         return jsonify({"post": created}), 201
     except RuntimeError as e:
         return jsonify({"error": "DB初期化エラー", "detail": str(e)}), 503
@@ -214,11 +324,16 @@ def create_post():
 
 @post_bp.route("/api/posts/<uuid:post_id>", methods=["GET"])
 def get_post(post_id: uuid.UUID):
-    """post_id(UUID) で1件取得"""
+    """post_id(UUID) で1件取得（include=image で署名付きURL付きの画像を埋め込む）"""
     try:
-        post = PostService.get_post(post_id)
+        include_image = _parse_include(request.args.get("include"))
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
+    try:
+        post = PostService.get_post(post_id, include_image=include_image)
         if post is None:
             return jsonify({"error": "指定された投稿は存在しません"}), 404
+        _attach_images([post], include_image)
         return jsonify({"post": post}), 200
     except RuntimeError as e:
         return jsonify({"error": "DB初期化エラー", "detail": str(e)}), 503
@@ -226,7 +341,13 @@ def get_post(post_id: uuid.UUID):
 
 @post_bp.route("/api/posts", methods=["GET"])
 def list_posts():
-    """投稿一覧を取得（ページング対応）"""
+    """投稿一覧を取得（ページング対応: offset または cursor）"""
+    cursor = request.args.get("cursor") or None
+    try:
+        fields = PostService.parse_fields(request.args.get("fields"))
+        include_image = _parse_include(request.args.get("include"))
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
     try:
         limit = int(request.args.get("limit", "10"))
         offset = int(request.args.get("offset", "0"))
@@ -237,20 +358,39 @@ def list_posts():
     except ValueError:
         return _bad_request("limit / offset は整数で指定してください")
     try:
-        posts = PostService.list_posts(limit=limit, offset=offset)
-        return jsonify({"posts": posts, "limit": limit, "offset": offset}), 200
+        posts = PostService.list_posts(
+            limit=limit, offset=offset, cursor=cursor, fields=fields, include_image=include_image
+        )
+        _attach_images(posts, include_image)
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
     except RuntimeError as e:
         return jsonify({"error": "DB初期化エラー", "detail": str(e)}), 503
 
+    payload: Dict[str, Any] = {"posts": posts, "limit": limit, "next_cursor": PostService.next_cursor(posts, limit)}
+    if cursor is None:
+        payload["offset"] = offset
+    return jsonify(payload), 200
+
 
 @post_bp.route("/api/posts/recent", methods=["GET"])
 def list_recent_posts():
-    """現在時刻から15分前より前に作成された投稿一覧を取得"""
+    """現在時刻から15分前より前に作成された投稿一覧を取得（limit / cursor / since / fields / include 対応）"""
+    try:
+        limit, cursor, since, fields, include_image = _parse_recent_page_args(request.args)
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
+
     try:
         now = datetime.now(timezone.utc)
         cutoff = now - timedelta(minutes=15)
-        posts = PostService.list_posts_before(cutoff)
-        return jsonify({"posts": posts, "before": cutoff.isoformat(), "now": now.isoformat()}), 200
+        posts = PostService.list_posts_before(
+            cutoff, limit=limit, cursor=cursor, since=since, fields=fields, include_image=include_image
+        )
+        _attach_images(posts, include_image)
+        return jsonify(_recent_payload(posts, cutoff, now, limit, since)), 200
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
     except RuntimeError as e:
         return jsonify({"error": "DB初期化エラー", "detail": str(e)}), 503
 
@@ -258,7 +398,7 @@ def list_recent_posts():
 @post_bp.route("/api/posts/recent", methods=["POST"])
 def list_recent_posts_with_visibility():
     """現在時刻から15分前より前の投稿一覧を返す（POST、可視性フィルタ）
-    入力: { "user_id": "string" }
+    入力: { "user_id": "string", "limit": 100, "cursor": "...", "since": "ISO8601", "fields": "...", "include": "image" }
     - 他人の投稿: is_public=true のみ
     - 自分の投稿: 公開/非公開ともに含む
     """
@@ -269,16 +409,112 @@ def list_recent_posts_with_visibility():
     if not isinstance(current_user_id, str) or not current_user_id.strip():
         return _bad_request("user_id が空でない文字列を指定")
     current_user_id = current_user_id.strip()
+    try:
+        limit, cursor, since, fields, include_image = _parse_recent_page_args(data)
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
 
     try:
         now = datetime.now(timezone.utc)
         cutoff = now - timedelta(minutes=15)
-        posts = PostService.list_posts_before_with_visibility(cutoff, current_user_id=current_user_id)
-        return jsonify({"posts": posts, "before": cutoff.isoformat(), "now": now.isoformat()}), 200
+        posts = PostService.list_posts_before_with_visibility(
+            cutoff,
+            current_user_id=current_user_id,
+            limit=limit,
+            cursor=cursor,
+            since=since,
+            fields=fields,
+            include_image=include_image,
+        )
+        _attach_images(posts, include_image)
+        return jsonify(_recent_payload(posts, cutoff, now, limit, since)), 200
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
+    except RuntimeError as e:
+        return jsonify({"error": "DB初期化エラー", "detail": str(e)}), 503
+
+
+@post_bp.route("/api/posts/in_bbox", methods=["GET"])
+def list_posts_in_bbox():
+    """地図のビューポート（矩形）内の投稿一覧を取得
+    クエリ: min_lat, min_lng, max_lat, max_lng（必須）, user_id, limit, fields, include（任意）
+    - 可視性ルールは POST /api/posts/recent と同じ（user_id 未指定なら公開投稿のみ）
+    - min_lng > max_lng の場合は日付変更線をまたぐ矩形として扱う
+    """
+    try:
+        min_lat, min_lng, max_lat, max_lng = _parse_bbox_args(request.args)
+        fields = PostService.parse_fields(request.args.get("fields"))
+        include_image = _parse_include(request.args.get("include"))
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
+    try:
+        limit = int(request.args.get("limit", BBOX_DEFAULT_LIMIT))
+    except ValueError:
+        return _bad_request("limit は整数で指定してください")
+    if not (1 <= limit <= BBOX_MAX_LIMIT):
+        return _bad_request(f"limit は 1〜{BBOX_MAX_LIMIT} の範囲で指定してください")
+    current_user_id = (request.args.get("user_id") or "").strip() or None
+
+    try:
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(minutes=15)
+        posts = PostService.list_posts_in_bbox(
+            min_lat,
+            min_lng,
+            max_lat,
+            max_lng,
+            cutoff=cutoff,
+            current_user_id=current_user_id,
+            limit=limit,
+            fields=fields,
+            include_image=include_image,
+        )
+        _attach_images(posts, include_image)
+        return jsonify(
+            {
+                "posts": posts,
+                "bbox": {"min_lat": min_lat, "min_lng": min_lng, "max_lat": max_lat, "max_lng": max_lng},
+                "before": cutoff.isoformat(),
+                "now": now.isoformat(),
+                "limit": limit,
+            }
+        ), 200
     except RuntimeError as e:
         return jsonify({"error": "DB初期化エラー", "detail": str(e)}), 503
 
 
+@post_bp.route("/api/posts/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def get_post_tile(z: int, x: int, y: int):
+    """ズームアウト時の地図用に、タイル (z, x, y) 内の公開投稿をセル単位で集計して返す"""
+    key = (z, x, y)
+    cached = _tile_cache.get(key)
+    if cached is not None:
+        return jsonify(cached), 200
+
+    try:
+        west, south, east, north = PostService.tile_bounds(z, x, y)
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
+
+    try:
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(minutes=15)
+        cells = PostService.aggregate_tile(z, x, y, cutoff=cutoff)
+    except RuntimeError as e:
+        return jsonify({"error": "DB初期化エラー", "detail": str(e)}), 503
+
+    payload = {
+        "tile": {"z": z, "x": x, "y": y},
+        "bounds": {"west": west, "south": south, "east": east, "north": north},
+        "grid": TILE_GRID,
+        "cells": cells,
+        "total": sum(c["count"] for c in cells),
+        "before": cutoff.isoformat(),
+    }
+    _tile_cache.set(key, payload)
+    return jsonify(payload), 200
+
+
 @post_bp.route("/api/posts/<uuid:post_id>", methods=["DELETE"])
 def delete_post(post_id: uuid.UUID):
     """投稿を削除"""
@@ -335,6 +571,11 @@ def list_related_posts(post_id: uuid.UUID):
         limit = int(request.args.get("limit", "10"))
         if not 1 <= limit <= 20:
             return _bad_request("limitは1から20の間で指定してください")
+        try:
+            fields = PostService.parse_fields(request.args.get("fields"))
+            include_image = _parse_include(request.args.get("include"))
+        except ValueError as e:
+            return _bad_request("入力エラー", str(e))
 
         # 2. SearchServiceを呼び出して、類似した投稿の post_id リストを取得
         related_ids_str = SearchService.find_related_posts(post_id=post_id, num_results=limit)
@@ -348,31 +589,19 @@ def list_related_posts(post_id: uuid.UUID):
             # 類似投稿が見つからなかった場合、空のリストを返す
             return jsonify({"posts": []}), 200
 
-        # 3. 取得した post_id リストを元に、PostServiceを使って投稿を取得
-        related_posts = []
-        for i, post_id_str in enumerate(related_ids_str):
+        # 3. 取得した post_id リストを元に、PostServiceを使って投稿をまとめて取得（類似度順を保つ）
+        related_ids = []
+        for post_id_str in related_ids_str:
             try:
-                # 文字列の post_id をUUIDオブジェクトに変換
-                related_post_id = uuid.UUID(post_id_str)
-                # PostServiceを使って、DBから投稿の詳細を取得
-                # ----------------------------------------
-                # バグ: post_details が入力によらず固定のリストになる
-                # ----------------------------------------
-                post_details = PostService.get_post(related_post_id)
-
-                if post_details:
-                    related_posts.append(post_details)
-                else:
-                    print("  -> NOT FOUND in Database.")
-
-                # DBに投稿が存在する場合のみリストに追加
-                # (検索インデックスとDBの同期ラグで、IDはあっても実体がない場合があるため)
-                if post_details:
-                    related_posts.append(post_details)
-
+                related_ids.append(uuid.UUID(post_id_str))
             except (ValueError, TypeError):
                 print(f"WARN: Invalid UUID format returned from search service: {post_id_str}")
-                continue
+
+        # 検索インデックスとDBの同期ラグで、IDはあっても実体がない場合は結果から除かれる
+        related_posts = PostService.get_posts_by_ids(
+            related_ids, preserve_order=True, fields=fields, include_image=include_image
+        )
+        _attach_images(related_posts, include_image)
 
         # 4. 最終的な投稿オブジェクトのリストを返す
         return jsonify({"posts": related_posts}), 200
@@ -36,6 +36,11 @@ def search_posts_by_text():
     except ValueError:
         return _bad_request("limitは整数で指定してください")
 
+    try:
+        fields = PostService.parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return _bad_request("入力エラー", str(e))
+
     try:
         # 2. SearchServiceを呼び出して、関連する投稿のIDと基本情報を取得
         search_results = SearchService.search_by_text(search_query, num_results=limit)
@@ -45,24 +50,28 @@ def search_posts_by_text():
         if not search_results:
             return jsonify({"posts": []}), 200
 
-        # 3. 取得したIDを元に、PostServiceで完全な投稿オブジェクトを取得
-        posts = []
+        # 3. 取得したIDを元に、PostServiceで完全な投稿オブジェクトをまとめて取得（検索順位の順を保つ）
+        post_ids = []
         for result in search_results:
             post_id_str = result.get("id")
             if not post_id_str:
                 continue
-
             try:
-                post_id = uuid.UUID(hex=post_id_str)
-                post_details = PostService.get_post(post_id)
-                if post_details:
-                    posts.append(post_details)
+                post_ids.append(uuid.UUID(hex=post_id_str))
             except (ValueError, TypeError):
                 continue
 
+        posts = PostService.get_posts_by_ids(post_ids, preserve_order=True, fields=fields)
+
         return jsonify({"posts": posts}), 200
 
     except RuntimeError as e:
         return jsonify({"error": "サービス初期化エラー", "detail": str(e)}), 503
     except Exception as e:
         return jsonify({"error": "予期せぬエラーが発生しました", "detail": str(e)}), 500
+
+
+@search_bp.route("/api/search/metrics", methods=["GET"])
+def search_metrics():
+    """Vertex AI Search のクライアント作成・検索呼び出しのレイテンシと、検索結果キャッシュの統計（このプロセス分）"""
+    return jsonify({"latency": SearchService.latency_stats(), "cache": SearchService.search_cache_stats()}), 200
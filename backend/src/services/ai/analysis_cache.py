@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import copy
+import datetime
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import declarative_base
+from src.utils.cache import TTLCache
+from src.utils.config import CONFIG
+from src.utils.db.cloudsql import connect_db
+
+AnalysisResult = Dict[str, Any]
+
+# 共有バックエンド（SQL）のモデル。接続は使うときにだけ作る
+Base = declarative_base()
+
+
+class AnalysisCacheEntry(Base):
+    __tablename__ = "analysis_cache"
+    cache_key = sa.Column(sa.String(64), primary_key=True)
+    result = sa.Column(postgresql.JSONB, nullable=False)
+    expires_at = sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+    created_at = sa.Column(sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False)
+
+
+def make_key(image_bytes: bytes, prompt: str, model: str = CONFIG.GEMINI_MODEL) -> str:
+    """画像の SHA-256 とプロンプト（とモデル名）のハッシュからキャッシュキーを作る"""
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(image_bytes).digest())
+    h.update(hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).digest())
+    return h.hexdigest()
+
+
+def hour_bucket(local_time_iso: Optional[str]) -> Optional[str]:
+    """ISO 8601 の時刻を1時間単位に切り捨てる（キャッシュキー用。解釈できなければそのまま返す）"""
+    if not local_time_iso:
+        return local_time_iso
+    try:
+        t = datetime.datetime.fromisoformat(local_time_iso)
+    except ValueError:
+        return local_time_iso
+    return t.replace(minute=0, second=0, microsecond=0).isoformat()
+
+
+class MemoryAnalysisCache:
+    """プロセス内の LRU（TTL 付き）"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache: TTLCache[AnalysisResult] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str) -> Optional[AnalysisResult]:
+        return self._cache.get(key)
+
+    def set(self, key: str, result: AnalysisResult) -> None:
+        self._cache.set(key, result)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+class SqlAnalysisCache:
+    """
+    analysis_cache テーブル（sql/analysis_cache.sql）に保存し、インスタンス間で共有する
+    set PRUNE_EVERY 回ごとに期限切れの行と、maxsize を超えた古い行を削除する
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, session_factory: Any, maxsize: int, ttl: float):
+        self._session_factory = session_factory
+        self.maxsize = maxsize
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self._sets = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[AnalysisResult]:
+        with self._session_factory() as session:
+            return session.execute(
+                sa.select(AnalysisCacheEntry.result).where(
+                    AnalysisCacheEntry.cache_key == key, AnalysisCacheEntry.expires_at > sa.func.now()
+                )
+            ).scalar_one_or_none()
+
+    def set(self, key: str, result: AnalysisResult) -> None:
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + self.ttl
+        stmt = postgresql.insert(AnalysisCacheEntry).values(cache_key=key, result=result, expires_at=expires_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AnalysisCacheEntry.cache_key],
+            set_={"result": stmt.excluded.result, "expires_at": stmt.excluded.expires_at},
+        )
+        with self._session_factory() as session:
+            session.execute(stmt)
+            session.commit()
+
+        with self._lock:
+            self._sets += 1
+            prune = self._sets % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> None:
+        """期限切れの行と、有効期限の新しい順で maxsize 件を超えた行を削除する"""
+        keep = (
+            sa.select(AnalysisCacheEntry.cache_key).order_by(AnalysisCacheEntry.expires_at.desc()).limit(self.maxsize)
+        )
+        with self._session_factory() as session:
+            session.execute(
+                sa.delete(AnalysisCacheEntry).where(
+                    sa.or_(AnalysisCacheEntry.expires_at <= sa.func.now(), AnalysisCacheEntry.cache_key.not_in(keep))
+                )
+            )
+            session.commit()
+
+
+class AnalysisCache:
+    """
+    Gemini の解析結果のキャッシュ（キーは make_key）
+    バックエンドの障害はキャッシュミスとして扱い、解析自体は止めない
+    """
+
+    def __init__(self, backend: Any):
+        self.backend = backend
+
+    def get(self, key: str) -> Optional[AnalysisResult]:
+        if self.backend is None:
+            return None
+        try:
+            result = self.backend.get(key)
+        except Exception as e:
+            print(f"WARN: analysis cache lookup failed: {e}")
+            return None
+        # 呼び出し側が結果を書き換えてもキャッシュに影響しないようにコピーを返す
+        return copy.deepcopy(result) if result is not None else None
+
+    def set(self, key: str, result: AnalysisResult) -> None:
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, copy.deepcopy(result))
+        except Exception as e:
+            print(f"WARN: analysis cache store failed: {e}")
+
+
+def _make_backend(name: str) -> Any:
+    """ANALYSIS_CACHE_BACKEND（memory / sql / none）に応じたバックエンドを返す"""
+    if name == "none":
+        return None
+    if name == "sql":
+        _, session_factory, _, _ = connect_db()
+        if session_factory is not None:
+            return SqlAnalysisCache(
+                session_factory, CONFIG.ANALYSIS_CACHE_MAX_ENTRIES, CONFIG.ANALYSIS_CACHE_TTL_SECONDS
+            )
+        print("WARN: analysis cache database is not available -> fallback to memory")
+    elif name != "memory":
+        print(f"WARN: unsupported ANALYSIS_CACHE_BACKEND: {name} -> fallback to memory")
+    return MemoryAnalysisCache(CONFIG.ANALYSIS_CACHE_MAX_ENTRIES, CONFIG.ANALYSIS_CACHE_TTL_SECONDS)
+
+
+analysis_cache = AnalysisCache(_make_backend(CONFIG.ANALYSIS_CACHE_BACKEND))
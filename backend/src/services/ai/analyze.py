@@ -7,11 +7,11 @@ from typing import Any, Dict, Union
 from urllib.parse import unquote
 
 import magic
-from google import genai
-from google.cloud import storage
 from google.genai import types
 from PIL import Image
+from src.services.ai.analysis_cache import analysis_cache, hour_bucket, make_key
 from src.services.ai.gemini_client import gemini
+from src.utils.clients import genai_client, storage_client
 from src.utils.config import CONFIG
 from werkzeug.datastructures import FileStorage
 from werkzeug.exceptions import BadRequest
@@ -27,6 +27,7 @@ class AnalyzeService:
         user_question: str | None,
         location: str | None = None,
         local_time_iso: str | None = None,
+        image_bytes: bytes | None = None,
     ) -> Dict[str, Union[str, list[str]]]:
         """
         画像を解析してAIからの回答を返す
@@ -37,6 +38,7 @@ class AnalyzeService:
             user_question: 補助的な質問
             location: 位置情報
             local_time_iso: 現地時刻
+            image_bytes: 読み込み済みの画像データ（指定すると file / image_url より優先し、取得し直さない）
 
         Returns:
             {"object_label": str, "ai_answer": str, "ai_question": str, "grounding_urls": list[str]} の辞書
@@ -46,7 +48,9 @@ class AnalyzeService:
             TimeoutError: 画像取得のタイムアウト
         """
         # 1) 画像バイトの入手
-        if file is not None:
+        if image_bytes is not None:
+            raw = image_bytes
+        elif file is not None:
             raw = file.read()
         else:
             raw = AnalyzeService._fetch_image_bytes(image_url)
@@ -65,11 +69,24 @@ class AnalyzeService:
             user_question=user_question, location=location, local_time_iso=local_time_iso
         )
 
-        # 4) 画像サイズに応じてAPIを選択
+        # 4) 同じ画像・同じプロンプト（現地時刻は1時間単位に丸める）の解析結果があれば Gemini を呼ばずに返す
+        cache_key = make_key(
+            raw,
+            AnalyzeService._build_prompt(
+                user_question=user_question, location=location, local_time_iso=hour_bucket(local_time_iso)
+            ),
+        )
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # 5) 画像サイズに応じてAPIを選択
         if len(raw) <= CONFIG.INLINE_MAX_IMAGE_BYTES:
-            return AnalyzeService._gemini_request_by_base64(raw, prompt)
+            result = AnalyzeService._gemini_request_by_base64(raw, prompt)
         else:
-            return AnalyzeService._gemini_request_by_filesAPI(file, raw, prompt)
+            result = AnalyzeService._gemini_request_by_filesAPI(file, raw, prompt)
+        analysis_cache.set(cache_key, result)
+        return result
 
     @staticmethod
     def _fetch_image_bytes(url: str) -> bytes:
@@ -110,7 +127,7 @@ class AnalyzeService:
         if blob_name_norm.endswith("/"):
             raise BadRequest("GCSパスがフォルダを指しています（末尾/）。ファイル名まで指定してください。")
 
-        client = storage.Client(project=CONFIG.GCP_PROJECT_ID)
+        client = storage_client(CONFIG.GCP_PROJECT_ID)
         blob = client.bucket(bucket_name).blob(blob_name_norm)
 
         # ここでダウンロード → 例外で NotFound/権限なし等を拾える
@@ -280,7 +297,7 @@ class AnalyzeService:
         Returns:
             解析結果の辞書
         """
-        client = genai.Client()
+        client = genai_client()
         display_name = getattr(file, "filename", None) or "uploaded_image"
         # FileStorage が無い場合は sniff_mime で検出、フォールバックで image/jpeg
         detected_mime = AnalyzeService.sniff_mime(raw) if raw else None
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import declarative_base
+from src.utils.cache import TTLCache
+from src.utils.config import CONFIG
+from src.utils.db.cloudsql import connect_db
+from werkzeug.exceptions import HTTPException
+
+# 解析ジョブの本体: (ai_response, location) を返す
+AnalyzeTask = Callable[[], Tuple[Dict[str, Any], str | None]]
+
+# Gemini の呼び出し（グラウンディング付きで数秒〜十数秒かかる）を Flask のワーカーから切り離して実行するスレッドプール
+# ジョブは受け付けたプロセスで実行し、状態はジョブストアに書くのでどのプロセスからでも参照できる
+_job_executor = ThreadPoolExecutor(max_workers=CONFIG.ANALYZE_JOB_WORKERS, thread_name_prefix="analyze-job")
+
+FINISHED = ("succeeded", "failed")
+
+# 共有バックエンド（SQL）のモデル。接続は使うときにだけ作る
+Base = declarative_base()
+
+
+class AnalyzeJobRow(Base):
+    __tablename__ = "analyze_jobs"
+    job_id = sa.Column(sa.Uuid, primary_key=True)
+    img_id = sa.Column(sa.String(64), nullable=False)
+    status = sa.Column(sa.String(16), nullable=False)
+    ai_response = sa.Column(postgresql.JSONB)
+    location = sa.Column(sa.Text)
+    error = sa.Column(sa.Text)
+    error_status = sa.Column(sa.Integer)
+    created_at = sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+    finished_at = sa.Column(sa.TIMESTAMP(timezone=True))
+    expires_at = sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+@dataclass
+class AnalyzeJob:
+    """非同期の画像解析ジョブ（status: 'queued' → 'running' → 'succeeded' / 'failed'）"""
+
+    job_id: str
+    img_id: str
+    status: str = "queued"
+    ai_response: Dict[str, Any] | None = None
+    location: str | None = None
+    error: str | None = None
+    error_status: int | None = None  # 同期版の API なら返していた HTTP ステータス
+    created_at: datetime.datetime = field(default_factory=_utcnow)
+    finished_at: datetime.datetime | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = {
+            "job_id": self.job_id,
+            "img_id": self.img_id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if self.status == "succeeded":
+            d["ai_response"] = self.ai_response
+            d["location"] = self.location
+        elif self.status == "failed":
+            d["error"] = self.error
+            d["error_status"] = self.error_status
+        return d
+
+
+class MemoryJobStore:
+    """プロセス内の TTL 付き LRU（単一プロセスで動かす場合・DB が無い場合）"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._jobs: TTLCache[AnalyzeJob] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def save(self, job: AnalyzeJob) -> None:
+        # 保存した時点から TTL を数え直す。呼び出し側が書き換えても保存済みの状態は変わらないようにコピーする
+        self._jobs.set(job.job_id, dataclasses.replace(job))
+
+    def load(self, job_id: str) -> AnalyzeJob | None:
+        job = self._jobs.get(job_id)
+        return dataclasses.replace(job) if job is not None else None
+
+
+class SqlJobStore:
+    """
+    analyze_jobs テーブル（sql/analyze_jobs.sql）に保存し、全プロセス・全インスタンスから参照できるようにする
+    save PRUNE_EVERY 回ごとに期限切れの行を削除する
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, session_factory: Any, ttl: float):
+        self._session_factory = session_factory
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self._saves = 0
+        self._lock = threading.Lock()
+
+    def save(self, job: AnalyzeJob) -> None:
+        values = {
+            "job_id": uuid.UUID(job.job_id),
+            "img_id": job.img_id,
+            "status": job.status,
+            "ai_response": job.ai_response,
+            "location": job.location,
+            "error": job.error,
+            "error_status": job.error_status,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+            "expires_at": _utcnow() + self.ttl,
+        }
+        stmt = postgresql.insert(AnalyzeJobRow).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AnalyzeJobRow.job_id],
+            set_={k: stmt.excluded[k] for k in values if k not in ("job_id", "img_id", "created_at")},
+        )
+        with self._session_factory() as session:
+            session.execute(stmt)
+            session.commit()
+
+        with self._lock:
+            self._saves += 1
+            prune = self._saves % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def load(self, job_id: str) -> AnalyzeJob | None:
+        with self._session_factory() as session:
+            row = session.execute(
+                sa.select(AnalyzeJobRow).where(
+                    AnalyzeJobRow.job_id == uuid.UUID(job_id), AnalyzeJobRow.expires_at > sa.func.now()
+                )
+            ).scalar_one_or_none()
+        if row is None:
+            return None
+        return AnalyzeJob(
+            job_id=str(row.job_id),
+            img_id=row.img_id,
+            status=row.status,
+            ai_response=row.ai_response,
+            location=row.location,
+            error=row.error,
+            error_status=row.error_status,
+            created_at=row.created_at,
+            finished_at=row.finished_at,
+        )
+
+    def prune(self) -> None:
+        """期限切れの行を削除する"""
+        with self._session_factory() as session:
+            session.execute(sa.delete(AnalyzeJobRow).where(AnalyzeJobRow.expires_at <= sa.func.now()))
+            session.commit()
+
+
+def _make_store(name: str) -> Any:
+    """ANALYZE_JOB_BACKEND（sql / memory）に応じたジョブストアを返す"""
+    if name == "sql":
+        _, session_factory, _, _ = connect_db()
+        if session_factory is not None:
+            return SqlJobStore(session_factory, CONFIG.ANALYZE_JOB_TTL_SECONDS)
+        print("WARN: analyze job database is not available -> fallback to memory (jobs are per-process)")
+    elif name != "memory":
+        print(f"WARN: unsupported ANALYZE_JOB_BACKEND: {name} -> fallback to memory")
+    return MemoryJobStore(CONFIG.ANALYZE_JOB_MAX_ENTRIES, CONFIG.ANALYZE_JOB_TTL_SECONDS)
+
+
+_jobs = _make_store(CONFIG.ANALYZE_JOB_BACKEND)
+
+
+def poll_intervals() -> Iterator[float]:
+    """ストアを読み直す間隔: ANALYZE_JOB_POLL_SECONDS から倍々に伸ばし、ANALYZE_JOB_POLL_MAX_SECONDS で頭打ちにする"""
+    interval = CONFIG.ANALYZE_JOB_POLL_SECONDS
+    while True:
+        yield interval
+        interval = min(interval * 2, CONFIG.ANALYZE_JOB_POLL_MAX_SECONDS)
+
+
+class AnalyzeJobService:
+    """画像解析をバックグラウンドのスレッドプールで実行し、結果をジョブIDで参照できるようにするサービスクラス"""
+
+    @staticmethod
+    def submit(img_id: str, task: AnalyzeTask) -> AnalyzeJob:
+        """task をキューに積み、すぐに 'queued' のジョブを返す"""
+        job = AnalyzeJob(job_id=str(uuid.uuid4()), img_id=img_id)
+        _jobs.save(job)
+        _job_executor.submit(AnalyzeJobService._run, job, task)
+        # job はワーカーのスレッドが書き換えるので、呼び出し側には受け付けた時点のコピーを返す
+        return dataclasses.replace(job)
+
+    @staticmethod
+    def get(job_id: str) -> AnalyzeJob | None:
+        """ジョブを返す（存在しない・期限切れなら None）"""
+        return _jobs.load(job_id)
+
+    @staticmethod
+    def wait(job_id: str, timeout: float, backoff: Iterator[float] | None = None) -> AnalyzeJob | None:
+        """
+        ジョブの完了を最大 timeout 秒待ち、その時点のジョブを返す（完了したかは finished で判定する）
+        ジョブは別のプロセスで実行されていることがあるので、ストアを poll_intervals() の間隔で読み直す
+        何度も続けて待つ呼び出し側（SSE）は、同じ backoff を渡して間隔を引き継ぐ
+        """
+        if backoff is None:
+            backoff = poll_intervals()
+        deadline = time.monotonic() + timeout
+        while True:
+            job = _jobs.load(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job.finished or remaining <= 0:
+                return job
+            time.sleep(min(next(backoff), remaining))
+
+    @staticmethod
+    def _run(job: AnalyzeJob, task: AnalyzeTask) -> None:
+        job.status = "running"
+        try:
+            _jobs.save(job)
+            job.ai_response, job.location = task()
+            job.status = "succeeded"
+        except Exception as e:
+            # 同期版の /api/image_analyze と同じ対応でステータスを決める
+            if isinstance(e, HTTPException):
+                job.error, job.error_status = str(e), e.code
+            elif isinstance(e, TimeoutError):
+                job.error, job.error_status = str(e), 504
+            else:
+                job.error, job.error_status = f"upstream error: {e}", 502
+            job.status = "failed"
+            print(f"ERROR: analyze job failed (job_id: {job.job_id}): {e}")
+        finally:
+            job.finished_at = _utcnow()
+            # 完了時点から TTL を数え直す
+            try:
+                _jobs.save(job)
+            except Exception as e:
+                print(f"ERROR: failed to store analyze job result (job_id: {job.job_id}): {e}")
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from google import genai
 from google.genai import types
+from src.utils.clients import genai_client
 from src.utils.config import CONFIG
 from werkzeug.datastructures import FileStorage
 
@@ -14,7 +14,7 @@ class GeminiClient:
         if not api_key:
             raise ValueError("GEMINI_API_KEYが設定されていません")
 
-        self._client = genai.Client(api_key=api_key)
+        self._client = genai_client(api_key)
         self._model_name = model_name
 
         # --- 構造化出力（JSON強制）の設定を試みる ---
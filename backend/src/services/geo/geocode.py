@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import csv
+import datetime
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+from geopy.geocoders import Nominatim
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import declarative_base
+from src.utils.cache import TTLCache
+from src.utils.clients import shared
+from src.utils.config import CONFIG
+from src.utils.db.cloudsql import connect_db
+
+# 1度あたりの緯度方向の距離（m）
+_METERS_PER_DEGREE = 111_320.0
+# 「住所なし」（海上など）をキャッシュするときの値（TTLCache の未登録と区別する）
+_NO_ADDRESS = ""
+
+# 住所の問い合わせ: (lat, lon) -> 住所（見つからなければ None）
+Lookup = Callable[[float, float], Optional[str]]
+
+# 共有キャッシュ（SQL）のモデル。接続は使うときにだけ作る
+Base = declarative_base()
+
+
+class GeocodeCacheEntry(Base):
+    __tablename__ = "geocode_cache"
+    cell_key = sa.Column(sa.Text, primary_key=True)
+    address = sa.Column(sa.Text, nullable=False)  # 住所なしは空文字
+    expires_at = sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+    created_at = sa.Column(sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False)
+
+
+class GeocodeRateLimit(Base):
+    __tablename__ = "geocode_rate_limit"
+    name = sa.Column(sa.Text, primary_key=True)
+    last_call_at = sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+
+
+def cell_of(lat: float, lon: float, cell_meters: float) -> Tuple[str, float, float]:
+    """
+    緯度経度を一辺 cell_meters のグリッドに丸め、(セルのキー, セル中心の緯度, 経度) を返す
+    経度方向の幅はセルの緯度での cos で補正する（同じセルの点は同じ住所として扱う）
+    """
+    lat_step = cell_meters / _METERS_PER_DEGREE
+    i = math.floor(lat / lat_step)
+    center_lat = (i + 0.5) * lat_step
+    lon_step = lat_step / max(math.cos(math.radians(center_lat)), 1e-6)
+    j = math.floor(lon / lon_step)
+    return f"{cell_meters:g}:{i}:{j}", center_lat, (j + 0.5) * lon_step
+
+
+def distance_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """2点間の大円距離（m）"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6_371_000 * math.asin(math.sqrt(a))
+
+
+class Gazetteer:
+    """
+    ローカルの地名辞書（CSV: latitude,longitude,address のヘッダ付き）から最寄りの住所を引く
+    max_distance_meters 以内に地点が無ければ None
+    """
+
+    def __init__(self, places: List[Tuple[float, float, str]], max_distance_meters: float):
+        self.max_distance_meters = max_distance_meters
+        self._bucket_deg = max(max_distance_meters, 1.0) / _METERS_PER_DEGREE
+        self._buckets: Dict[Tuple[int, int], List[Tuple[float, float, str]]] = {}
+        for place in places:
+            self._buckets.setdefault(self._bucket(place[0], place[1]), []).append(place)
+
+    @classmethod
+    def load(cls, path: str, max_distance_meters: float) -> "Gazetteer":
+        with open(path, newline="", encoding="utf-8") as f:
+            places = [(float(r["latitude"]), float(r["longitude"]), r["address"]) for r in csv.DictReader(f)]
+        print(f"INFO: loaded {len(places)} places from gazetteer {path}")
+        return cls(places, max_distance_meters)
+
+    def _bucket(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self._bucket_deg), math.floor(lon / self._bucket_deg)
+
+    def lookup(self, lat: float, lon: float) -> Optional[str]:
+        bi, bj = self._bucket(lat, lon)
+        # 経度方向は高緯度ほどバケットが狭くなるので、その分だけ広く探す
+        lon_span = math.ceil(1 / max(math.cos(math.radians(lat)), 1e-6))
+        best: Optional[Tuple[float, str]] = None
+        for di in (-1, 0, 1):
+            for dj in range(-lon_span, lon_span + 1):
+                for plat, plon, address in self._buckets.get((bi + di, bj + dj), ()):
+                    d = distance_meters(lat, lon, plat, plon)
+                    if d <= self.max_distance_meters and (best is None or d < best[0]):
+                        best = (d, address)
+        return best[1] if best else None
+
+
+class SqlGeocodeStore:
+    """geocode_cache テーブル（sql/geocode_cache.sql）に住所を保存し、インスタンス間で共有する"""
+
+    def __init__(self, session_factory: Any, ttl: float):
+        self._session_factory = session_factory
+        self.ttl = datetime.timedelta(seconds=ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._session_factory() as session:
+            return session.execute(
+                sa.select(GeocodeCacheEntry.address).where(
+                    GeocodeCacheEntry.cell_key == key, GeocodeCacheEntry.expires_at > sa.func.now()
+                )
+            ).scalar_one_or_none()
+
+    def set(self, key: str, address: str) -> None:
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + self.ttl
+        stmt = postgresql.insert(GeocodeCacheEntry).values(cell_key=key, address=address, expires_at=expires_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[GeocodeCacheEntry.cell_key],
+            set_={"address": stmt.excluded.address, "expires_at": stmt.excluded.expires_at},
+        )
+        with self._session_factory() as session:
+            session.execute(stmt)
+            session.commit()
+
+
+class SqlRateLimit:
+    """
+    geocode_rate_limit テーブル（sql/geocode_cache.sql）の1行に最後の問い合わせ時刻を記録し、
+    全プロセス・全インスタンス合わせて min_interval 秒に1回までに抑える
+    「前回から min_interval 秒たっていれば時刻を更新する」UPDATE の成否で枠を取り合うので、ロックを持ったまま待つことはない
+    """
+
+    def __init__(
+        self,
+        session_factory: Any,
+        name: str,
+        min_interval: float,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._session_factory = session_factory
+        self.name = name
+        self.interval = datetime.timedelta(seconds=min_interval)
+        self._sleep = sleep
+        self._clock = clock
+
+    def _try_claim(self) -> Optional[float]:
+        """枠が取れたら None、取れなければ次の枠までの秒数を返す"""
+        table = GeocodeRateLimit.__table__
+        now = sa.func.clock_timestamp()
+        interval = sa.literal(self.interval, sa.Interval())
+        with self._session_factory() as session:
+            claimed = session.execute(
+                sa.update(table)
+                .where(table.c.name == self.name, table.c.last_call_at <= now - interval)
+                .values(last_call_at=now)
+                .returning(table.c.name)
+            ).first()
+            if claimed is None:
+                remaining = session.execute(
+                    sa.select(sa.func.extract("epoch", table.c.last_call_at + interval - now)).where(
+                        table.c.name == self.name
+                    )
+                ).scalar_one_or_none()
+                if remaining is None:
+                    # 初回は行を作ってから取り合う
+                    session.execute(
+                        postgresql.insert(table)
+                        .values(name=self.name, last_call_at=now - interval)
+                        .on_conflict_do_nothing(index_elements=[table.c.name])
+                    )
+                    remaining = 0.0
+            session.commit()
+        return None if claimed is not None else max(float(remaining), 0.0)
+
+    def wait(self, deadline: Optional[float] = None) -> bool:
+        """
+        次の枠が取れるまで待ち、取れたら True を返す
+        deadline（clock の時刻）までに取れそうにないときは、待たずに False を返す
+        """
+        while True:
+            remaining = self._try_claim()
+            if remaining is None:
+                return True
+            delay = max(remaining, 0.01)
+            if deadline is not None and self._clock() + delay > deadline:
+                return False
+            self._sleep(delay)
+
+
+class RateLimitedNominatim:
+    """
+    共有の Nominatim で逆ジオコーディングする（利用規約に合わせ、min_interval 秒に1回まで）
+    shared_limit（SqlRateLimit）があれば全プロセスで、無ければこのプロセスの中だけで間隔を守る
+    枠を待つのは1回の問い合わせにつき max_wait 秒まで。それ以上かかるなら TimeoutError にする
+    （同期のリクエストを gunicorn の timeout まで止めないため。ReverseGeocoder は失敗として扱い、キャッシュしない）
+    """
+
+    def __init__(
+        self,
+        user_agent: str,
+        timeout: float,
+        min_interval: float,
+        language: str = "ja",
+        shared_limit: Any = None,
+        max_wait: float = 5.0,
+    ):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.language = language
+        self.shared_limit = shared_limit
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def _wait_local_slot(self, deadline: float) -> None:
+        """このプロセス内の次の枠をロックの中で予約し、枠の時刻まではロックの外で待つ"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._last_request + self.min_interval)
+            if slot > deadline:
+                raise TimeoutError(f"geocode rate limit: no slot within {self.max_wait}s")
+            self._last_request = slot
+        if slot > now:
+            time.sleep(slot - now)
+
+    def __call__(self, lat: float, lon: float) -> Optional[str]:
+        geolocator = shared(("nominatim", self.user_agent), lambda: Nominatim(user_agent=self.user_agent))
+        deadline = time.monotonic() + self.max_wait
+        self._wait_local_slot(deadline)
+        if self.shared_limit is not None:
+            try:
+                acquired = self.shared_limit.wait(deadline)
+            except Exception as e:
+                # DB の障害時はこのプロセス内の間隔だけを守って問い合わせる
+                print(f"WARN: shared geocode rate limit is unavailable: {e}")
+                acquired = True
+            if not acquired:
+                raise TimeoutError(f"geocode rate limit: no shared slot within {self.max_wait}s")
+        loc = geolocator.reverse((lat, lon), language=self.language, timeout=self.timeout)
+        return loc.address if loc else None
+
+
+class ReverseGeocoder:
+    """
+    緯度経度を日本語住所に変換する（グリッドのセル単位でキャッシュ）
+    プロセス内 LRU → 共有ストア（SQL、任意）→ lookup（Nominatim またはローカルの地名辞書）の順に引き、
+    同じセルへの同時の問い合わせは1回にまとめる。lookup の失敗はキャッシュせず None を返す。
+    """
+
+    def __init__(self, lookup: Lookup, cell_meters: float, memory: TTLCache[str], store: Any = None):
+        self.lookup = lookup
+        self.cell_meters = cell_meters
+        self.memory = memory
+        self.store = store
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        """住所を返す（見つからない・取得に失敗したら None）。範囲外の緯度経度は ValueError"""
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise ValueError("緯度経度は数値で指定してください")
+        if not (-90.0 <= lat <= 90.0) or not (-180.0 <= lon <= 180.0):
+            raise ValueError("緯度経度が範囲外です")
+        key, center_lat, center_lon = cell_of(lat, lon, self.cell_meters)
+
+        cached = self.memory.get(key)
+        if cached is not None:
+            return cached or None
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+
+        address: Optional[str] = None
+        try:
+            address = self._resolve(key, center_lat, center_lon)
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            future.set_result(address)
+        return address
+
+    def _resolve(self, key: str, lat: float, lon: float) -> Optional[str]:
+        if self.store is not None:
+            try:
+                stored = self.store.get(key)
+            except Exception as e:
+                print(f"WARN: geocode store lookup failed: {e}")
+                stored = None
+            if stored is not None:
+                self.memory.set(key, stored)
+                return stored or None
+
+        try:
+            address = self.lookup(lat, lon)
+        except Exception as e:
+            print(f"WARN: reverse geocoding failed ({lat:.5f}, {lon:.5f}): {e}")
+            return None
+
+        value = address or _NO_ADDRESS
+        self.memory.set(key, value)
+        if self.store is not None:
+            try:
+                self.store.set(key, value)
+            except Exception as e:
+                print(f"WARN: geocode store update failed: {e}")
+        return address
+
+    @classmethod
+    def from_config(cls) -> "ReverseGeocoder":
+        session_factory = None
+        if CONFIG.GEOCODE_CACHE_BACKEND == "sql" or CONFIG.GEOCODE_RATE_LIMIT_BACKEND == "sql":
+            _, session_factory, _, _ = connect_db()
+
+        lookup = _make_lookup(CONFIG.GEOCODE_MODE, session_factory)
+        store = None
+        if CONFIG.GEOCODE_CACHE_BACKEND == "sql":
+            if session_factory is not None:
+                store = SqlGeocodeStore(session_factory, CONFIG.GEOCODE_CACHE_TTL_SECONDS)
+            else:
+                print("WARN: geocode cache database is not available -> memory only")
+
+        memory: TTLCache[str] = TTLCache(maxsize=CONFIG.GEOCODE_CACHE_MAX_ENTRIES, ttl=CONFIG.GEOCODE_CACHE_TTL_SECONDS)
+        return cls(lookup, CONFIG.GEOCODE_CELL_METERS, memory, store)
+
+
+def _make_shared_limit(session_factory: Any) -> Optional[SqlRateLimit]:
+    """GEOCODE_RATE_LIMIT_BACKEND（sql / process）に応じた、プロセスをまたぐ間隔制御を返す（process なら None）"""
+    backend = CONFIG.GEOCODE_RATE_LIMIT_BACKEND
+    if backend == "process":
+        return None
+    if backend != "sql":
+        print(f"WARN: unsupported GEOCODE_RATE_LIMIT_BACKEND: {backend} -> fallback to sql")
+    if session_factory is None:
+        print("WARN: geocode rate limit database is not available -> per-process limit only")
+        return None
+    return SqlRateLimit(session_factory, "nominatim", CONFIG.GEOCODE_MIN_INTERVAL_SECONDS)
+
+
+def _make_lookup(mode: str, session_factory: Any = None) -> Lookup:
+    """GEOCODE_MODE（online / offline）に応じた住所の問い合わせ先を返す"""
+    if mode == "offline":
+        # オフラインではネットワークに出ない（地名辞書を読めなければ常に None）
+        try:
+            return Gazetteer.load(CONFIG.GEOCODE_GAZETTEER_PATH, CONFIG.GEOCODE_GAZETTEER_MAX_DISTANCE_METERS).lookup
+        except Exception as e:
+            print(f"ERROR: failed to load gazetteer {CONFIG.GEOCODE_GAZETTEER_PATH!r}: {e}")
+            return lambda _lat, _lon: None
+    if mode != "online":
+        print(f"WARN: unsupported GEOCODE_MODE: {mode} -> fallback to online")
+    return RateLimitedNominatim(
+        CONFIG.GEOCODE_USER_AGENT,
+        CONFIG.GEOCODE_TIMEOUT_SECONDS,
+        CONFIG.GEOCODE_MIN_INTERVAL_SECONDS,
+        shared_limit=_make_shared_limit(session_factory),
+        max_wait=CONFIG.GEOCODE_MAX_WAIT_SECONDS,
+    )
+
+
+geocoder = ReverseGeocoder.from_config()
@@ -1,19 +1,30 @@
 import datetime
 import hashlib
+import io
 import json
+import math
 import mimetypes
 import os
+import re
+import tempfile
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Optional
+from types import SimpleNamespace
+from typing import IO, Any, Dict, List, Optional, Sequence, Tuple
 
 import google.auth
+import magic
 import sqlalchemy as sa
 from google.auth import iam
 from google.auth.transport.requests import Request
-from google.cloud import storage
 from google.oauth2 import service_account
+from PIL import Image as PILImage
+from PIL import ImageOps
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import declarative_base
+from src.utils.cache import TTLCache
+from src.utils.clients import storage_client
 from src.utils.db.cloudsql import connect_db, disconnect_db
 
 # --- DB接続初期化 ---
@@ -30,7 +41,7 @@ try:
         raise ValueError("GCS_BUCKET environment variable is not set.")
     if not GCP_PROJECT:
         raise ValueError("GCP_PROJECT environment variable is not set.")
-    adc_storage_client = storage.Client(project=GCP_PROJECT)
+    adc_storage_client = storage_client(GCP_PROJECT)
     adc_bucket = adc_storage_client.bucket(GCS_BUCKET)
 except Exception as e:
     print(f"ERROR: Failed to initialize ADC GCS client: {e}")
@@ -89,6 +100,67 @@ def _load_signer_credentials():
 # 署名用クレデンシャルを1本用意（開発=鍵 / 本番=ADC+IAM サイナー）
 signer_credentials = _load_signer_credentials()
 
+# 署名付きURLの有効期間
+SIGNED_URL_TTL = datetime.timedelta(minutes=15)
+# 一括取得時の署名の並列数（IAM SignBlob はリモート呼び出しのため並列化する）
+SIGN_MAX_WORKERS = int(os.environ.get("SIGN_MAX_WORKERS", "8"))
+_sign_executor = ThreadPoolExecutor(max_workers=SIGN_MAX_WORKERS, thread_name_prefix="gcs-sign")
+
+# 署名付きURLのキャッシュ: (object_name, method) -> URL
+# 失効直前のURLを返さないよう、有効期限の SIGNED_URL_SAFETY_MARGIN 秒前までだけ再利用する
+SIGNED_URL_SAFETY_MARGIN = datetime.timedelta(seconds=int(os.environ.get("SIGNED_URL_SAFETY_MARGIN", "120")))
+SIGNED_URL_CACHE_MAX = int(os.environ.get("SIGNED_URL_CACHE_MAX", "4096"))
+_signed_url_cache: TTLCache[str] = TTLCache(
+    maxsize=SIGNED_URL_CACHE_MAX,
+    ttl=max(0.0, (SIGNED_URL_TTL - SIGNED_URL_SAFETY_MARGIN).total_seconds()),
+)
+
+
+# サムネイル等のレンディション（長辺 px）。アップロード時に元画像から生成し、元画像より大きいサイズは作らない
+RENDITION_SIZES: Tuple[int, ...] = tuple(
+    sorted(int(s) for s in os.environ.get("IMAGE_RENDITION_SIZES", "128,512,1600").split(",") if s.strip())
+)
+RENDITION_FORMAT = os.environ.get("IMAGE_RENDITION_FORMAT", "WEBP").upper()
+RENDITION_QUALITY = int(os.environ.get("IMAGE_RENDITION_QUALITY", "80"))
+RENDITION_MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+if RENDITION_FORMAT not in RENDITION_MIME_TYPES:
+    print(f"WARN: unsupported IMAGE_RENDITION_FORMAT: {RENDITION_FORMAT} -> fallback to WEBP")
+    RENDITION_FORMAT = "WEBP"
+
+# レンディション生成でデコードする画像の画素数の上限（超える画像は Pillow が DecompressionBombError にする）
+PILImage.MAX_IMAGE_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(50_000_000)))
+
+
+# 同じ内容（sha256_hex, size_bytes）の保存済み画像があれば、アップロードせずにその画像を参照カウント付きで共有する
+IMAGE_DEDUP_ENABLED = os.environ.get("IMAGE_DEDUP_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+
+# save_image / save_image_stream の保存方式
+# - "upload_first": GCS へアップロードしてから 'stored' の行を1回のコミットで作る（既定）
+#   途中で落ちても残るのは行の無いオブジェクトだけで、reap_images の孤立オブジェクト掃除で消える
+# - "pending": 先に 'pending' の行をコミットしてからアップロードし、'stored' に更新する（失敗時は 'failed' にする）
+IMAGE_SAVE_MODES = ("upload_first", "pending")
+IMAGE_SAVE_MODE = os.environ.get("IMAGE_SAVE_MODE", "upload_first").strip().lower()
+if IMAGE_SAVE_MODE not in IMAGE_SAVE_MODES:
+    print(f"WARN: unsupported IMAGE_SAVE_MODE: {IMAGE_SAVE_MODE} -> fallback to upload_first")
+    IMAGE_SAVE_MODE = "upload_first"
+
+
+# ストリーミングアップロードのチャンクサイズ（GCS の再開可能アップロードの制約で 256KiB の倍数に切り上げる）
+_GCS_CHUNK_ALIGN = 256 * 1024
+UPLOAD_CHUNK_SIZE = max(1, math.ceil(int(os.environ.get("IMAGE_UPLOAD_CHUNK_SIZE", "1048576")) / _GCS_CHUNK_ALIGN))
+UPLOAD_CHUNK_SIZE *= _GCS_CHUNK_ALIGN
+
+
+# 署名付き PUT URL による直接アップロードで受け付ける最大サイズ
+DIRECT_UPLOAD_MAX_BYTES = int(os.environ.get("DIRECT_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+_SHA256_HEX_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+
+def _signs_locally(credentials: Any) -> bool:
+    """秘密鍵を持っていてローカルで署名できるなら True（IAM サイナーならリモート呼び出し）"""
+    return not isinstance(getattr(credentials, "signer", None), iam.Signer)
+
 
 # モデル定義だけは可能にしておく（DB接続失敗時のクラッシュ防止）
 if Base is object:
@@ -103,6 +175,7 @@ class Image(Base):
     size_bytes = sa.Column(sa.BigInteger, nullable=False)
     sha256_hex = sa.Column(sa.String(64), nullable=False)
     status = sa.Column(sa.Text, nullable=False)  # 'pending', 'stored', 'failed'
+    ref_count = sa.Column(sa.Integer, nullable=False, default=1, server_default="1")  # 共有している参照（投稿）の数
     created_at = sa.Column(sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False)
     updated_at = sa.Column(
         sa.TIMESTAMP(timezone=True),
@@ -112,6 +185,30 @@ class Image(Base):
     )
 
 
+class ImageRendition(Base):
+    __tablename__ = "image_renditions"
+    img_id = sa.Column(sa.Uuid, sa.ForeignKey("images.img_id", ondelete="CASCADE"), primary_key=True)
+    size = sa.Column(sa.Integer, primary_key=True)  # 長辺の px（RENDITION_SIZES のいずれか）
+    gcs_uri = sa.Column(sa.Text, nullable=False)
+    mime_type = sa.Column(sa.Text, nullable=False)
+    width = sa.Column(sa.Integer, nullable=False)
+    height = sa.Column(sa.Integer, nullable=False)
+    size_bytes = sa.Column(sa.BigInteger, nullable=False)
+    created_at = sa.Column(sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False)
+
+
+# 一括取得で SELECT する列（署名付きURLの生成とレスポンスに必要なもののみ）
+IMAGE_COLUMNS = (Image.img_id, Image.gcs_uri, Image.mime_type, Image.size_bytes, Image.status, Image.created_at)
+# size 指定の一括取得で外部結合するレンディションの列
+RENDITION_COLUMNS = (
+    ImageRendition.gcs_uri.label("rendition_gcs_uri"),
+    ImageRendition.mime_type.label("rendition_mime_type"),
+    ImageRendition.width.label("rendition_width"),
+    ImageRendition.height.label("rendition_height"),
+    ImageRendition.size_bytes.label("rendition_size_bytes"),
+)
+
+
 class ImageService:
     """Image を GCS と Cloud SQL に保存・取得・削除するサービスクラス"""
 
@@ -125,8 +222,13 @@ class ImageService:
     def save_image(
         file_data: bytes,
         mime_type: str,
+        dedup: Optional[bool] = None,
     ) -> Optional[Dict[str, Any]]:
-        """新しい Image をGCSとDBに保存し、作成結果を返す。"""
+        """
+        新しい Image をGCSとDBに保存し、作成結果を返す。
+        dedup（未指定なら IMAGE_DEDUP_ENABLED）が有効で同じ内容の保存済み画像があれば、
+        アップロードせずにその画像の参照カウントを増やして返す（"deduplicated": true）。
+        """
         if SessionLocal is None or adc_bucket is None:
             raise RuntimeError("Database or GCS is not initialized")
 
@@ -138,8 +240,21 @@ class ImageService:
         gcs_uri = f"gs://{GCS_BUCKET}/{object_name}"
 
         with SessionLocal() as session:
+            if IMAGE_DEDUP_ENABLED if dedup is None else dedup:
+                try:
+                    existing = ImageService._find_duplicate(session, sha256_hex, size_bytes)
+                    if existing is not None:
+                        # 行ロック中なので、同時に走る delete_image と参照カウントが食い違うことはない
+                        existing.ref_count += 1
+                        renditions = ImageService._rendition_sizes(session, existing.img_id)
+                        session.commit()
+                        return ImageService._saved(existing, renditions, deduplicated=True)
+                except Exception as e:
+                    session.rollback()
+                    print(f"WARN: image dedup lookup failed (sha256: {sha256_hex}): {e} -> upload as new image")
+
+            persisted = IMAGE_SAVE_MODE == "pending"
             try:
-                # 1. DBに 'pending' でレコードを先行して作成
                 image = Image(
                     img_id=img_id,
                     gcs_uri=gcs_uri,
@@ -148,43 +263,417 @@ class ImageService:
                     sha256_hex=sha256_hex,
                     status="pending",
                 )
-                session.add(image)
-                session.commit()
+                if persisted:
+                    # 1. DBに 'pending' でレコードを先行して作成
+                    session.add(image)
+                    session.commit()
 
                 # 2. GCSへファイルをアップロード
                 blob = adc_bucket.blob(object_name)
                 blob.upload_from_string(file_data, content_type=mime_type)
 
-                # 3. DBのステータスを 'stored' に更新
-                image.status = "stored"
-                session.commit()
-                session.refresh(image)
+                # 3. サムネイル等のレンディションを生成してGCSへアップロード（失敗しても元画像の保存は続行）
+                renditions = ImageService._store_renditions(img_id, file_data)
 
-                return {
-                    "img_id": str(image.img_id),
-                    "gcs_uri": image.gcs_uri,
-                    "status": image.status,
-                    "created_at": image.created_at.isoformat(),
-                }
+                # 4. 'stored' で確定（upload_first ではここで初めて行を作る）
+                ImageService._commit_stored(session, image, renditions, persisted)
+                return ImageService._saved(image, [r.size for r in renditions], deduplicated=False)
 
             except Exception as e:
                 session.rollback()
                 print(f"ERROR: failed to upload image (id: {img_id}): {e}")
-                # 失敗したことをDBに記録するため、ステータスを 'failed' に更新
+                ImageService._abandon(img_id, object_name, persisted)
+                return None
+
+    @staticmethod
+    def save_image_stream(
+        stream: IO[bytes],
+        mime_type: Optional[str] = None,
+        dedup: Optional[bool] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        アップロードされたファイルのストリーム（Werkzeug の FileStorage.stream 等）を UPLOAD_CHUNK_SIZE ずつ読みながら、
+        SHA-256 の計算と GCS への再開可能アップロードを同時に行って保存する。ファイル全体をメモリに載せない。
+        - MIME は先頭チャンクから判定する（画像でなければ ValueError。mime_type は判定できない場合の申告値）
+        - 重複排除はハッシュが確定するアップロード後に判定し、既存の画像があればアップロードしたオブジェクトを消して共有する
+        - レンディションはディスクに退避した元画像から生成する
+        """
+        if SessionLocal is None or adc_bucket is None:
+            raise RuntimeError("Database or GCS is not initialized")
+
+        first = stream.read(UPLOAD_CHUNK_SIZE)
+        if not first:
+            raise ValueError("空の画像データです")
+        sniffed = magic.from_buffer(first[:2048], mime=True) or mime_type or "application/octet-stream"
+        if not sniffed.startswith("image/"):
+            raise ValueError(f"画像ファイルではありません（{sniffed}）")
+        mime_type = sniffed
+
+        img_id = uuid.uuid4()
+        ext = ImageService._guess_ext(mime_type)
+        object_name = f"images/{img_id}{ext}"
+        gcs_uri = f"gs://{GCS_BUCKET}/{object_name}"
+
+        persisted = IMAGE_SAVE_MODE == "pending"
+        with SessionLocal() as session, tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE) as spool:
+            try:
+                # サイズとハッシュはアップロード後に確定する
+                image = Image(
+                    img_id=img_id,
+                    gcs_uri=gcs_uri,
+                    mime_type=mime_type,
+                    size_bytes=0,
+                    sha256_hex="",
+                    status="pending",
+                )
+                if persisted:
+                    # 1. DBに 'pending' でレコードを先行して作成
+                    session.add(image)
+                    session.commit()
+
+                # 2. チャンクごとにハッシュ計算・GCSへの再開可能アップロード・レンディション用の退避を行う
+                hasher = hashlib.sha256()
+                size_bytes = 0
+                blob = adc_bucket.blob(object_name)
+                with blob.open("wb", chunk_size=UPLOAD_CHUNK_SIZE, content_type=mime_type) as writer:
+                    chunk = first
+                    while chunk:
+                        hasher.update(chunk)
+                        size_bytes += len(chunk)
+                        writer.write(chunk)
+                        spool.write(chunk)
+                        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+
+                # 3. 重複排除・レンディション生成を行い 'stored' にする
+                return ImageService._complete_upload(
+                    session, image, blob, hasher.hexdigest(), size_bytes, spool, dedup, persisted
+                )
+
+            except Exception as e:
+                session.rollback()
+                print(f"ERROR: failed to upload image (id: {img_id}): {e}")
+                ImageService._abandon(img_id, object_name, persisted)
+                return None
+
+    @staticmethod
+    def _complete_upload(
+        session: Any,
+        image: "Image",
+        blob: Any,
+        sha256_hex: str,
+        size_bytes: int,
+        spool: IO[bytes],
+        dedup: Optional[bool],
+        persisted: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        GCS へのアップロードが済んだ 'pending' の Image を確定させる（save_image_stream / finalize_upload 共通）
+        - 同じ内容の保存済み画像があればそちらの参照カウントを増やし、アップロード済みのオブジェクトと仮レコードは破棄する
+        - なければ spool（元画像）からレンディションを生成し、サイズ・ハッシュを確定して 'stored' にする
+        persisted=False なら image はまだ INSERT されていない（upload_first）
+        """
+        if IMAGE_DEDUP_ENABLED if dedup is None else dedup:
+            existing = ImageService._find_duplicate(session, sha256_hex, size_bytes)
+            if existing is not None:
+                existing.ref_count += 1
+                renditions = ImageService._rendition_sizes(session, existing.img_id)
+                if persisted:
+                    session.delete(image)
+                session.commit()
                 try:
-                    with SessionLocal() as failed_session:
-                        failed_image = failed_session.get(Image, img_id)
-                        if failed_image:
-                            failed_image.status = "failed"
-                            failed_session.commit()
-                except Exception as update_err:
-                    print(f"ERROR: failed to update image status to 'failed': {update_err}")
+                    blob.delete()
+                except Exception as gcs_err:
+                    print(f"WARN: Failed to delete duplicate GCS object {image.gcs_uri}: {gcs_err}")
+                return ImageService._saved(existing, renditions, deduplicated=True)
+
+        # サムネイル等のレンディションを生成してGCSへアップロード（失敗しても元画像の保存は続行）
+        spool.seek(0)
+        rendition_rows = ImageService._store_renditions(image.img_id, spool)
+
+        image.size_bytes = size_bytes
+        image.sha256_hex = sha256_hex
+        ImageService._commit_stored(session, image, rendition_rows, persisted)
+        return ImageService._saved(image, [r.size for r in rendition_rows], deduplicated=False)
+
+    @staticmethod
+    def _commit_stored(session: Any, image: "Image", renditions: List["ImageRendition"], persisted: bool) -> None:
+        """
+        Image を 'stored' にしてレンディションと一緒に1回のコミットで確定させる
+        persisted=False（upload_first）なら行をここで INSERT し、作成日時もアプリ側で埋めて refresh を省く
+        """
+        image.status = "stored"
+        if persisted:
+            session.add_all(renditions)
+            session.commit()
+            session.refresh(image)
+            return
+
+        image.created_at = image.updated_at = datetime.datetime.now(datetime.timezone.utc)
+        session.add(image)
+        # image_renditions の外部キーのため images を先に INSERT させる（コミットはまだしない）
+        session.flush()
+        session.add_all(renditions)
+        session.commit()
+
+    @staticmethod
+    def _abandon(img_id: uuid.UUID, object_name: str, persisted: bool) -> None:
+        """
+        保存に失敗した画像の後始末
+        - pending: 先に作った行を 'failed' にする（古い行とオブジェクトは reap_images が消す）
+        - upload_first: 行は無いので、アップロード済みの元画像・レンディションをベストエフォートで消す
+          （ここで消せなかったもの・プロセスごと落ちた場合は reap_images の孤立オブジェクト掃除で消える）
+        """
+        if persisted:
+            ImageService._mark_failed(img_id)
+            return
+
+        rendition_ext = ImageService._guess_ext(RENDITION_MIME_TYPES[RENDITION_FORMAT])
+        names = [object_name, *(f"images/{img_id}/{size}{rendition_ext}" for size in RENDITION_SIZES)]
+        try:
+            adc_bucket.delete_blobs([adc_bucket.blob(n) for n in names], on_error=lambda _blob: None)
+        except Exception as gcs_err:
+            print(f"WARN: failed to delete GCS objects of unsaved image (id: {img_id}): {gcs_err}")
+
+    @staticmethod
+    def create_upload_url(mime_type: str, size_bytes: int, sha256_hex: Optional[str] = None) -> Dict[str, Any]:
+        """
+        ブラウザから GCS へ直接アップロードするための V4 署名付き PUT URL を発行する（2段階アップロードの1段目）
+        申告されたサイズ・ハッシュを 'pending' の Image に記録し、finalize_upload で実物と照合する。
+        入力が不正なら ValueError。
+        """
+        if SessionLocal is None or adc_bucket is None:
+            raise RuntimeError("Database or GCS is not initialized")
+        if not isinstance(mime_type, str) or not mime_type.startswith("image/"):
+            raise ValueError("mime_type は image/* で指定してください")
+        if not 0 < size_bytes <= DIRECT_UPLOAD_MAX_BYTES:
+            raise ValueError(f"size_bytes は 1〜{DIRECT_UPLOAD_MAX_BYTES} の範囲で指定してください")
+        if sha256_hex is not None and not _SHA256_HEX_RE.fullmatch(sha256_hex):
+            raise ValueError("sha256_hex は64桁の16進数で指定してください")
+
+        img_id = uuid.uuid4()
+        object_name = f"images/{img_id}{ImageService._guess_ext(mime_type)}"
+        with SessionLocal() as session:
+            session.add(
+                Image(
+                    img_id=img_id,
+                    gcs_uri=f"gs://{GCS_BUCKET}/{object_name}",
+                    mime_type=mime_type,
+                    size_bytes=size_bytes,
+                    sha256_hex=(sha256_hex or "").lower(),  # 未申告なら空（finalize で確定）
+                    status="pending",
+                )
+            )
+            session.commit()
+
+        # 署名に Content-Type とサイズの上限（x-goog-content-length-range）を含めるため、
+        # クライアントは headers をそのまま付けて PUT する必要がある（申告より大きい本体は GCS が拒否する）
+        signed_headers = {"x-goog-content-length-range": f"0,{size_bytes}"}
+        upload_url = adc_bucket.blob(object_name).generate_signed_url(
+            version="v4",
+            expiration=SIGNED_URL_TTL,
+            method="PUT",
+            content_type=mime_type,
+            headers=signed_headers,
+            credentials=signer_credentials,
+        )
+        return {
+            "img_id": str(img_id),
+            "upload_url": upload_url,
+            "method": "PUT",
+            "headers": {"Content-Type": mime_type, **signed_headers},
+            "expires_in": int(SIGNED_URL_TTL.total_seconds()),
+        }
+
+    @staticmethod
+    def finalize_upload(img_id: uuid.UUID, dedup: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        """
+        create_upload_url で発行した URL へのアップロード完了後に呼ぶ（2段階アップロードの2段目）
+        GCS 上のオブジェクトをチャンク単位で読み、サイズ・SHA-256・MIME を申告値と照合してから 'stored' にする。
+        - 存在しない img_id なら None
+        - 既に 'stored' なら（リトライとみなして）そのまま返す
+        - 未アップロード・照合失敗なら ValueError（照合失敗時は 'failed' にしてオブジェクトを削除する）
+        """
+        if SessionLocal is None or adc_bucket is None:
+            raise RuntimeError("Database or GCS is not initialized")
+
+        with SessionLocal() as session, tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE) as spool:
+            image = session.get(Image, img_id, with_for_update=True)
+            if image is None:
+                return None
+            if image.status == "stored":
+                return ImageService._saved(image, ImageService._rendition_sizes(session, img_id), deduplicated=False)
+            if image.status != "pending":
+                raise ValueError("この画像のアップロードは失敗しています")
+
+            blob = adc_bucket.get_blob(ImageService._object_name(image.gcs_uri))
+            if blob is None:
+                raise ValueError("画像がまだアップロードされていません")
 
+            try:
+                problem, sha256_hex = ImageService._verify_upload(image, blob, spool)
+                if problem is not None:
+                    image.status = "failed"
+                    session.commit()
+                    try:
+                        blob.delete()
+                    except Exception as gcs_err:
+                        print(f"WARN: Failed to delete rejected GCS object {image.gcs_uri}: {gcs_err}")
+                    raise ValueError(problem)
+
+                return ImageService._complete_upload(session, image, blob, sha256_hex, image.size_bytes, spool, dedup)
+
+            except ValueError:
+                raise
+            except Exception as e:
+                session.rollback()
+                print(f"ERROR: failed to finalize image upload (id: {img_id}): {e}")
+                ImageService._mark_failed(img_id)
                 return None
 
     @staticmethod
-    def get_image(img_id: uuid.UUID) -> Optional[Dict[str, Any]]:
-        """img_id で Image を1件取得し、GCSの署名付きURLも生成して返す"""
+    def _verify_upload(image: "Image", blob: Any, spool: IO[bytes]) -> Tuple[Optional[str], str]:
+        """
+        GCS 上のオブジェクトをチャンク単位で spool に読み出しながら申告値と照合し、(問題点 or None, sha256_hex) を返す
+        サイズはメタデータで先に照合し、一致しなければダウンロードしない
+        """
+        if blob.size != image.size_bytes:
+            return f"サイズが申告値と一致しません（申告 {image.size_bytes} / 実際 {blob.size}）", ""
+
+        hasher = hashlib.sha256()
+        size_bytes = 0
+        with blob.open("rb", chunk_size=UPLOAD_CHUNK_SIZE) as reader:
+            chunk = reader.read(UPLOAD_CHUNK_SIZE)
+            sniffed = magic.from_buffer(chunk[:2048], mime=True) if chunk else "application/x-empty"
+            while chunk:
+                hasher.update(chunk)
+                size_bytes += len(chunk)
+                spool.write(chunk)
+                chunk = reader.read(UPLOAD_CHUNK_SIZE)
+        sha256_hex = hasher.hexdigest()
+
+        if not sniffed.startswith("image/"):
+            return f"画像ファイルではありません（{sniffed}）", sha256_hex
+        if size_bytes != image.size_bytes:
+            return f"サイズが申告値と一致しません（申告 {image.size_bytes} / 実際 {size_bytes}）", sha256_hex
+        declared = (image.sha256_hex or "").strip()  # CHAR(64) のため未申告（空）は空白で埋まって返る
+        if declared and declared != sha256_hex:
+            return "SHA-256 が申告値と一致しません", sha256_hex
+        return None, sha256_hex
+
+    @staticmethod
+    def _mark_failed(img_id: uuid.UUID) -> None:
+        """失敗したことをDBに記録するため、ステータスを 'failed' に更新"""
+        try:
+            with SessionLocal() as failed_session:
+                failed_image = failed_session.get(Image, img_id)
+                if failed_image:
+                    failed_image.status = "failed"
+                    failed_session.commit()
+        except Exception as update_err:
+            print(f"ERROR: failed to update image status to 'failed': {update_err}")
+
+    @staticmethod
+    def _find_duplicate(session: Any, sha256_hex: str, size_bytes: int) -> Optional["Image"]:
+        """同じ内容の保存済み Image を行ロック付きで探す（idx_images_sha256_size を使う）"""
+        return (
+            session.query(Image)
+            .filter(Image.sha256_hex == sha256_hex, Image.size_bytes == size_bytes, Image.status == "stored")
+            .order_by(Image.created_at)
+            .with_for_update()
+            .first()
+        )
+
+    @staticmethod
+    def _rendition_sizes(session: Any, img_id: uuid.UUID) -> List[int]:
+        rows = session.query(ImageRendition.size).filter(ImageRendition.img_id == img_id).all()
+        return sorted((r.size for r in rows), reverse=True)
+
+    @staticmethod
+    def _saved(image: "Image", renditions: List[int], deduplicated: bool) -> Dict[str, Any]:
+        """save_image のレスポンス用 dict"""
+        return {
+            "img_id": str(image.img_id),
+            "gcs_uri": image.gcs_uri,
+            "status": image.status,
+            "renditions": renditions,
+            "deduplicated": deduplicated,
+            "created_at": image.created_at.isoformat(),
+        }
+
+    @staticmethod
+    def _render(file_data: bytes | IO[bytes]) -> List[Tuple[int, bytes, int, int]]:
+        """
+        元画像（バイト列またはファイルオブジェクト）から RENDITION_SIZES の各サイズ（長辺 px）の
+        レンディションを生成し、(size, data, width, height) で返す。
+        元画像以上のサイズは生成しない。デコードできない画像なら空リスト。
+        """
+        fp = io.BytesIO(file_data) if isinstance(file_data, bytes) else file_data
+        try:
+            with PILImage.open(fp) as src:
+                # JPEG は最大サイズに近い縮小率でデコードさせ、フル解像度の展開を省く
+                src.draft("RGB", (RENDITION_SIZES[-1], RENDITION_SIZES[-1]))
+                im = ImageOps.exif_transpose(src)
+                im = im.convert("RGBA" if RENDITION_FORMAT == "WEBP" and "A" in im.getbands() else "RGB")
+        except Exception as e:
+            # 壊れた画像・DecompressionBombError・MemoryError など。元画像の保存は続ける
+            print(f"WARN: failed to decode image for renditions: {e!r}")
+            return []
+
+        out: List[Tuple[int, bytes, int, int]] = []
+        # 大きいサイズから順に、直前のレンディションを縮小して作る
+        for size in reversed(RENDITION_SIZES):
+            if size >= max(im.size):
+                continue
+            try:
+                small = im.copy()
+                small.thumbnail((size, size), PILImage.Resampling.LANCZOS)
+                buf = io.BytesIO()
+                small.save(buf, format=RENDITION_FORMAT, quality=RENDITION_QUALITY)
+            except Exception as e:
+                print(f"WARN: failed to render {size}px rendition: {e!r}")
+                continue
+            im = small
+            out.append((size, buf.getvalue(), im.width, im.height))
+        return out
+
+    @staticmethod
+    def _store_renditions(img_id: uuid.UUID, file_data: bytes | IO[bytes]) -> List["ImageRendition"]:
+        """レンディションを生成して GCS にアップロードし、保存できたものの ImageRendition を返す"""
+        mime_type = RENDITION_MIME_TYPES[RENDITION_FORMAT]
+        ext = ImageService._guess_ext(mime_type)
+        renditions: List[ImageRendition] = []
+        try:
+            rendered = ImageService._render(file_data)
+        except Exception as e:
+            # レンディションが作れなくても元画像は保存する
+            print(f"WARN: failed to render renditions for {img_id}: {e!r}")
+            return renditions
+        for size, data, width, height in rendered:
+            object_name = f"images/{img_id}/{size}{ext}"
+            try:
+                adc_bucket.blob(object_name).upload_from_string(data, content_type=mime_type)
+            except Exception as e:
+                print(f"WARN: failed to upload rendition {object_name}: {e}")
+                continue
+            renditions.append(
+                ImageRendition(
+                    img_id=img_id,
+                    size=size,
+                    gcs_uri=f"gs://{GCS_BUCKET}/{object_name}",
+                    mime_type=mime_type,
+                    width=width,
+                    height=height,
+                    size_bytes=len(data),
+                )
+            )
+        return renditions
+
+    @staticmethod
+    def get_image(img_id: uuid.UUID, size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        img_id で Image を1件取得し、GCSの署名付きURLも生成して返す
+        size（RENDITION_SIZES のいずれか）を指定するとそのレンディションの署名付きURLを返す（無ければ元画像）
+        """
         if SessionLocal is None or adc_storage_client is None or adc_bucket is None:
             raise RuntimeError("Database or GCS is not initialized")
 
@@ -192,53 +681,181 @@ class ImageService:
             image = session.get(Image, img_id)
             if not image or image.status != "stored":
                 return None
+            rendition = session.get(ImageRendition, (img_id, size)) if size is not None else None
 
-            # GCSオブジェクト名を取得
-            object_name = image.gcs_uri.replace(f"gs://{GCS_BUCKET}/", "")
-            blob = adc_bucket.blob(object_name)
+            gcs_uri = rendition.gcs_uri if rendition is not None else image.gcs_uri
+            signed_url = ImageService._sign_url(ImageService._object_name(gcs_uri))
+            return ImageService._serialize(image, signed_url, rendition)
 
-            # 15分間有効なダウンロード用URLを生成（開発=鍵 / 本番=ADC+IAM サイナー）
-            signed_url = blob.generate_signed_url(
-                version="v4",
-                expiration=datetime.timedelta(minutes=15),
-                method="GET",
-                credentials=signer_credentials,
-            )
+    @staticmethod
+    def get_images(img_ids: Sequence[uuid.UUID], size: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        複数の img_id の Image を1回のクエリで取得し、署名付きURLを付けて {img_id: image} で返す。
+        存在しない・'stored' でない画像は結果に含めない。
+        size を指定するとレンディションを同じクエリで外部結合し、あればその署名付きURLを返す。
+        """
+        if SessionLocal is None or adc_storage_client is None or adc_bucket is None:
+            raise RuntimeError("Database or GCS is not initialized")
+
+        unique_ids = list(dict.fromkeys(img_ids))
+        if not unique_ids:
+            return {}
+
+        ids_param = sa.bindparam("ids", unique_ids, type_=postgresql.ARRAY(sa.Uuid))
+        with SessionLocal() as session:
+            if size is None:
+                query = session.query(*IMAGE_COLUMNS)
+            else:
+                query = session.query(*IMAGE_COLUMNS, *RENDITION_COLUMNS).outerjoin(
+                    ImageRendition, sa.and_(ImageRendition.img_id == Image.img_id, ImageRendition.size == size)
+                )
+            rows = query.filter(Image.img_id == sa.any_(ids_param)).filter(Image.status == "stored").all()
 
-            return {
-                "img_id": str(image.img_id),
-                "gcs_uri": image.gcs_uri,
-                "mime_type": image.mime_type,
-                "size_bytes": image.size_bytes,
-                "status": image.status,
-                "signed_url": signed_url,  # 署名付きURLを追加
-                "created_at": image.created_at.isoformat(),
+        renditions = [ImageService._rendition_of(r, size) for r in rows]
+        signed_urls = ImageService._sign_many(
+            [ImageService._object_name(rd.gcs_uri if rd else r.gcs_uri) for r, rd in zip(rows, renditions)]
+        )
+        return {str(r.img_id): ImageService._serialize(r, url, rd) for r, url, rd in zip(rows, signed_urls, renditions)}
+
+    @staticmethod
+    def _rendition_of(row: Any, size: Optional[int]) -> Any:
+        """RENDITION_COLUMNS を結合した行からレンディションを取り出す（無ければ None）"""
+        if size is None or getattr(row, "rendition_gcs_uri", None) is None:
+            return None
+        return SimpleNamespace(
+            size=size,
+            gcs_uri=row.rendition_gcs_uri,
+            mime_type=row.rendition_mime_type,
+            width=row.rendition_width,
+            height=row.rendition_height,
+            size_bytes=row.rendition_size_bytes,
+        )
+
+    @staticmethod
+    def attach_signed_urls(posts: Sequence[Dict[str, Any]]) -> None:
+        """
+        PostService の include_image=True で取得した投稿の "image" に署名付きURLを付与する（in-place）
+        画像の行はすでに JOIN で取得済みのため、ここでは DB に問い合わせず署名だけを行う
+        """
+        images = [p["image"] for p in posts if p.get("image")]
+        if not images:
+            return
+        if adc_bucket is None:
+            raise RuntimeError("GCS is not initialized")
+
+        signed_urls = ImageService._sign_many([ImageService._object_name(img["gcs_uri"]) for img in images])
+        for img, url in zip(images, signed_urls):
+            img["signed_url"] = url
+
+    @staticmethod
+    def _sign_many(object_names: Sequence[str]) -> List[str]:
+        """object_names の順に署名付きURLを返す（同じオブジェクトは1回だけ署名する）"""
+        unique_names = list(dict.fromkeys(object_names))
+        if len(unique_names) > 1 and not _signs_locally(signer_credentials):
+            # 本番（IAM SignBlob）は1件ごとにリモート呼び出しになるため並列に署名する
+            urls = dict(zip(unique_names, _sign_executor.map(ImageService._sign_url, unique_names)))
+        else:
+            urls = {name: ImageService._sign_url(name) for name in unique_names}
+        return [urls[name] for name in object_names]
+
+    @staticmethod
+    def _object_name(gcs_uri: str) -> str:
+        """gs://bucket/path から GCS オブジェクト名（path）を取り出す"""
+        return gcs_uri.replace(f"gs://{GCS_BUCKET}/", "")
+
+    @staticmethod
+    def _sign_url(object_name: str, method: str = "GET") -> str:
+        """
+        15分間有効な V4 署名付きURLを返す（開発=鍵 / 本番=ADC+IAM サイナー）
+        失効の安全マージン前まではキャッシュ済みのURLを再利用し、署名（本番では IAM 呼び出し）を省く
+        """
+        key = (object_name, method)
+        cached = _signed_url_cache.get(key)
+        if cached is not None:
+            return cached
+
+        blob = adc_bucket.blob(object_name)
+        signed_url = blob.generate_signed_url(
+            version="v4",
+            expiration=SIGNED_URL_TTL,
+            method=method,
+            credentials=signer_credentials,
+        )
+        _signed_url_cache.set(key, signed_url)
+        return signed_url
+
+    @staticmethod
+    def signed_url_cache_stats() -> Dict[str, Any]:
+        """署名付きURLキャッシュのヒット/ミス数などを返す"""
+        return _signed_url_cache.stats()
+
+    @staticmethod
+    def _serialize(image: Any, signed_url: str, rendition: Any = None) -> Dict[str, Any]:
+        """
+        Image エンティティまたは IMAGE_COLUMNS の行をレスポンス用の dict に変換
+        rendition があれば signed_url はそのレンディションのもので、"rendition" にサイズ等を付ける
+        """
+        out = {
+            "img_id": str(image.img_id),
+            "gcs_uri": image.gcs_uri,
+            "mime_type": image.mime_type,
+            "size_bytes": image.size_bytes,
+            "status": image.status,
+            "signed_url": signed_url,  # 署名付きURLを追加
+            "created_at": image.created_at.isoformat(),
+        }
+        if rendition is not None:
+            out["rendition"] = {
+                "size": rendition.size,
+                "mime_type": rendition.mime_type,
+                "width": rendition.width,
+                "height": rendition.height,
+                "size_bytes": rendition.size_bytes,
             }
+        return out
 
     @staticmethod
     def delete_image(img_id: uuid.UUID) -> bool:
         """
         GCS上のファイルとDBのレコードの両方を削除する。
+        重複排除で複数の参照から共有されている画像は、参照カウントを減らすだけで実体は残す。
         成功したら True, 存在しなければ False を返す。
         """
         if SessionLocal is None or adc_bucket is None:
             raise RuntimeError("Database or GCS is not initialized")
 
         with SessionLocal() as session:
-            image = session.get(Image, img_id)
+            # save_image の重複排除と参照カウントが競合しないよう行ロックを取る
+            image = session.get(Image, img_id, with_for_update=True)
             if not image:
                 return False
 
-            try:
-                # 1. GCSからファイルを削除
+            if (image.ref_count or 1) > 1:
                 try:
-                    object_name = image.gcs_uri.replace(f"gs://{GCS_BUCKET}/", "")
-                    blob = adc_bucket.blob(object_name)
-                    blob.delete()
-                except Exception as gcs_err:
-                    print(f"WARN: Failed to delete GCS object {image.gcs_uri}: {gcs_err}")
+                    image.ref_count -= 1
+                    session.commit()
+                    return True
+                except Exception as e:
+                    session.rollback()
+                    print(f"ERROR: failed to release image reference (id: {img_id}): {e}")
+                    return False
 
-                # 2. DBからレコードを削除
+            try:
+                # 1. GCSから元画像とレンディションのファイルを削除
+                rendition_uris = [
+                    r.gcs_uri
+                    for r in session.query(ImageRendition.gcs_uri).filter(ImageRendition.img_id == img_id).all()
+                ]
+                for gcs_uri in [image.gcs_uri, *rendition_uris]:
+                    try:
+                        object_name = ImageService._object_name(gcs_uri)
+                        _signed_url_cache.pop((object_name, "GET"))
+                        blob = adc_bucket.blob(object_name)
+                        blob.delete()
+                    except Exception as gcs_err:
+                        print(f"WARN: Failed to delete GCS object {gcs_uri}: {gcs_err}")
+
+                # 2. DBからレコードを削除（image_renditions は ON DELETE CASCADE で消える）
                 session.delete(image)
                 session.commit()
                 return True
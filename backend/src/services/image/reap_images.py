@@ -0,0 +1,184 @@
+# images テーブルと GCS の整合を取る掃除スクリプト
+# - 一定時間以上たった 'pending' / 'failed' の行と、その GCS オブジェクトを削除する
+# - images/ 配下で対応する行が無い（孤立した）GCS オブジェクトを削除する
+#   （delete_image で GCS の削除に失敗した画像や、確定前に行ごと消えたレンディションなど）
+#
+# 実行例: python -m src.services.image.reap_images --min-age-hours 24 --dry-run
+import argparse
+import datetime
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List, Optional, Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from src.services.image.image import (
+    GCS_BUCKET,
+    Image,
+    ImageService,
+    SessionLocal,
+    adc_bucket,
+    adc_storage_client,
+)
+
+# 掃除対象の画像オブジェクトのプレフィックス（images/{img_id}{ext} と images/{img_id}/{size}.webp）
+IMAGE_PREFIX = "images/"
+DEAD_STATUSES = ("pending", "failed")
+_OBJECT_NAME_RE = re.compile(rf"^{IMAGE_PREFIX}([0-9a-fA-F-]{{36}})(?:[./]|$)")
+
+
+@dataclass
+class ReapStats:
+    """掃除の結果（dry-run では「削除する予定」の件数）"""
+
+    dry_run: bool = False
+    rows_scanned: int = 0
+    rows_deleted: int = 0
+    objects_scanned: int = 0
+    objects_deleted: int = 0
+    bytes_freed: int = 0
+    errors: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        verb = "would delete" if self.dry_run else "deleted"
+        return (
+            f"rows: scanned={self.rows_scanned} {verb}={self.rows_deleted} ({self.rows_scanned / elapsed:.1f} rows/s)\n"
+            f"objects: scanned={self.objects_scanned} {verb}={self.objects_deleted} "
+            f"freed={self.bytes_freed} bytes ({self.objects_scanned / elapsed:.1f} objects/s)\n"
+            f"errors={self.errors} elapsed={elapsed:.1f}s"
+        )
+
+
+def img_id_of(object_name: str) -> Optional[uuid.UUID]:
+    """GCS オブジェクト名から img_id を取り出す（画像オブジェクトでなければ None）"""
+    m = _OBJECT_NAME_RE.match(object_name)
+    if not m:
+        return None
+    try:
+        return uuid.UUID(m.group(1))
+    except ValueError:
+        return None
+
+
+def _delete_objects(names: Sequence[str], stats: ReapStats) -> None:
+    """オブジェクトをまとめて削除する（既に無いものは無視）"""
+    if not names:
+        return
+    try:
+        adc_bucket.delete_blobs([adc_bucket.blob(n) for n in names], on_error=lambda _blob: None)
+    except Exception as e:
+        stats.errors += 1
+        print(f"ERROR: failed to delete {len(names)} GCS objects: {e}")
+
+
+def reap_dead_rows(cutoff: datetime.datetime, batch_size: int, dry_run: bool, stats: ReapStats) -> None:
+    """
+    updated_at が cutoff より前の 'pending' / 'failed' の行を img_id 順にページングしながら削除し、
+    実際に削除できた行の元画像オブジェクトも削除する（レンディションは孤立オブジェクトの掃除で消える）
+    """
+    last_id: Optional[uuid.UUID] = None
+    while True:
+        with SessionLocal() as session:
+            query = session.query(Image.img_id, Image.gcs_uri).filter(
+                Image.status.in_(DEAD_STATUSES), Image.updated_at < cutoff
+            )
+            if last_id is not None:
+                query = query.filter(Image.img_id > last_id)
+            rows = query.order_by(Image.img_id).limit(batch_size).all()
+            if not rows:
+                return
+            stats.rows_scanned += len(rows)
+            last_id = rows[-1].img_id
+
+            if dry_run:
+                stats.rows_deleted += len(rows)
+                continue
+
+            # 取得後に確定（'stored'）された行は消さないよう、削除時にも条件を付け直す
+            ids_param = sa.bindparam("ids", [r.img_id for r in rows], type_=postgresql.ARRAY(sa.Uuid))
+            try:
+                deleted = session.execute(
+                    sa.delete(Image)
+                    .where(Image.img_id == sa.any_(ids_param))
+                    .where(Image.status.in_(DEAD_STATUSES), Image.updated_at < cutoff)
+                    .returning(Image.gcs_uri)
+                ).all()
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                stats.errors += 1
+                print(f"ERROR: failed to delete {len(rows)} image rows: {e}")
+                continue
+
+        stats.rows_deleted += len(deleted)
+        _delete_objects([ImageService._object_name(r.gcs_uri) for r in deleted], stats)
+
+
+def _existing_ids(ids: Iterable[uuid.UUID]) -> set:
+    ids_param = sa.bindparam("ids", list(ids), type_=postgresql.ARRAY(sa.Uuid))
+    with SessionLocal() as session:
+        return {r.img_id for r in session.query(Image.img_id).filter(Image.img_id == sa.any_(ids_param)).all()}
+
+
+def reap_orphan_objects(cutoff: datetime.datetime, batch_size: int, dry_run: bool, stats: ReapStats) -> None:
+    """
+    images/ 配下を batch_size 件ずつ一覧し、対応する行が無く cutoff より前に作られたオブジェクトを削除する
+    行の有無は1ページにつき1回のクエリで確認する
+    """
+    blobs = adc_storage_client.list_blobs(GCS_BUCKET, prefix=IMAGE_PREFIX, page_size=batch_size)
+    for page in blobs.pages:
+        page_blobs: List[Any] = list(page)
+        stats.objects_scanned += len(page_blobs)
+        candidates = [(b, img_id_of(b.name)) for b in page_blobs]
+        candidates = [(b, i) for b, i in candidates if i is not None and b.time_created and b.time_created < cutoff]
+        if not candidates:
+            continue
+
+        try:
+            existing = _existing_ids({i for _, i in candidates})
+        except Exception as e:
+            stats.errors += 1
+            print(f"ERROR: failed to look up image rows: {e}")
+            continue
+
+        orphans = [b for b, i in candidates if i not in existing]
+        stats.objects_deleted += len(orphans)
+        stats.bytes_freed += sum(b.size or 0 for b in orphans)
+        if not dry_run:
+            _delete_objects([b.name for b in orphans], stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="古い pending / failed の画像と、孤立した GCS オブジェクトを削除する")
+    parser.add_argument(
+        "--min-age-hours", type=float, default=24.0, help="この時間より前に更新・作成されたものだけを対象にする"
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="1回のクエリ・一覧・削除で扱う件数")
+    parser.add_argument("--dry-run", action="store_true", help="削除せずに対象件数だけを表示する")
+    parser.add_argument("--skip-rows", action="store_true", help="pending / failed の行の掃除を行わない")
+    parser.add_argument("--skip-objects", action="store_true", help="孤立した GCS オブジェクトの掃除を行わない")
+    args = parser.parse_args()
+
+    if not SessionLocal or not adc_bucket or not adc_storage_client:
+        print("ERROR: Database or GCS client is not initialized. Check environment variables.")
+        return
+
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=args.min_age_hours)
+    stats = ReapStats(dry_run=args.dry_run)
+    print(f"Reaping images older than {cutoff.isoformat()}{' (dry-run)' if args.dry_run else ''}...")
+
+    # 行を先に消すと、その画像のレンディションも同じ実行の孤立オブジェクト掃除で消える
+    if not args.skip_rows:
+        reap_dead_rows(cutoff, args.batch_size, args.dry_run, stats)
+    if not args.skip_objects:
+        reap_orphan_objects(cutoff, args.batch_size, args.dry_run, stats)
+
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+投稿の住所（location）をバックグラウンドで補完するワーカー（POST_GEOCODE_MODE=deferred 用）
+
+- create_post は住所の代わりに LOCATION_PENDING を保存してすぐに返し、notify() でワーカーを起こす
+- ワーカーは各 Web ワーカープロセスでアプリの起動時に動き始め、LOCATION_PENDING の投稿を古い順に
+  POST_GEOCODE_BATCH_SIZE 件ずつ post_location_claims テーブルで「予約」してから逆ジオコーディングし、まとめて UPDATE する
+  （予約は FOR UPDATE SKIP LOCKED で取り合うので、複数のプロセス・インスタンスが同じ投稿を引くことはない）
+- トークンバケットはプロセス内のペース配分。Nominatim 全体の間隔は geocoder 側（GEOCODE_RATE_LIMIT_BACKEND）で守る
+- 住所が引けなかった投稿は POST_GEOCODE_POLL_SECONDS 後に再試行し、POST_GEOCODE_MAX_ATTEMPTS 回失敗したら LOCATION_UNKNOWN にする
+- 予約は処理中に期限の半分ごとに延ばす。予約したプロセスが落ちても、予約の期限が切れれば他のプロセスが引き継ぐ
+
+実行例（溜まっている投稿を一度だけ処理する）: python -m src.services.post.location_worker
+"""
+
+import datetime
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+import src.services.post.post as post_module
+from sqlalchemy.dialects import postgresql
+from src.services.geo.geocode import geocoder
+from src.services.post.post import Post
+from src.utils.config import CONFIG
+
+# 住所の補完待ちの投稿に入れておく値（sql/post.sql の部分インデックスと揃える）
+LOCATION_PENDING = "位置情報を取得中"
+# 住所が見つからない・取得できなかった投稿の値（同期モードの補完と同じ）
+LOCATION_UNKNOWN = "不明な場所"
+
+_posts = Post.__table__
+
+# 住所の補完の予約（sql/post.sql）。attempts は予約した回数（= 問い合わせを試みた回数）
+_claims = sa.Table(
+    "post_location_claims",
+    sa.MetaData(),
+    sa.Column("post_id", sa.Uuid, primary_key=True),
+    sa.Column("claimed_until", sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column("attempts", sa.Integer, nullable=False),
+)
+
+# 予約した投稿: (post_id, latitude, longitude, attempts)
+Claimed = Tuple[uuid.UUID, float, float, int]
+
+
+class TokenBucket:
+    """
+    トークンバケット方式のレート制限（rate 個/秒で補充し、最大 capacity 個まで貯める）
+    acquire はトークンが取れるまで待つ
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate は正、capacity は 1 以上で指定してください")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class SqlPendingLocations:
+    """補完待ちの投稿を post_location_claims で予約し、住所を書き戻す（Cloud SQL）"""
+
+    def __init__(self, session_factory: Callable[[], Any] | None = None):
+        self._session_factory = session_factory
+
+    def _sessions(self) -> Callable[[], Any]:
+        factory = self._session_factory or post_module.SessionLocal
+        if factory is None:
+            raise RuntimeError("Database is not initialized")
+        return factory
+
+    def claim(self, limit: int, lease_seconds: float) -> List[Claimed]:
+        """予約されていない（または予約の期限が切れた）補完待ちの投稿を古い順に limit 件まで予約して返す"""
+        now = sa.func.now()
+        until = now + sa.literal(datetime.timedelta(seconds=lease_seconds), sa.Interval())
+        candidates = (
+            sa.select(_posts.c.post_id)
+            .select_from(_posts.outerjoin(_claims, _claims.c.post_id == _posts.c.post_id))
+            .where(
+                _posts.c.location == LOCATION_PENDING,
+                sa.or_(_claims.c.claimed_until.is_(None), _claims.c.claimed_until < now),
+            )
+            .order_by(_posts.c.date)
+            .limit(limit)
+            .with_for_update(of=_posts, skip_locked=True)
+            .cte("candidates")
+        )
+        stmt = postgresql.insert(_claims).from_select(
+            ["post_id", "claimed_until", "attempts"], sa.select(candidates.c.post_id, until, sa.literal(1))
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[_claims.c.post_id],
+            set_={"claimed_until": stmt.excluded.claimed_until, "attempts": _claims.c.attempts + 1},
+            where=_claims.c.claimed_until < now,
+        ).returning(_claims.c.post_id, _claims.c.attempts)
+
+        with self._sessions()() as session:
+            try:
+                attempts = dict(session.execute(stmt).all())
+                rows = []
+                if attempts:
+                    rows = session.execute(
+                        sa.select(_posts.c.post_id, _posts.c.latitude, _posts.c.longitude)
+                        .where(_posts.c.post_id.in_(list(attempts)))
+                        .order_by(_posts.c.date)
+                    ).all()
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        return [(post_id, lat, lon, attempts[post_id]) for post_id, lat, lon in rows]
+
+    def extend(self, post_ids: List[uuid.UUID], lease_seconds: float) -> None:
+        """処理中の予約の期限を今から lease_seconds 後まで延ばす（他のプロセスに引き直されないように）"""
+        until = sa.func.now() + sa.literal(datetime.timedelta(seconds=lease_seconds), sa.Interval())
+        with self._sessions()() as session:
+            try:
+                session.execute(sa.update(_claims).where(_claims.c.post_id.in_(post_ids)).values(claimed_until=until))
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+    def complete(self, locations: Dict[uuid.UUID, str], retry_ids: List[uuid.UUID], retry_seconds: float) -> None:
+        """
+        住所をまとめて書き戻して予約を消す（その間に利用者が location を更新した行は上書きしない）
+        retry_ids の予約は retry_seconds 後に期限切れにして、次の周回で再試行させる
+        """
+        with self._sessions()() as session:
+            try:
+                if locations:
+                    session.execute(
+                        sa.update(_posts)
+                        .where(_posts.c.post_id == sa.bindparam("b_post_id"), _posts.c.location == LOCATION_PENDING)
+                        .values(location=sa.bindparam("b_location")),
+                        [{"b_post_id": k, "b_location": v} for k, v in locations.items()],
+                    )
+                    session.execute(sa.delete(_claims).where(_claims.c.post_id.in_(list(locations))))
+                if retry_ids:
+                    retry_at = sa.func.now() + sa.literal(datetime.timedelta(seconds=retry_seconds), sa.Interval())
+                    session.execute(
+                        sa.update(_claims).where(_claims.c.post_id.in_(retry_ids)).values(claimed_until=retry_at)
+                    )
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+
+class LocationWorker:
+    """LOCATION_PENDING の投稿の住所を、バッチ単位で予約・逆ジオコーディングして書き戻す"""
+
+    def __init__(
+        self,
+        reverse: Callable[[float, float], Optional[str]],
+        bucket: TokenBucket,
+        batch_size: int,
+        poll_seconds: float,
+        max_attempts: int,
+        store: Any = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.reverse = reverse
+        self.bucket = bucket
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.store = store or SqlPendingLocations()
+        self._clock = clock
+        # 予約の期限。Nominatim の枠は全プロセスで共有するので、バッチの処理時間はトークンの補充ペースだけでは決まらない。
+        # そのため期限の半分が過ぎるたびに、残りの投稿の予約を延ばしながら処理する（1件の問い合わせは枠待ちを含めて期限の半分より十分短い）
+        self.lease_seconds = batch_size / bucket.rate + 60
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def notify(self) -> None:
+        """補完待ちの投稿が増えたことを知らせる（ワーカーが動いていなければ起動する）"""
+        self.start()
+        self._wakeup.set()
+
+    def start(self) -> None:
+        """バックグラウンドのスレッドを起動する（起動済みなら何もしない）"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="post-location-worker", daemon=True)
+            self._thread.start()
+
+    def _restart_after_fork(self) -> None:
+        # スレッドは fork の子プロセスに引き継がれないので、親で動いていたなら子でも起動し直す（gunicorn --preload など）
+        self._start_lock = threading.Lock()
+        if self._thread is not None:
+            self._thread = None
+            self.start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                claimed, _ = self._run_batch()
+            except Exception as e:
+                print(f"ERROR: post location worker failed: {e}")
+                claimed = 0
+            # バッチが埋まるほど溜まっているなら続けて処理し、そうでなければ通知か次の周回を待つ
+            if claimed < self.batch_size:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+    def run_once(self) -> int:
+        """補完待ちの投稿を1バッチ処理し、住所を確定させた件数を返す"""
+        return self._run_batch()[1]
+
+    def _run_batch(self) -> Tuple[int, int]:
+        """(予約した件数, 住所を確定させた件数) を返す"""
+        rows = self.store.claim(self.batch_size, self.lease_seconds)
+        if not rows:
+            return 0, 0
+
+        locations: Dict[uuid.UUID, str] = {}
+        retry_ids: List[uuid.UUID] = []
+        renew_at = self._clock() + self.lease_seconds / 2
+        for post_id, lat, lon, attempts in rows:
+            if self._clock() >= renew_at:
+                # 住所を引き終えた投稿も書き戻すのはバッチの最後なので、バッチ全体の予約を延ばす
+                self.store.extend([row[0] for row in rows], self.lease_seconds)
+                renew_at = self._clock() + self.lease_seconds / 2
+            location = self._resolve(lat, lon, attempts)
+            if location is None:
+                retry_ids.append(post_id)
+            else:
+                locations[post_id] = location
+        self.store.complete(locations, retry_ids, self.poll_seconds)
+        return len(rows), len(locations)
+
+    def _resolve(self, lat: float, lon: float, attempts: int) -> Optional[str]:
+        """住所を返す。引けなかったときは、再試行の上限に達していれば LOCATION_UNKNOWN、まだなら None"""
+        self.bucket.acquire()
+        try:
+            address = self.reverse(lat, lon)
+        except ValueError:
+            # 保存済みの緯度経度が不正なら何度引いても同じ
+            return LOCATION_UNKNOWN
+        if address:
+            return address
+        return LOCATION_UNKNOWN if attempts >= self.max_attempts else None
+
+    def drain(self) -> int:
+        """予約できる補完待ちの投稿が無くなるまで処理し、確定させた件数を返す（再試行待ちの投稿は残る）"""
+        total = 0
+        while True:
+            claimed, resolved = self._run_batch()
+            total += resolved
+            if claimed == 0:
+                return total
+
+
+location_worker = LocationWorker(
+    geocoder.reverse,
+    TokenBucket(CONFIG.POST_GEOCODE_RATE_PER_SECOND, CONFIG.POST_GEOCODE_BURST),
+    batch_size=CONFIG.POST_GEOCODE_BATCH_SIZE,
+    poll_seconds=CONFIG.POST_GEOCODE_POLL_SECONDS,
+    max_attempts=CONFIG.POST_GEOCODE_MAX_ATTEMPTS,
+)
+
+os.register_at_fork(after_in_child=location_worker._restart_after_fork)
+
+
+if __name__ == "__main__":
+    print(f"resolved {location_worker.drain()} posts")
@@ -1,8 +1,12 @@
+import base64
 import datetime
+import json
+import math
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import declarative_base
 from src.utils.db.cloudsql import connect_db, disconnect_db
 
@@ -14,6 +18,16 @@ if Base is object:
     Base = declarative_base()
 
 
+# 地図タイル集計の設定
+MAX_TILE_ZOOM = 22
+TILE_GRID = 8  # 1タイルを TILE_GRID x TILE_GRID のセルに分けて集計
+
+
+def _mercator_y(lat: float) -> float:
+    """緯度を Web メルカトルの y（無次元）に変換"""
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
 class Post(Base):
     __tablename__ = "posts"
 
@@ -47,9 +61,121 @@ class Post(Base):
     )
 
 
+# include_image 用に結合する images テーブル（services/image に依存しないよう列だけを宣言）
+_images = sa.table(
+    "images",
+    sa.column("img_id", sa.Uuid),
+    sa.column("gcs_uri", sa.Text),
+    sa.column("mime_type", sa.Text),
+    sa.column("status", sa.Text),
+)
+
+# レスポンスに含める投稿のフィールド（この順で SELECT する）
+POST_FIELDS: Tuple[str, ...] = (
+    "post_id",
+    "user_id",
+    "img_id",
+    "user_question",
+    "object_label",
+    "ai_answer",
+    "ai_question",
+    "ai_reference",
+    "location",
+    "latitude",
+    "longitude",
+    "is_public",
+    "post_rarity",
+    "date",
+    "updated_at",
+)
+# 一覧取得では ORM エンティティではなく、この列だけをタプルとして読み込む
+POST_COLUMNS = tuple(getattr(Post, f) for f in POST_FIELDS)
+
+
+def _isoformat(v: datetime.datetime) -> str:
+    return v.isoformat()
+
+
+# JSON 化のために変換が必要なフィールド（それ以外はそのまま）
+_POST_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "post_id": str,
+    "user_id": str,
+    "img_id": str,
+    "date": _isoformat,
+    "updated_at": _isoformat,
+}
+
+
 class PostService:
     """Post を Cloud SQL に保存・取得・削除をするサービスクラス"""
 
+    @staticmethod
+    def parse_fields(raw: str | Sequence[str] | None) -> Optional[Tuple[str, ...]]:
+        """
+        fields 指定（"a,b,c" またはリスト）を検証し、POST_FIELDS の順序で返す。未指定なら None（全フィールド）
+        post_id と date はページング（next_cursor）に必要なため常に含める
+        """
+        if raw is None:
+            return None
+        items = raw.split(",") if isinstance(raw, str) else list(raw)
+        requested = {str(f).strip() for f in items if str(f).strip()}
+        if not requested:
+            return None
+        unknown = requested.difference(POST_FIELDS)
+        if unknown:
+            raise ValueError(f"fields に不明なフィールドがあります: {', '.join(sorted(unknown))}")
+        requested.update(("post_id", "date"))
+        return tuple(f for f in POST_FIELDS if f in requested)
+
+    @staticmethod
+    def _columns(fields: Sequence[str] | None) -> Tuple[Any, ...]:
+        """SELECT する列を返す（fields 未指定なら全フィールド）"""
+        if fields is None:
+            return POST_COLUMNS
+        unknown = set(fields).difference(POST_FIELDS)
+        if unknown:
+            raise ValueError(f"fields に不明なフィールドがあります: {', '.join(sorted(unknown))}")
+        return tuple(getattr(Post, f) for f in fields)
+
+    @staticmethod
+    def _query(session: Any, fields: Sequence[str] | None, include_image: bool = False) -> Any:
+        """
+        投稿の列を射影したクエリを返す。
+        include_image=True なら images を img_id で外部結合し、保存済み画像の列も同じクエリで取得する
+        """
+        columns = PostService._columns(fields)
+        if not include_image:
+            return session.query(*columns)
+        return session.query(
+            *columns,
+            _images.c.img_id.label("image_img_id"),
+            _images.c.gcs_uri.label("image_gcs_uri"),
+            _images.c.mime_type.label("image_mime_type"),
+        ).outerjoin(_images, sa.and_(_images.c.img_id == Post.img_id, _images.c.status == "stored"))
+
+    @staticmethod
+    def _serialize(row: Any, fields: Sequence[str] | None = None, include_image: bool = False) -> Dict[str, Any]:
+        """
+        Post エンティティまたは射影した行をレスポンス用の dict に変換
+        include_image=True なら "image"（保存済みでなければ None）を付ける。署名付きURLは ImageService 側で付与する
+        """
+        out: Dict[str, Any] = {}
+        for f in fields or POST_FIELDS:
+            v = getattr(row, f)
+            conv = _POST_CONVERTERS.get(f)
+            out[f] = conv(v) if conv is not None and v is not None else v
+        if include_image:
+            out["image"] = (
+                {
+                    "img_id": str(row.image_img_id),
+                    "gcs_uri": row.image_gcs_uri,
+                    "mime_type": row.image_mime_type,
+                }
+                if row.image_gcs_uri
+                else None
+            )
+        return out
+
     @staticmethod
     def create_post(
         post_id: uuid.UUID,
@@ -96,172 +222,342 @@ class PostService:
                 session.commit()
                 session.refresh(post)
 
-                return {
-                    "post_id": str(post.post_id),
-                    "user_id": str(post.user_id),
-                    "img_id": str(post.img_id),
-                    "user_question": post.user_question,
-                    "object_label": post.object_label,
-                    "ai_answer": post.ai_answer,
-                    "ai_question": post.ai_question,
-                    "ai_reference": post.ai_reference,
-                    "location": post.location,
-                    "latitude": post.latitude,
-                    "longitude": post.longitude,
-                    "is_public": post.is_public,
-                    "post_rarity": post.post_rarity,
-                    "date": post.date.isoformat() if post.date else None,
-                    "updated_at": post.updated_at.isoformat() if post.updated_at else None,
-                }
+                return PostService._serialize(post)
             except Exception as e:
                 session.rollback()
                 print(f"ERROR: failed to insert post: {e}")
                 return None
 
     @staticmethod
-    def get_post(post_id: uuid.UUID) -> Optional[Dict[str, Any]]:
-        """post_id で Post を1件取得"""
+    def get_post(
+        post_id: uuid.UUID,
+        fields: Sequence[str] | None = None,
+        include_image: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """post_id で Post を1件取得（fields 指定時はその列だけを SELECT、include_image で画像を結合）"""
         if SessionLocal is None or engine is None:
             raise RuntimeError("Database is not initialized")
 
         with SessionLocal() as session:
-            post = session.get(Post, post_id)
+            if fields is None and not include_image:
+                post = session.get(Post, post_id)
+            else:
+                query = PostService._query(session, fields, include_image)
+                post = query.filter(Post.post_id == post_id).one_or_none()
             if not post:
                 return None
 
-            return {
-                "post_id": str(post.post_id),
-                "user_id": str(post.user_id),
-                "img_id": str(post.img_id),
-                "user_question": post.user_question,
-                "object_label": post.object_label,
-                "ai_answer": post.ai_answer,
-                "ai_question": post.ai_question,
-                "ai_reference": post.ai_reference,
-                "location": post.location,
-                "latitude": post.latitude,
-                "longitude": post.longitude,
-                "is_public": post.is_public,
-                "post_rarity": post.post_rarity,
-                "date": post.date.isoformat() if post.date else None,
-                "updated_at": post.updated_at.isoformat() if post.updated_at else None,
-            }
+            return PostService._serialize(post, fields, include_image)
 
     @staticmethod
-    def list_posts(limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
-        """Post を複数件取得（公開投稿のみ）"""
+    def get_posts_by_ids(
+        ids: Sequence[uuid.UUID],
+        preserve_order: bool = True,
+        fields: Sequence[str] | None = None,
+        include_image: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        複数の post_id の投稿を1回のクエリ（WHERE post_id = ANY(:ids)）で取得。
+        - preserve_order=True なら ids の順序（検索ランキング順など）を保つ
+        - 重複した ID は1件にまとめ、DB に存在しない ID は結果から除く
+        - include_image: images を結合し、各投稿に "image" を付ける
+        """
         if SessionLocal is None or engine is None:
             raise RuntimeError("Database is not initialized")
 
+        unique_ids = list(dict.fromkeys(ids))
+        if not unique_ids:
+            return []
+
+        ids_param = sa.bindparam("ids", unique_ids, type_=postgresql.ARRAY(sa.Uuid))
         with SessionLocal() as session:
-            posts = (
-                session.query(Post)
-                .filter(Post.is_public.is_(True))
-                .order_by(Post.date.desc())
-                .limit(limit)
-                .offset(offset)
-                .all()
+            query = PostService._query(session, fields, include_image).filter(Post.post_id == sa.any_(ids_param))
+            if not preserve_order:
+                query = query.order_by(Post.date.desc(), Post.post_id.desc())
+            rows = query.all()
+
+        posts = [PostService._serialize(r, fields, include_image) for r in rows]
+        if not preserve_order:
+            return posts
+        by_id = {p["post_id"]: p for p in posts}
+        return [by_id[str(i)] for i in unique_ids if str(i) in by_id]
+
+    @staticmethod
+    def encode_cursor(date: datetime.datetime | str, post_id: uuid.UUID | str) -> str:
+        """(date, post_id) を不透明なカーソル文字列にエンコード"""
+        date_iso = date.isoformat() if isinstance(date, datetime.datetime) else str(date)
+        raw = json.dumps({"d": date_iso, "id": str(post_id)}, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime.datetime, uuid.UUID]:
+        """カーソル文字列を (date, post_id) にデコード。不正な場合は ValueError"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            obj = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            date = datetime.datetime.fromisoformat(obj["d"])
+            post_id = uuid.UUID(str(obj["id"]))
+        except Exception as e:
+            raise ValueError(f"cursor の形式が不正です: {e}")
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return date, post_id
+
+    @staticmethod
+    def next_cursor(posts: List[Dict[str, Any]], limit: int) -> Optional[str]:
+        """取得結果が limit 件ちょうどなら、末尾の投稿から次ページ用カーソルを返す"""
+        if limit < 1 or len(posts) < limit:
+            return None
+        last = posts[-1]
+        return PostService.encode_cursor(last["date"], last["post_id"])
+
+    @staticmethod
+    def _paginate(
+        query: Any,
+        limit: int | None,
+        after: Tuple[datetime.datetime, uuid.UUID] | None = None,
+    ) -> Any:
+        """(date DESC, post_id DESC) で並べ、after より後ろの limit 件に絞る"""
+        if after is not None:
+            after_date, after_id = after
+            query = query.filter(
+                sa.tuple_(Post.date, Post.post_id)
+                < sa.tuple_(sa.literal(after_date, Post.date.type), sa.literal(after_id, Post.post_id.type))
             )
-            return [
-                {
-                    "post_id": str(p.post_id),
-                    "user_id": str(p.user_id),
-                    "img_id": str(p.img_id),
-                    "user_question": p.user_question,
-                    "object_label": p.object_label,
-                    "ai_answer": p.ai_answer,
-                    "ai_question": p.ai_question,
-                    "ai_reference": p.ai_reference,
-                    "location": p.location,
-                    "latitude": p.latitude,
-                    "longitude": p.longitude,
-                    "is_public": p.is_public,
-                    "post_rarity": p.post_rarity,
-                    "date": p.date.isoformat() if p.date else None,
-                    "updated_at": p.updated_at.isoformat() if p.updated_at else None,
-                }
-                for p in posts
-            ]
+        query = query.order_by(Post.date.desc(), Post.post_id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @staticmethod
+    def list_posts(
+        limit: int = 10,
+        offset: int = 0,
+        cursor: str | None = None,
+        fields: Sequence[str] | None = None,
+        include_image: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Post を複数件取得（公開投稿のみ）
+        - cursor 指定時: (date, post_id) のキーセットで続きを取得（offset は無視）
+        - cursor 未指定時: 従来どおり LIMIT/OFFSET
+        - fields: 返すフィールド（未指定なら全フィールド）
+        - include_image: images を結合し、各投稿に "image" を付ける
+        """
+        if SessionLocal is None or engine is None:
+            raise RuntimeError("Database is not initialized")
+
+        # カーソルの不正は DB に触る前に ValueError として返す
+        after = PostService.decode_cursor(cursor) if cursor else None
+
+        with SessionLocal() as session:
+            query = PostService._query(session, fields, include_image).filter(Post.is_public.is_(True))
+            # 部分インデックス idx_posts_public_date_id を前方からなめる
+            query = PostService._paginate(query, limit=limit, after=after)
+            if after is None:
+                query = query.offset(offset)
+            posts = query.all()
+            return [PostService._serialize(p, fields, include_image) for p in posts]
 
     @staticmethod
-    def list_posts_before(cutoff: datetime.datetime) -> List[Dict[str, Any]]:
-        """指定した日時より前に作成された投稿を返す（公開投稿のみ）"""
+    def list_posts_before(
+        cutoff: datetime.datetime,
+        limit: int | None = None,
+        cursor: str | None = None,
+        since: datetime.datetime | None = None,
+        fields: Sequence[str] | None = None,
+        include_image: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        指定した日時より前に作成された投稿を返す（公開投稿のみ）
+        - limit/cursor: キーセットページング（limit=None なら全件）
+        - since: 指定時はその日時以降に作成された投稿に限定
+        - fields: 返すフィールド（未指定なら全フィールド）
+        - include_image: images を結合し、各投稿に "image" を付ける
+        """
         if SessionLocal is None or engine is None:
             raise RuntimeError("Database is not initialized")
 
+        after = PostService.decode_cursor(cursor) if cursor else None
+
         with SessionLocal() as session:
-            rows = (
-                session.query(Post)
+            query = (
+                PostService._query(session, fields, include_image)
                 .filter(Post.date < cutoff)
                 .filter(Post.is_public.is_(True))
-                .order_by(Post.date.desc())
-                .all()
             )
-            return [
-                {
-                    "post_id": str(p.post_id),
-                    "user_id": str(p.user_id),
-                    "img_id": str(p.img_id),
-                    "user_question": p.user_question,
-                    "object_label": p.object_label,
-                    "ai_answer": p.ai_answer,
-                    "ai_question": p.ai_question,
-                    "ai_reference": p.ai_reference,
-                    "location": p.location,
-                    "latitude": p.latitude,
-                    "longitude": p.longitude,
-                    "is_public": p.is_public,
-                    "post_rarity": p.post_rarity,
-                    "date": p.date.isoformat() if p.date else None,
-                    "updated_at": p.updated_at.isoformat() if p.updated_at else None,
-                }
-                for p in rows
-            ]
+            if since is not None:
+                query = query.filter(Post.date >= since)
+            rows = PostService._paginate(query, limit=limit, after=after).all()
+            return [PostService._serialize(p, fields, include_image) for p in rows]
 
     @staticmethod
     def list_posts_before_with_visibility(
         cutoff: datetime.datetime,
         current_user_id: str,
+        limit: int | None = None,
+        cursor: str | None = None,
+        since: datetime.datetime | None = None,
+        fields: Sequence[str] | None = None,
+        include_image: bool = False,
     ) -> List[Dict[str, Any]]:
         """
         可視性ルールで投稿を返す。
         - 自分の投稿: 時刻制限なしで全件
         - 他人の投稿: cutoff より前 かつ is_public=true のみ
+        - limit/cursor: キーセットページング（limit=None なら全件）
+        - since: 指定時は自分・他人ともにその日時以降に作成された投稿に限定
+        - fields: 返すフィールド（未指定なら全フィールド）
+        - include_image: images を結合し、各投稿に "image" を付ける
         """
         if SessionLocal is None or engine is None:
             raise RuntimeError("Database is not initialized")
 
+        after = PostService.decode_cursor(cursor) if cursor else None
+
         with SessionLocal() as session:
-            rows = (
-                session.query(Post)
-                .filter(
-                    sa.or_(
-                        Post.user_id == current_user_id,
-                        sa.and_(Post.is_public.is_(True), Post.date < cutoff),
-                    )
+            query = PostService._query(session, fields, include_image).filter(
+                sa.or_(
+                    Post.user_id == current_user_id,
+                    sa.and_(Post.is_public.is_(True), Post.date < cutoff),
                 )
-                .order_by(Post.date.desc())
-                .all()
             )
+            if since is not None:
+                query = query.filter(Post.date >= since)
+            rows = PostService._paginate(query, limit=limit, after=after).all()
+            return [PostService._serialize(p, fields, include_image) for p in rows]
+
+    @staticmethod
+    def list_posts_in_bbox(
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        cutoff: datetime.datetime,
+        current_user_id: str | None = None,
+        limit: int = 200,
+        fields: Sequence[str] | None = None,
+        include_image: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        緯度経度の矩形（ビューポート）内の投稿を新しい順に返す。
+        可視性ルールは list_posts_before_with_visibility と同じ（current_user_id 未指定なら公開投稿のみ）。
+        min_lng > max_lng の場合は日付変更線（経度 ±180）をまたぐ矩形として扱う。
+        fields を指定するとその列だけを SELECT する。include_image なら images を結合して "image" を付ける。
+        """
+        if SessionLocal is None or engine is None:
+            raise RuntimeError("Database is not initialized")
+
+        visible = sa.and_(Post.is_public.is_(True), Post.date < cutoff)
+        if current_user_id:
+            visible = sa.or_(Post.user_id == current_user_id, visible)
+
+        if min_lng <= max_lng:
+            lng_cond = Post.longitude.between(min_lng, max_lng)
+        else:
+            lng_cond = sa.or_(Post.longitude >= min_lng, Post.longitude <= max_lng)
+
+        with SessionLocal() as session:
+            query = (
+                PostService._query(session, fields, include_image)
+                # idx_posts_lat_lng で緯度の範囲を絞り込む
+                .filter(Post.latitude.between(min_lat, max_lat))
+                .filter(lng_cond)
+                .filter(visible)
+            )
+            rows = PostService._paginate(query, limit=limit).all()
+            return [PostService._serialize(p, fields, include_image) for p in rows]
+
+    @staticmethod
+    def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+        """
+        Web メルカトルのタイル座標 (z, x, y) を (west, south, east, north) の経緯度に変換。
+        範囲外なら ValueError
+        """
+        if not (0 <= z <= MAX_TILE_ZOOM):
+            raise ValueError(f"z は 0〜{MAX_TILE_ZOOM} の範囲で指定してください")
+        n = 2**z
+        if not (0 <= x < n and 0 <= y < n):
+            raise ValueError(f"x / y は 0〜{n - 1} の範囲で指定してください")
+
+        def lat_of(ty: int) -> float:
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+        return x / n * 360.0 - 180.0, lat_of(y + 1), (x + 1) / n * 360.0 - 180.0, lat_of(y)
+
+    @staticmethod
+    def aggregate_tile(
+        z: int,
+        x: int,
+        y: int,
+        cutoff: datetime.datetime,
+        grid: int = TILE_GRID,
+    ) -> List[Dict[str, Any]]:
+        """
+        タイル (z, x, y) を grid x grid のセルに分け、セルごとの集計を SQL で計算して返す（公開投稿のみ）。
+        各セル: 件数・代表投稿（レア度が最大で最新のもの）・最大レア度・重心
+        """
+        if SessionLocal is None or engine is None:
+            raise RuntimeError("Database is not initialized")
+
+        west, south, east, north = PostService.tile_bounds(z, x, y)
+        merc_north = _mercator_y(north)
+        merc_south = _mercator_y(south)
+
+        # タイル境界上の投稿が隣接タイルと重複しないよう半開区間にする（端のタイルのみ閉区間）
+        n = 2**z
+        lng_cond = Post.longitude <= east if x == n - 1 else Post.longitude < east
+        lat_cond = Post.latitude >= south if y == n - 1 else Post.latitude > south
+
+        merc_y = sa.func.ln(sa.func.tan(sa.func.radians(Post.latitude) / 2.0 + math.pi / 4))
+        cell_x = sa.func.floor((Post.longitude - west) / (east - west) * grid)
+        cell_y = sa.func.floor((merc_north - merc_y) / (merc_north - merc_south) * grid)
+        # GROUP BY で式を繰り返さないよう、セル番号はサブクエリで算出する
+        cells = (
+            sa.select(
+                Post.post_id,
+                Post.post_rarity,
+                Post.date,
+                Post.latitude,
+                Post.longitude,
+                sa.cast(sa.func.least(grid - 1, cell_x), sa.Integer).label("cell_x"),
+                sa.cast(sa.func.least(grid - 1, cell_y), sa.Integer).label("cell_y"),
+            )
+            # idx_posts_lat_lng で矩形を絞り込む
+            .where(Post.latitude <= north, lat_cond, Post.longitude >= west, lng_cond)
+            .where(Post.is_public.is_(True), Post.date < cutoff)
+            .subquery()
+        )
+        representative = postgresql.array_agg(
+            postgresql.aggregate_order_by(cells.c.post_id, cells.c.post_rarity.desc(), cells.c.date.desc())
+        )[1]
+        stmt = (
+            sa.select(
+                cells.c.cell_x,
+                cells.c.cell_y,
+                sa.func.count().label("count"),
+                representative.label("post_id"),
+                sa.func.max(cells.c.post_rarity).label("max_rarity"),
+                sa.func.avg(cells.c.latitude).label("latitude"),
+                sa.func.avg(cells.c.longitude).label("longitude"),
+            )
+            .group_by(cells.c.cell_x, cells.c.cell_y)
+            .order_by(cells.c.cell_y, cells.c.cell_x)
+        )
+
+        with SessionLocal() as session:
+            rows = session.execute(stmt).all()
             return [
                 {
-                    "post_id": str(p.post_id),
-                    "user_id": str(p.user_id),
-                    "img_id": str(p.img_id),
-                    "user_question": p.user_question,
-                    "object_label": p.object_label,
-                    "ai_answer": p.ai_answer,
-                    "ai_question": p.ai_question,
-                    "ai_reference": p.ai_reference,
-                    "location": p.location,
-                    "latitude": p.latitude,
-                    "longitude": p.longitude,
-                    "is_public": p.is_public,
-                    "post_rarity": p.post_rarity,
-                    "date": p.date.isoformat() if p.date else None,
-                    "updated_at": p.updated_at.isoformat() if p.updated_at else None,
+                    "cell_x": int(r.cell_x),
+                    "cell_y": int(r.cell_y),
+                    "count": int(r.count),
+                    "post_id": str(r.post_id),
+                    "max_rarity": int(r.max_rarity),
+                    "latitude": float(r.latitude),
+                    "longitude": float(r.longitude),
                 }
-                for p in rows
+                for r in rows
             ]
 
     @staticmethod
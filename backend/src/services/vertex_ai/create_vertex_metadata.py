@@ -10,6 +10,7 @@ from google.cloud import discoveryengine
 # サービス層のモジュールとモデルをインポート
 from src.services.image.image import GCS_BUCKET, Image, adc_bucket
 from src.services.post.post import Post, SessionLocal
+from src.services.vertex_ai.search_cache import mark_import_completed, search_cache
 
 # プロジェクトルートをPythonパスに追加
 try:
@@ -62,6 +63,10 @@ def trigger_import(gcs_uri: str):
 
         print(f"Import completed successfully. Error samples: {response.error_samples}")
 
+        # インデックスが入れ替わったので、古い検索結果のキャッシュを無効にする（他のインスタンスはマーカーで検知）
+        search_cache.invalidate()
+        mark_import_completed()
+
     except Exception as e:
         print(f"ERROR: Failed to trigger Vertex AI Search import: {e}")
 
@@ -2,8 +2,13 @@ import os
 import uuid
 from typing import Any, Dict, List, Optional
 
-from google.api_core.client_options import ClientOptions
+from google.api_core import exceptions as gexc
+from google.api_core.retry import Retry, if_exception_type
 from google.cloud.discoveryengine import SearchRequest, SearchServiceClient
+from src.services.vertex_ai.search_cache import clean_query, normalize_query, search_cache
+from src.utils import metrics
+from src.utils.clients import search_client
+from src.utils.config import CONFIG
 
 # --- Vertex AI Search 設定 ---
 GCP_PROJECT_ID = os.environ.get("PROJECT_ID")
@@ -18,6 +23,27 @@ API_ENDPOINT = (
     f"{GCP_LOCATION}-discoveryengine.googleapis.com" if GCP_LOCATION != "global" else "discoveryengine.googleapis.com"
 )
 
+# 一時的なエラーだけを指数バックオフで再試行する（全体で SEARCH_RETRY_DEADLINE_SECONDS まで）
+SEARCH_RETRY = Retry(
+    predicate=if_exception_type(gexc.ServiceUnavailable, gexc.DeadlineExceeded),
+    initial=CONFIG.SEARCH_RETRY_INITIAL_SECONDS,
+    maximum=CONFIG.SEARCH_RETRY_MAX_SECONDS,
+    multiplier=2.0,
+    timeout=CONFIG.SEARCH_RETRY_DEADLINE_SECONDS,
+)
+
+
+def _client() -> SearchServiceClient:
+    """プロセスで共有するクライアント（gRPC チャネル・認証トークンを呼び出しごとに作り直さない）"""
+    return search_client(API_ENDPOINT)
+
+
+def _search(name: str, request: SearchRequest) -> Any:
+    """検索を実行し、所要時間を metrics の "vertex_search.{name}" に記録する"""
+    client = _client()
+    with metrics.latency(f"vertex_search.{name}").time():
+        return client.search(request=request, retry=SEARCH_RETRY, timeout=CONFIG.SEARCH_TIMEOUT_SECONDS)
+
 
 class SearchService:
     """Vertex AI Searchを使って関連投稿を検索するサービスクラス"""
@@ -31,7 +57,7 @@ class SearchService:
             raise RuntimeError("Vertex AI Search environment variables are not set")
 
         try:
-            client = SearchServiceClient(client_options=ClientOptions(api_endpoint=API_ENDPOINT))
+            client = _client()
 
             serving_config = client.serving_config_path(
                 project=GCP_PROJECT_ID,
@@ -56,7 +82,7 @@ class SearchService:
                 page_size=num_results + 1,
             )
 
-            response = client.search(request=request)
+            response = _search("find_related_posts", request)
 
             related_post_ids = []
             for result in response.results:
@@ -73,12 +99,20 @@ class SearchService:
     def search_by_text(search_query: str, num_results: int = 10) -> Optional[List[Dict[str, Any]]]:
         """
         ユーザーが入力したテキストクエリに基づいて投稿を検索する。
+        結果は表記ゆれを畳んだクエリ（normalize_query）ごとにキャッシュし、検索には clean_query を送る。
         """
         if not all([GCP_PROJECT_ID, GCP_LOCATION, DATA_STORE_ID]):
             raise RuntimeError("Vertex AI Search environment variables are not set")
 
+        search_query = clean_query(search_query)
+        if not search_query:
+            return []
+        cache_key = normalize_query(search_query)
+        cached = search_cache.get(cache_key, num_results)
+        if cached is not None:
+            return cached
+
         try:
-            client = SearchServiceClient(client_options=ClientOptions(api_endpoint=API_ENDPOINT))
             serving_config = (
                 f"projects/{GCP_PROJECT_ID}/locations/{GCP_LOCATION}/"
                 f"collections/{COLLECTION_ID}/dataStores/{DATA_STORE_ID}/servingConfigs/default_config"
@@ -92,15 +126,26 @@ class SearchService:
                 # content_search_spec=...
             )
 
-            response = client.search(request=request)
+            response = _search("search_by_text", request)
 
             # 検索結果からIDと、必要であれば他のメタデータも抽出
             search_results = []
             for result in response.results:
                 search_results.append({"id": result.document.id, "struct_data": result.document.struct_data})
 
+            search_cache.set(cache_key, num_results, search_results)
             return search_results
 
         except Exception as e:
             print(f"ERROR: Vertex AI Search by text failed for query '{search_query}': {e}")
             return None
+
+    @staticmethod
+    def latency_stats() -> Dict[str, Dict[str, Any]]:
+        """クライアントの作成と検索の呼び出しにかかった時間の統計（名前 -> count / errors / avg_ms / p50_ms / p95_ms / max_ms）"""
+        return metrics.snapshot("vertex_search.")
+
+    @staticmethod
+    def search_cache_stats() -> Dict[str, Any]:
+        """テキスト検索の結果キャッシュの hits / misses / evictions / rejections / size"""
+        return search_cache.stats()
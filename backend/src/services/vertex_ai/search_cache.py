@@ -0,0 +1,136 @@
+"""
+/api/search のテキスト検索結果のキャッシュ（正規化したクエリ単位）
+
+- キーは normalize_query で表記ゆれ（ひらがな / カタカナなど）まで畳んだクエリ。
+  Vertex AI Search には clean_query（NFKC と空白の整理だけ）を送り、送り仮名などは変えない
+- 追い出しは参照回数ベース（LFUCache）。よく検索されるクエリがメモリに残る
+- create_vertex_metadata のインポートが完了したら、GCS の IMPORT_MARKER を更新して全インスタンスのキャッシュを無効にする
+  （各インスタンスは SEARCH_CACHE_VERSION_CHECK_SECONDS ごとにマーカーの generation を確認する）
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional
+
+from src.utils.cache import LFUCache
+from src.utils.clients import storage_client
+from src.utils.config import CONFIG
+
+SearchHits = List[Dict[str, Any]]
+
+# インポート完了のマーカー（中身は完了時刻。generation をキャッシュの版として使う）
+IMPORT_MARKER = "metadata/import_completed"
+
+GCS_BUCKET = os.environ.get("GCS_BUCKET")
+GCP_PROJECT = os.environ.get("GCP_PROJECT")
+
+# まだ版を確認していないことを表す値（マーカーが無い場合の None と区別する）
+_UNCHECKED = object()
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# ひらがな（ぁ〜ゖ、ゝゞ）→ カタカナ
+_HIRAGANA_TO_KATAKANA = {c: c + 0x60 for c in (*range(0x3041, 0x3097), 0x309D, 0x309E)}
+
+
+def clean_query(query: str) -> str:
+    """検索に送るクエリ: NFKC（全角英数・半角カナなどの統一）→ 連続する空白を1つにして前後を除く"""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", query)).strip()
+
+
+def normalize_query(query: str) -> str:
+    """
+    キャッシュキー用にクエリを正規化する
+    clean_query → 小文字化 → ひらがなをカタカナに（検索には使わない。「きれいな花」が「キレイナ花」になるため）
+    """
+    return clean_query(query).casefold().translate(_HIRAGANA_TO_KATAKANA)
+
+
+def import_generation() -> Optional[int]:
+    """IMPORT_MARKER の generation（マーカーが無い・バケット未設定なら None）"""
+    if not GCS_BUCKET:
+        return None
+    blob = storage_client(GCP_PROJECT).bucket(GCS_BUCKET).get_blob(IMPORT_MARKER)
+    return blob.generation if blob is not None else None
+
+
+def mark_import_completed() -> None:
+    """インポートの完了を IMPORT_MARKER に記録する（各インスタンスの検索キャッシュが無効になる）"""
+    if not GCS_BUCKET:
+        print("WARN: GCS_BUCKET is not set -> search caches on other instances are not invalidated")
+        return
+    blob = storage_client(GCP_PROJECT).bucket(GCS_BUCKET).blob(IMPORT_MARKER)
+    blob.upload_from_string(time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), content_type="text/plain")
+
+
+class SearchCache:
+    """
+    検索結果（search_by_text の戻り値）のキャッシュ（キーは (正規化したクエリ, 件数)）
+    version_source が返す版が変わったら全件を破棄する。版の確認に失敗しても検索は止めない
+    """
+
+    def __init__(
+        self,
+        cache: Optional[LFUCache[SearchHits]],
+        version_source: Callable[[], Optional[int]] = import_generation,
+        check_interval: float = 60.0,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.cache = cache
+        self.version_source = version_source
+        self.check_interval = check_interval
+        self._timer = timer
+        self._version: Any = _UNCHECKED
+        self._next_check = 0.0
+        self._check_lock = threading.Lock()
+
+    def _check_version(self) -> None:
+        now = self._timer()
+        if now < self._next_check or not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.check_interval
+            try:
+                version = self.version_source()
+            except Exception as e:
+                print(f"WARN: search cache version check failed: {e}")
+                return
+            if version != self._version:
+                if self._version is not _UNCHECKED:
+                    print(f"INFO: search index was re-imported (generation {version}) -> clear search cache")
+                    self.cache.clear()
+                self._version = version
+        finally:
+            self._check_lock.release()
+
+    def get(self, query: str, num_results: int) -> Optional[SearchHits]:
+        if self.cache is None:
+            return None
+        self._check_version()
+        hits = self.cache.get((query, num_results))
+        # 呼び出し側が結果を書き換えてもキャッシュに影響しないようにコピーを返す
+        return [dict(h) for h in hits] if hits is not None else None
+
+    def set(self, query: str, num_results: int, hits: SearchHits) -> None:
+        if self.cache is None:
+            return
+        self.cache.set((query, num_results), [dict(h) for h in hits])
+
+    def invalidate(self) -> None:
+        """全件を破棄する（このプロセス内）"""
+        if self.cache is not None:
+            self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats() if self.cache is not None else {}
+
+
+# SEARCH_CACHE_MAX_ENTRIES=0 でキャッシュしない
+search_cache = SearchCache(
+    LFUCache(maxsize=CONFIG.SEARCH_CACHE_MAX_ENTRIES, ttl=CONFIG.SEARCH_CACHE_TTL_SECONDS)
+    if CONFIG.SEARCH_CACHE_MAX_ENTRIES > 0
+    else None,
+    check_interval=CONFIG.SEARCH_CACHE_VERSION_CHECK_SECONDS,
+)
@@ -3,6 +3,7 @@ import io
 import pytest
 import src.services.ai.analyze as analyze_mod
 from PIL import Image
+from src.services.ai.analysis_cache import MemoryAnalysisCache
 from werkzeug.datastructures import FileStorage
 from werkzeug.exceptions import BadRequest
 
@@ -21,6 +22,12 @@ class _GeminiSpy:
         return '{"object_label":"T","ai_answer":"A","ai_question":"Q"}'
 
 
+@pytest.fixture(autouse=True)
+def fresh_analysis_cache(monkeypatch: pytest.MonkeyPatch):
+    # テスト間で解析結果のキャッシュを共有しない
+    monkeypatch.setattr(analyze_mod.analysis_cache, "backend", MemoryAnalysisCache(maxsize=16, ttl=60))
+
+
 def _small_png_bytes() -> bytes:
     im = Image.new("RGB", (64, 40), (0, 200, 80))
     buf = io.BytesIO()
@@ -90,7 +97,7 @@ def test_analyze_calls_gemini_via_files_when_threshold_low(monkeypatch: pytest.M
             self.files = _DummyFiles()
             self.models = _DummyModels()
 
-    monkeypatch.setattr(analyze_mod, "genai", _types.SimpleNamespace(Client=_DummyClient), raising=False)
+    monkeypatch.setattr(analyze_mod, "genai_client", _DummyClient, raising=False)
 
     # Files 経路を確実に踏ませるため：
     # 1) inline 閾値を極小に
@@ -171,7 +178,6 @@ def test_parse_allows_code_fence_json():
 
 def test_fetch_gcs_bytes_success(monkeypatch: pytest.MonkeyPatch):
     """gs:// 読み出し成功パス"""
-    import types as _types
 
     class _DummyBlob:
         def __init__(self, name):
@@ -194,14 +200,13 @@ def test_fetch_gcs_bytes_success(monkeypatch: pytest.MonkeyPatch):
         def bucket(self, name):
             return _DummyBucket(name)
 
-    monkeypatch.setattr(analyze_mod, "storage", _types.SimpleNamespace(Client=_DummyClient), raising=False)
+    monkeypatch.setattr(analyze_mod, "storage_client", _DummyClient, raising=False)
     data = analyze_mod.AnalyzeService._fetch_gcs_bytes("gs://my-bkt/path/to%20file.jpg")
     assert data == b"IMG"
 
 
 def test_fetch_gcs_bytes_errors(monkeypatch: pytest.MonkeyPatch):
     """gs:// のフォーマット・ディレクトリ指定・ダウンロード失敗を検証"""
-    import types as _types
 
     # 形式不正
     with pytest.raises(BadRequest):
@@ -228,7 +233,7 @@ def test_fetch_gcs_bytes_errors(monkeypatch: pytest.MonkeyPatch):
         def bucket(self, name):
             return _DummyBucket()
 
-    monkeypatch.setattr(analyze_mod, "storage", _types.SimpleNamespace(Client=_DummyClient), raising=False)
+    monkeypatch.setattr(analyze_mod, "storage_client", _DummyClient, raising=False)
     with pytest.raises(BadRequest):
         analyze_mod.AnalyzeService._fetch_gcs_bytes("gs://bkt/file.jpg")
 
@@ -265,3 +270,55 @@ def test_downscale_to_jpeg_outputs_jpeg_bytes():
     assert jpeg[:2] == b"\xff\xd8"
     # サイズは元より小さくなっているはず（厳密比較は避ける）
     assert len(jpeg) < len(big)
+
+
+def test_analyze_reuses_cached_result_for_same_image_and_prompt(monkeypatch: pytest.MonkeyPatch):
+    # 同じ画像・質問・場所で、現地時刻が同じ1時間内なら Gemini を呼ばずにキャッシュを返す
+    calls = []
+
+    class _CountingGemini(_GeminiSpy):
+        def generate_inline(self, image_jpeg_bytes: bytes, prompt: str) -> str:
+            calls.append(prompt)
+            return super().generate_inline(image_jpeg_bytes, prompt)
+
+    monkeypatch.setattr(analyze_mod, "gemini", _CountingGemini(), raising=False)
+    raw = _small_png_bytes()
+
+    def run(question, local_time_iso):
+        return analyze_mod.AnalyzeService.analyze(
+            file=None,
+            image_url=None,
+            user_question=question,
+            location="札幌",
+            local_time_iso=local_time_iso,
+            image_bytes=raw,
+        )
+
+    first = run("何？", "2025-09-20T12:05:00+09:00")
+    first["object_label"] = "changed"
+    second = run("何？", "2025-09-20T12:40:00+09:00")
+    assert len(calls) == 1
+    assert second["object_label"] == "T"
+    # 質問や時間帯が変われば呼び直す
+    run("これは？", "2025-09-20T12:40:00+09:00")
+    run("何？", "2025-09-20T13:00:00+09:00")
+    assert len(calls) == 3
+
+
+def test_analysis_cache_backend_failure_is_a_miss(monkeypatch: pytest.MonkeyPatch):
+    class _BrokenBackend:
+        def get(self, key):
+            raise RuntimeError("db down")
+
+        def set(self, key, result):
+            raise RuntimeError("db down")
+
+    monkeypatch.setattr(analyze_mod.analysis_cache, "backend", _BrokenBackend())
+    spy = _GeminiSpy()
+    monkeypatch.setattr(analyze_mod, "gemini", spy, raising=False)
+
+    result = analyze_mod.AnalyzeService.analyze(
+        file=None, image_url=None, user_question=None, image_bytes=_small_png_bytes()
+    )
+    assert result["object_label"] == "T"
+    assert spy.called_inline is True
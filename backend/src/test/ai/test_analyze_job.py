@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+import src.services.ai.analyze_job as job_module
+from src.services.ai.analyze_job import AnalyzeJob, AnalyzeJobService, MemoryJobStore, poll_intervals
+from werkzeug.exceptions import BadRequest
+
+
+def _run(task):
+    job = AnalyzeJobService.submit("img-1", task)
+    job = AnalyzeJobService.wait(job.job_id, timeout=5)
+    assert job.finished
+    return job
+
+
+def test_job_succeeds_and_keeps_result():
+    job = _run(lambda: ({"object_label": "T"}, "札幌"))
+
+    assert AnalyzeJobService.get(job.job_id) == job
+    d = job.to_dict()
+    assert d["status"] == "succeeded"
+    assert d["ai_response"] == {"object_label": "T"}
+    assert d["location"] == "札幌"
+    assert d["finished_at"] is not None
+
+
+@pytest.mark.parametrize(
+    "exc, status",
+    [(BadRequest("画像ファイルではありません"), 400), (TimeoutError("timeout"), 504), (RuntimeError("boom"), 502)],
+)
+def test_job_failure_records_http_status(exc, status):
+    def task():
+        raise exc
+
+    job = _run(task)
+
+    d = job.to_dict()
+    assert d["status"] == "failed"
+    assert d["error_status"] == status
+    assert "ai_response" not in d
+
+
+def test_get_unknown_job_returns_none():
+    assert AnalyzeJobService.get("missing") is None
+
+
+def test_wait_sees_result_written_by_another_process(monkeypatch: pytest.MonkeyPatch):
+    # 別のプロセスがストアに書いた結果も、ストアを読み直して拾えること
+    store = MemoryJobStore(maxsize=10, ttl=60)
+    monkeypatch.setattr(job_module, "_jobs", store)
+    store.save(AnalyzeJob(job_id="job-1", img_id="img-1", status="running"))
+
+    def finish():
+        store.save(AnalyzeJob(job_id="job-1", img_id="img-1", status="succeeded", ai_response={"object_label": "T"}))
+
+    timer = threading.Timer(0.1, finish)
+    timer.start()
+    job = AnalyzeJobService.wait("job-1", timeout=5)
+    timer.join()
+
+    assert job.status == "succeeded"
+    assert job.ai_response == {"object_label": "T"}
+
+
+def test_wait_returns_unfinished_job_after_timeout(monkeypatch: pytest.MonkeyPatch):
+    store = MemoryJobStore(maxsize=10, ttl=60)
+    monkeypatch.setattr(job_module, "_jobs", store)
+    store.save(AnalyzeJob(job_id="job-1", img_id="img-1", status="running"))
+
+    job = AnalyzeJobService.wait("job-1", timeout=0.05)
+
+    assert job.status == "running" and not job.finished
+
+
+def test_memory_store_keeps_a_snapshot():
+    store = MemoryJobStore(maxsize=10, ttl=60)
+    job = AnalyzeJob(job_id="job-1", img_id="img-1")
+    store.save(job)
+
+    job.status = "running"
+
+    assert store.load("job-1").status == "queued"
+
+
+def test_poll_intervals_back_off_to_the_cap():
+    intervals = poll_intervals()
+    assert [next(intervals) for _ in range(5)] == [0.5, 1.0, 2.0, 2.0, 2.0]
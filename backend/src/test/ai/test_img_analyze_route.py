@@ -5,6 +5,7 @@ import src.services.ai.analyze as analyze_mod
 from flask import Flask
 from PIL import Image
 from src.routes.img_analyze_route import img_analyze_bp
+from src.services.ai.analysis_cache import MemoryAnalysisCache
 from werkzeug.datastructures import FileStorage
 
 
@@ -23,6 +24,12 @@ def _png_bytes() -> bytes:
     return buf.getvalue()
 
 
+@pytest.fixture(autouse=True)
+def fresh_analysis_cache(monkeypatch: pytest.MonkeyPatch):
+    # テスト間で解析結果のキャッシュを共有しない
+    monkeypatch.setattr(analyze_mod.analysis_cache, "backend", MemoryAnalysisCache(maxsize=16, ttl=60))
+
+
 @pytest.fixture
 def app():
     app = Flask(__name__)
@@ -55,3 +62,148 @@ def test_analyze_endpoint_with_file(monkeypatch: pytest.MonkeyPatch, client):
     assert ans.get("object_label") == "T"
     assert ans.get("ai_answer") == "A"
     assert ans.get("ai_question") == "Q"
+
+
+def test_image_analyze_passes_bytes_without_refetching(monkeypatch: pytest.MonkeyPatch, client):
+    # 保存と解析が同じバイト列を受け取り、解析のために GCS から取得し直さないこと
+    import src.routes.img_analyze_route as route_mod
+
+    monkeypatch.setattr(analyze_mod, "gemini", _GeminiSpy(), raising=False)
+    monkeypatch.setenv("INLINE_MAX_IMAGE_BYTES", "10000000")
+    saved_bytes = []
+
+    def fake_save(stream, mime_type=None):
+        saved_bytes.append(stream.read())
+        return {"img_id": "img-1", "gcs_uri": "gs://bkt/images/img-1.png"}
+
+    def fail_fetch(url):
+        raise AssertionError("GCS から取得し直してはいけない")
+
+    monkeypatch.setattr(route_mod.ImageService, "save_image_stream", staticmethod(fake_save))
+    monkeypatch.setattr(analyze_mod.AnalyzeService, "_fetch_image_bytes", staticmethod(fail_fetch))
+
+    png = _png_bytes()
+    data = {"img_file": (io.BytesIO(png), "x.png"), "user_question": "内容？"}
+    r = client.post("/api/image_analyze", data=data, content_type="multipart/form-data")
+
+    assert r.status_code == 200
+    assert r.json["img_id"] == "img-1"
+    assert r.json["ai_response"]["object_label"] == "T"
+    assert saved_bytes == [png]
+
+
+def test_image_analyze_rejects_oversized_upload_before_reading_it_all(monkeypatch: pytest.MonkeyPatch, client):
+    # ANALYZE_UPLOAD_MAX_BYTES を超える画像は、保存も解析もせずに 413 を返すこと
+    from dataclasses import replace
+
+    import src.routes.img_analyze_route as route_mod
+
+    def fail(*_args, **_kwargs):
+        raise AssertionError("上限を超えた画像を保存・解析してはいけない")
+
+    monkeypatch.setattr(route_mod, "CONFIG", replace(route_mod.CONFIG, ANALYZE_UPLOAD_MAX_BYTES=100))
+    monkeypatch.setattr(route_mod.ImageService, "save_image_stream", staticmethod(fail))
+    monkeypatch.setattr(route_mod.AnalyzeService, "analyze", staticmethod(fail))
+
+    data = {"img_file": (io.BytesIO(_png_bytes() + b"\0" * 1000), "x.png"), "user_question": "内容？"}
+    r = client.post("/api/image_analyze", data=data, content_type="multipart/form-data")
+
+    assert r.status_code == 413
+
+
+def test_image_analyze_save_failure_returns_502(monkeypatch: pytest.MonkeyPatch, client):
+    import src.routes.img_analyze_route as route_mod
+
+    monkeypatch.setattr(analyze_mod, "gemini", _GeminiSpy(), raising=False)
+    monkeypatch.setattr(route_mod.ImageService, "save_image_stream", staticmethod(lambda stream, mime_type=None: None))
+
+    data = {"img_file": (io.BytesIO(_png_bytes()), "x.png"), "user_question": "内容？"}
+    r = client.post("/api/image_analyze", data=data, content_type="multipart/form-data")
+
+    assert r.status_code == 502
+
+
+def test_image_analyze_job_mode_returns_job_and_result(monkeypatch: pytest.MonkeyPatch, client):
+    # mode=job なら保存後すぐに 202 を返し、結果はジョブ API と SSE で取得できること
+    import src.routes.img_analyze_route as route_mod
+    from src.services.ai.analyze_job import AnalyzeJobService
+
+    monkeypatch.setattr(analyze_mod, "gemini", _GeminiSpy(), raising=False)
+    monkeypatch.setattr(
+        route_mod.ImageService,
+        "save_image_stream",
+        staticmethod(lambda stream, mime_type=None: {"img_id": "img-1", "gcs_uri": "gs://bkt/images/img-1.png"}),
+    )
+
+    data = {"img_file": (io.BytesIO(_png_bytes()), "x.png"), "user_question": "内容？", "mode": "job"}
+    r = client.post("/api/image_analyze", data=data, content_type="multipart/form-data")
+
+    assert r.status_code == 202
+    job_id = r.json["job"]["job_id"]
+    assert r.json["img_id"] == "img-1"
+    assert r.headers["Location"] == r.json["status_url"] == f"/api/analyze_jobs/{job_id}"
+    assert AnalyzeJobService.wait(job_id, timeout=5).finished
+
+    r = client.get(f"/api/analyze_jobs/{job_id}")
+    assert r.status_code == 200
+    assert r.json["status"] == "succeeded"
+    assert r.json["ai_response"]["object_label"] == "T"
+
+    r = client.get(f"/api/analyze_jobs/{job_id}/events")
+    assert r.mimetype == "text/event-stream"
+    events = [block for block in r.get_data(as_text=True).split("\n\n") if block]
+    assert events[0].startswith("retry: ")
+    assert events[1].startswith("event: status")
+    assert events[-1].startswith("event: succeeded")
+
+
+def test_job_events_closes_stream_before_worker_timeout(monkeypatch: pytest.MonkeyPatch):
+    # 終わらないジョブでも max_seconds で接続を閉じ、クライアントの再接続に任せること
+    import src.routes.img_analyze_route as route_mod
+    from src.services.ai.analyze_job import AnalyzeJob, AnalyzeJobService
+
+    job = AnalyzeJob(job_id="job-1", img_id="img-1", status="running")
+    monkeypatch.setattr(AnalyzeJobService, "wait", staticmethod(lambda job_id, timeout, backoff=None: job))
+
+    events = list(route_mod._job_events(job, max_seconds=0.05))
+
+    assert events[0].startswith("retry: ")
+    assert events[1].startswith("event: status")
+    assert not any(e.startswith("event: running") or e.startswith("event: succeeded") for e in events)
+
+
+def test_image_analyze_rejects_unknown_mode(client):
+    data = {"img_file": (io.BytesIO(_png_bytes()), "x.png"), "user_question": "内容？", "mode": "later"}
+    r = client.post("/api/image_analyze", data=data, content_type="multipart/form-data")
+    assert r.status_code == 400
+
+
+def test_analyze_job_not_found(client):
+    r = client.get("/api/analyze_jobs/00000000-0000-0000-0000-000000000000")
+    assert r.status_code == 404
+
+
+def test_job_events_rejects_streams_over_the_per_process_limit(monkeypatch: pytest.MonkeyPatch, client):
+    # 同時接続数の上限を超えた SSE は 503 にして、ポーリングに切り替えてもらうこと
+    import threading
+
+    import src.routes.img_analyze_route as route_mod
+    from src.services.ai.analyze_job import AnalyzeJob, AnalyzeJobService
+
+    job = AnalyzeJob(job_id="00000000-0000-0000-0000-000000000001", img_id="img-1", status="succeeded")
+    monkeypatch.setattr(AnalyzeJobService, "get", staticmethod(lambda job_id: job))
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(route_mod, "_sse_slots", slots)
+
+    assert slots.acquire(blocking=False)
+    r = client.get(f"/api/analyze_jobs/{job.job_id}/events")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"]
+
+    slots.release()
+    r = client.get(f"/api/analyze_jobs/{job.job_id}/events")
+    assert r.status_code == 200
+    r.get_data()
+    r.close()
+    # 接続を閉じたら枠を返す
+    assert slots.acquire(blocking=False)
@@ -0,0 +1,201 @@
+import threading
+import time
+
+import pytest
+import src.services.geo.geocode as geocode_module
+from src.services.geo.geocode import Gazetteer, RateLimitedNominatim, ReverseGeocoder, SqlRateLimit, cell_of
+from src.utils.cache import TTLCache
+
+
+class CountingLookup:
+    def __init__(self, address="北海道大学", delay=0.0, error=None):
+        self.calls = []
+        self.address = address
+        self.delay = delay
+        self.error = error
+
+    def __call__(self, lat, lon):
+        self.calls.append((lat, lon))
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.address
+
+
+class FakeStore:
+    def __init__(self, data=None):
+        self.data = dict(data or {})
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, address):
+        self.data[key] = address
+
+
+def _geocoder(lookup, store=None, cell_meters=50):
+    return ReverseGeocoder(lookup, cell_meters, TTLCache(maxsize=100, ttl=60), store)
+
+
+def test_cell_of_groups_nearby_points():
+    key1, lat, lon = cell_of(43.07000, 141.34000, 50)
+    key2, *_ = cell_of(43.07000 + 0.00005, 141.34000 + 0.00005, 50)  # 約6m 離れた点
+    key3, *_ = cell_of(43.07100, 141.34000, 50)  # 約110m 北
+    assert key1 == key2
+    assert key1 != key3
+    # セル中心は元の点から半セル以内
+    assert abs(lat - 43.07) < 50 / 111_320 and abs(lon - 141.34) < 0.001
+
+
+def test_reverse_caches_by_cell():
+    lookup = CountingLookup()
+    geocoder = _geocoder(lookup)
+
+    assert geocoder.reverse(43.07000, 141.34000) == "北海道大学"
+    assert geocoder.reverse("43.07001", "141.34001") == "北海道大学"
+    assert len(lookup.calls) == 1
+
+
+def test_reverse_uses_store_before_lookup_and_writes_back():
+    lookup = CountingLookup()
+    key, *_ = cell_of(35.0, 135.0, 50)
+    store = FakeStore({key: "京都"})
+    geocoder = _geocoder(lookup, store)
+
+    assert geocoder.reverse(35.0, 135.0) == "京都"
+    assert lookup.calls == []
+
+    assert geocoder.reverse(36.0, 136.0) == "北海道大学"
+    assert store.data[cell_of(36.0, 136.0, 50)[0]] == "北海道大学"
+
+
+def test_reverse_caches_no_address_but_not_failures():
+    lookup = CountingLookup(address=None)
+    geocoder = _geocoder(lookup)
+    assert geocoder.reverse(30.0, 150.0) is None
+    assert geocoder.reverse(30.0, 150.0) is None
+    assert len(lookup.calls) == 1
+
+    failing = CountingLookup(error=RuntimeError("rate limited"))
+    geocoder = _geocoder(failing)
+    assert geocoder.reverse(30.0, 150.0) is None
+    assert geocoder.reverse(30.0, 150.0) is None
+    assert len(failing.calls) == 2
+
+
+def test_concurrent_lookups_of_same_cell_are_coalesced():
+    lookup = CountingLookup(delay=0.05)
+    geocoder = _geocoder(lookup)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(geocoder.reverse(43.07, 141.34))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["北海道大学"] * 8
+    assert len(lookup.calls) == 1
+
+
+def test_reverse_rejects_invalid_coordinates():
+    geocoder = _geocoder(CountingLookup())
+    with pytest.raises(ValueError):
+        geocoder.reverse(91, 0)
+    with pytest.raises(ValueError):
+        geocoder.reverse(None, 0)
+
+
+def test_gazetteer_returns_nearest_place_within_distance(tmp_path):
+    path = tmp_path / "places.csv"
+    path.write_text(
+        "latitude,longitude,address\n43.0700,141.3400,北海道大学\n43.0620,141.3540,大通公園\n", encoding="utf-8"
+    )
+    gazetteer = Gazetteer.load(str(path), max_distance_meters=500)
+
+    assert gazetteer.lookup(43.0705, 141.3405) == "北海道大学"
+    assert gazetteer.lookup(43.0625, 141.3535) == "大通公園"
+    assert gazetteer.lookup(43.1000, 141.3400) is None
+
+
+def test_sql_rate_limit_waits_until_slot_is_claimed(monkeypatch):
+    sleeps = []
+    limit = SqlRateLimit(session_factory=None, name="nominatim", min_interval=1, sleep=sleeps.append)
+    answers = iter([0.4, 0.0, None])
+    monkeypatch.setattr(limit, "_try_claim", lambda: next(answers))
+
+    limit.wait()
+
+    assert sleeps == [0.4, 0.01]
+
+
+def test_sql_rate_limit_gives_up_at_deadline(monkeypatch):
+    sleeps = []
+    limit = SqlRateLimit(
+        session_factory=None, name="nominatim", min_interval=1, sleep=sleeps.append, clock=lambda: 10.0
+    )
+    monkeypatch.setattr(limit, "_try_claim", lambda: 3.0)
+
+    assert limit.wait(deadline=12.0) is False
+    assert sleeps == []
+
+
+class _FakeLocation:
+    address = "北海道大学"
+
+
+class _FakeNominatim:
+    def reverse(self, *_args, **_kwargs):
+        return _FakeLocation()
+
+
+class _CountingLimit:
+    def __init__(self, error=None, acquired=True):
+        self.calls = 0
+        self.error = error
+        self.acquired = acquired
+
+    def wait(self, deadline=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.acquired
+
+
+def test_nominatim_uses_shared_limit_and_survives_its_failure(monkeypatch):
+    monkeypatch.setattr(geocode_module, "shared", lambda _key, _factory: _FakeNominatim())
+    limit = _CountingLimit()
+    lookup = RateLimitedNominatim("test-agent", timeout=1, min_interval=0, shared_limit=limit)
+    assert lookup(43.07, 141.34) == "北海道大学"
+    assert limit.calls == 1
+
+    # 共有の制限（DB）が使えなくても、プロセス内の間隔だけで問い合わせを続ける
+    broken = _CountingLimit(error=RuntimeError("db down"))
+    lookup = RateLimitedNominatim("test-agent", timeout=1, min_interval=0, shared_limit=broken)
+    assert lookup(43.07, 141.34) == "北海道大学"
+
+
+def test_nominatim_gives_up_when_no_slot_within_max_wait(monkeypatch):
+    monkeypatch.setattr(geocode_module, "shared", lambda _key, _factory: _FakeNominatim())
+    lookup = RateLimitedNominatim(
+        "test-agent", timeout=1, min_interval=0, shared_limit=_CountingLimit(acquired=False), max_wait=0.1
+    )
+    with pytest.raises(TimeoutError):
+        lookup(43.07, 141.34)
+
+    # プロセス内の枠も max_wait を超えて待たない（ロックを持ったまま眠らない）
+    lookup = RateLimitedNominatim("test-agent", timeout=1, min_interval=60, max_wait=0.1)
+    assert lookup(43.07, 141.34) == "北海道大学"
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        lookup(43.07, 141.34)
+    assert time.monotonic() - started < 1
+
+
+def test_reverse_geocoder_does_not_cache_rate_limit_timeouts():
+    lookup = CountingLookup(error=TimeoutError("geocode rate limit"))
+    geocoder = ReverseGeocoder(lookup, cell_meters=50, memory=TTLCache(maxsize=10, ttl=60))
+
+    assert geocoder.reverse(43.07, 141.34) is None
+    lookup.error = None
+    assert geocoder.reverse(43.07, 141.34) == "北海道大学"
+    assert len(lookup.calls) == 2
@@ -1,4 +1,6 @@
 import datetime as dt
+import hashlib
+import io
 import uuid
 from types import SimpleNamespace
 
@@ -6,6 +8,7 @@ import pytest
 
 # テスト対象のモジュールを 'image_module' としてインポート
 import src.services.image.image as image_module
+from PIL import Image as PILImage
 from src.services.image.image import ImageService
 
 # -------------------------------------------------------------
@@ -13,15 +16,41 @@ from src.services.image.image import ImageService
 # -------------------------------------------------------------
 
 
+class FakeQuery:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def filter(self, *_args, **_kwargs):
+        return self
+
+    def outerjoin(self, *_args, **_kwargs):
+        return self
+
+    def order_by(self, *_args, **_kwargs):
+        return self
+
+    def with_for_update(self, *_args, **_kwargs):
+        return self
+
+    def all(self):
+        return self._rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+
 class FakeSession:
-    def __init__(self, *, get_returns=None, should_fail_on_commit=False):
+    def __init__(self, *, get_returns=None, query_rows=None, should_fail_on_commit=False):
         self.added = []
         self.committed = False
+        self.commits = 0
+        self.flushed = False
         self.refreshed = False
         self.deleted = []
         self.rolled_back = False
         self.closed = False
         self._get_returns = get_returns or {}
+        self._query_rows = query_rows or []
         self._should_fail_on_commit = should_fail_on_commit
 
     def __enter__(self):
@@ -33,10 +62,17 @@ class FakeSession:
     def add(self, obj):
         self.added.append(obj)
 
+    def add_all(self, objs):
+        self.added.extend(objs)
+
     def commit(self):
         if self._should_fail_on_commit:
             raise RuntimeError("commit failed (fake)")
         self.committed = True
+        self.commits += 1
+
+    def flush(self):
+        self.flushed = True
 
     def refresh(self, obj):
         now = dt.datetime.now(dt.timezone.utc)
@@ -49,9 +85,16 @@ class FakeSession:
     def rollback(self):
         self.rolled_back = True
 
-    def get(self, model, key):
+    def get(self, model, key, **_kwargs):
         return self._get_returns.get(key)
 
+    def query(self, *entities):
+        # query_rows が dict ならモデル（列指定ならその列のモデル）ごとに返す行を切り替える
+        if isinstance(self._query_rows, dict):
+            model = getattr(entities[0], "class_", entities[0])
+            return FakeQuery(self._query_rows.get(model, []))
+        return FakeQuery(self._query_rows)
+
     def delete(self, obj):
         self.deleted.append(obj)
 
@@ -66,19 +109,53 @@ class FakeBlob:
         # 実際のアップロードは行わない
         pass
 
-    def generate_signed_url(self, version, expiration, method):
-        # 予測可能な固定のURLを返す
-        return f"https://fake-signed-url.com/{self.name}?expires={expiration.total_seconds()}"
+    def generate_signed_url(self, version, expiration, method, credentials=None, content_type=None, headers=None):
+        # 予測可能な固定のURLを返す（署名に含めたヘッダは記録しておく）
+        self.signed_headers = headers
+        return f"https://fake-signed-url.com/{self.name}?expires={expiration.total_seconds()}&method={method}"
+
+    @property
+    def size(self):
+        return len(self.data) if getattr(self, "data", None) is not None else None
+
+    def open(self, mode, chunk_size=None, content_type=None):
+        if mode == "rb":
+            return io.BytesIO(self.data)
+        # 再開可能アップロード（BlobWriter）の代わりに書き込まれたバイト列を記録する
+        return FakeBlobWriter(self, chunk_size, content_type)
 
     def delete(self):
         # 削除されたことを記録
         self.deleted = True
 
 
+class FakeBlobWriter(io.BytesIO):
+    def __init__(self, blob, chunk_size, content_type):
+        super().__init__()
+        self.blob = blob
+        self.blob.chunk_size = chunk_size
+        self.blob.content_type = content_type
+
+    def close(self):
+        self.blob.data = self.getvalue()
+        super().close()
+
+
 # GCSのBucket（バケツ）操作の偽物
 class FakeBucket:
+    def __init__(self):
+        self.blobs = {}
+        self.deleted = []
+
     def blob(self, blob_name):
-        return FakeBlob(blob_name)
+        return self.blobs.setdefault(blob_name, FakeBlob(blob_name))
+
+    def get_blob(self, blob_name):
+        blob = self.blobs.get(blob_name)
+        return blob if blob is not None and getattr(blob, "data", None) is not None else None
+
+    def delete_blobs(self, blobs, on_error=None):
+        self.deleted.extend(b.name for b in blobs)
 
 
 # -------------------------------------------------------------
@@ -109,8 +186,11 @@ def patch_dependencies(monkeypatch):
     """
     # DB/GCSがNone判定に引っかからないよう、ダミーオブジェクトをセット
     monkeypatch.setattr(image_module, "engine", object())
+    monkeypatch.setattr(image_module, "adc_storage_client", object())
+    # 署名付きURLキャッシュはテスト間で共有しない
+    image_module._signed_url_cache.clear()
     monkeypatch.setattr(image_module, "adc_bucket", FakeBucket())
-    monkeypatch.setattr(image_module, "sa_bucket", FakeBucket())
+    monkeypatch.setattr(image_module, "sa_bucket", FakeBucket(), raising=False)
 
     # SessionLocal()が呼び出されたときに、我々のFakeSessionを返すように差し替える
     holder = SimpleNamespace(db_factory=None)
@@ -125,7 +205,7 @@ def patch_dependencies(monkeypatch):
     holder.adc_bucket = FakeBucket()
     holder.sa_bucket = FakeBucket()
     monkeypatch.setattr(image_module, "adc_bucket", holder.adc_bucket)
-    monkeypatch.setattr(image_module, "sa_bucket", holder.sa_bucket)
+    monkeypatch.setattr(image_module, "sa_bucket", holder.sa_bucket, raising=False)
 
     return holder
 
@@ -147,6 +227,342 @@ def test_save_image_success(patch_dependencies, sample_image_data):
     assert result["gcs_uri"].startswith("gs://")
 
 
+def test_save_image_upload_first_inserts_stored_row_in_one_commit(patch_dependencies, sample_image_data, monkeypatch):
+    """正常系: upload_first ではアップロード後に 'stored' の行を1回のコミットで作るケース"""
+    monkeypatch.setattr(image_module, "IMAGE_SAVE_MODE", "upload_first")
+    session = FakeSession()
+    patch_dependencies.db_factory = lambda: session
+
+    result = ImageService.save_image(**sample_image_data, dedup=False)
+
+    assert result["status"] == "stored"
+    assert result["created_at"]
+    assert session.commits == 1
+    assert not session.refreshed
+    (image,) = session.added
+    assert image.status == "stored"
+
+
+def test_save_image_pending_mode_commits_pending_row_first(patch_dependencies, sample_image_data, monkeypatch):
+    """正常系: pending モードでは先に 'pending' の行をコミットしてから 'stored' に更新するケース"""
+    monkeypatch.setattr(image_module, "IMAGE_SAVE_MODE", "pending")
+    session = FakeSession()
+    patch_dependencies.db_factory = lambda: session
+
+    result = ImageService.save_image(**sample_image_data, dedup=False)
+
+    assert result["status"] == "stored"
+    assert session.commits == 2
+    assert session.refreshed
+
+
+def test_save_image_upload_first_failure_discards_objects(patch_dependencies, sample_image_data, monkeypatch):
+    """異常系: upload_first で行の登録に失敗したら、'failed' の行は作らずにアップロード済みのオブジェクトを消すケース"""
+    monkeypatch.setattr(image_module, "IMAGE_SAVE_MODE", "upload_first")
+    sessions = []
+
+    def factory():
+        sessions.append(FakeSession(should_fail_on_commit=True))
+        return sessions[-1]
+
+    patch_dependencies.db_factory = factory
+
+    result = ImageService.save_image(**sample_image_data, dedup=False)
+
+    assert result is None
+    assert len(sessions) == 1
+    img_id = sessions[0].added[0].img_id
+    deleted = patch_dependencies.adc_bucket.deleted
+    assert f"images/{img_id}.jpg" in deleted
+    assert f"images/{img_id}/128.webp" in deleted
+
+
+def _jpeg_bytes(width: int, height: int) -> bytes:
+    buf = io.BytesIO()
+    PILImage.new("RGB", (width, height), (200, 120, 40)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_save_image_creates_renditions(patch_dependencies, monkeypatch):
+    """正常系: 保存時に元画像より小さいサイズのレンディションを生成してGCSとDBに記録するケース"""
+    uploaded = {}
+
+    def fake_upload(self, data, content_type):
+        uploaded[self.name] = (data, content_type)
+
+    monkeypatch.setattr(FakeBlob, "upload_from_string", fake_upload)
+    sessions = []
+
+    def factory():
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    patch_dependencies.db_factory = factory
+    result = ImageService.save_image(file_data=_jpeg_bytes(2000, 1000), mime_type="image/jpeg")
+
+    assert result["renditions"] == [1600, 512, 128]
+    renditions = [o for o in sessions[0].added if isinstance(o, image_module.ImageRendition)]
+    assert [(r.size, r.width, r.height) for r in renditions] == [(1600, 1600, 800), (512, 512, 256), (128, 128, 64)]
+    for r in renditions:
+        data, content_type = uploaded[f"images/{result['img_id']}/{r.size}.webp"]
+        assert content_type == "image/webp"
+        assert r.size_bytes == len(data)
+        with PILImage.open(io.BytesIO(data)) as im:
+            assert im.size == (r.width, r.height)
+
+
+@pytest.mark.parametrize(
+    "error", [PILImage.DecompressionBombError("too many pixels"), MemoryError(), RuntimeError("encoder error")]
+)
+def test_save_image_keeps_original_when_rendering_fails(patch_dependencies, monkeypatch, error):
+    """異常系: レンディションの生成が失敗しても、元画像は保存されるケース"""
+    data = _jpeg_bytes(2000, 1000)
+
+    def fail(*_args, **_kwargs):
+        raise error
+
+    monkeypatch.setattr(PILImage.Image, "save", fail)
+    sessions = []
+
+    def factory():
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    patch_dependencies.db_factory = factory
+    result = ImageService.save_image(file_data=data, mime_type="image/jpeg")
+
+    assert result is not None
+    assert result["renditions"] == []
+    assert any(isinstance(o, image_module.Image) for o in sessions[0].added)
+
+
+def test_save_image_keeps_original_when_decoding_is_refused(patch_dependencies, monkeypatch):
+    """異常系: 画素数が MAX_IMAGE_PIXELS を大きく超える画像はデコードせず、元画像だけ保存するケース"""
+    data = _jpeg_bytes(300, 200)
+    monkeypatch.setattr(PILImage, "MAX_IMAGE_PIXELS", 1000)
+    patch_dependencies.db_factory = lambda: FakeSession()
+    result = ImageService.save_image(file_data=data, mime_type="image/jpeg")
+
+    assert result is not None
+    assert result["renditions"] == []
+
+
+def test_save_image_skips_renditions_larger_than_original(patch_dependencies):
+    """正常系: 元画像以上のサイズのレンディションは作らないケース"""
+    patch_dependencies.db_factory = lambda: FakeSession()
+    result = ImageService.save_image(file_data=_jpeg_bytes(300, 200), mime_type="image/jpeg")
+
+    assert result["renditions"] == [128]
+
+
+def test_save_image_dedup_reuses_stored_image(patch_dependencies, sample_image_data, monkeypatch):
+    """正常系: 同じ内容の保存済み画像があればアップロードせず、参照カウントを増やして返すケース"""
+    existing = SimpleNamespace(
+        img_id=uuid.uuid4(),
+        gcs_uri="gs://fake-bucket/images/existing.jpg",
+        status="stored",
+        ref_count=1,
+        created_at=dt.datetime.now(dt.timezone.utc),
+    )
+    session = FakeSession(
+        query_rows={
+            image_module.Image: [existing],
+            image_module.ImageRendition: [SimpleNamespace(size=128), SimpleNamespace(size=512)],
+        }
+    )
+    patch_dependencies.db_factory = lambda: session
+    uploads = []
+    monkeypatch.setattr(FakeBlob, "upload_from_string", lambda self, *a, **k: uploads.append(self.name))
+
+    result = ImageService.save_image(**sample_image_data, dedup=True)
+
+    assert result["img_id"] == str(existing.img_id)
+    assert result["deduplicated"] is True
+    assert result["renditions"] == [512, 128]
+    assert existing.ref_count == 2
+    assert session.committed
+    assert session.added == []
+    assert uploads == []
+
+
+def test_save_image_without_dedup_uploads_new_image(patch_dependencies, sample_image_data):
+    """正常系: dedup=False なら同じ内容の画像があっても新しく保存するケース"""
+    existing = SimpleNamespace(img_id=uuid.uuid4(), status="stored", ref_count=1)
+    patch_dependencies.db_factory = lambda: FakeSession(query_rows={image_module.Image: [existing]})
+
+    result = ImageService.save_image(**sample_image_data, dedup=False)
+
+    assert result["img_id"] != str(existing.img_id)
+    assert result["deduplicated"] is False
+    assert existing.ref_count == 1
+
+
+class ChunkRecordingStream(io.BytesIO):
+    """read() に渡されたサイズを記録するストリーム"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.read_sizes = []
+
+    def read(self, size=-1):
+        self.read_sizes.append(size)
+        return super().read(size)
+
+
+def test_save_image_stream_uploads_in_chunks(patch_dependencies, monkeypatch):
+    """正常系: ストリームをチャンク単位で読みながらハッシュ計算とアップロードを行うケース"""
+    monkeypatch.setattr(image_module, "UPLOAD_CHUNK_SIZE", 4096)
+    data = _jpeg_bytes(800, 600)
+    stream = ChunkRecordingStream(data)
+    session = FakeSession()
+    patch_dependencies.db_factory = lambda: session
+
+    # 申告 MIME が誤っていても先頭チャンクから判定する
+    result = ImageService.save_image_stream(stream, mime_type="application/octet-stream", dedup=False)
+
+    assert result["status"] == "stored"
+    assert result["renditions"] == [512, 128]
+    assert set(stream.read_sizes) == {4096}
+    image = session.added[0]
+    assert image.mime_type == "image/jpeg"
+    assert image.size_bytes == len(data)
+    assert image.sha256_hex == hashlib.sha256(data).hexdigest()
+    blob = patch_dependencies.adc_bucket.blobs[f"images/{result['img_id']}.jpg"]
+    assert blob.data == data
+    assert blob.content_type == "image/jpeg"
+
+
+def test_save_image_stream_rejects_non_image(patch_dependencies):
+    """異常系: 先頭チャンクが画像でなければ ValueError を送出するケース"""
+    patch_dependencies.db_factory = lambda: FakeSession()
+    with pytest.raises(ValueError):
+        ImageService.save_image_stream(io.BytesIO(b"%PDF-1.4 not an image"), mime_type="image/jpeg")
+    with pytest.raises(ValueError):
+        ImageService.save_image_stream(io.BytesIO(b""), mime_type="image/jpeg")
+
+
+@pytest.mark.parametrize("save_mode", ["upload_first", "pending"])
+def test_save_image_stream_dedup_discards_uploaded_object(patch_dependencies, monkeypatch, save_mode):
+    """正常系: アップロード後に同じ内容の画像が見つかれば、アップロードしたオブジェクトと仮レコードを破棄するケース"""
+    monkeypatch.setattr(image_module, "IMAGE_SAVE_MODE", save_mode)
+    existing = SimpleNamespace(
+        img_id=uuid.uuid4(),
+        gcs_uri="gs://fake-bucket/images/existing.jpg",
+        status="stored",
+        ref_count=1,
+        created_at=dt.datetime.now(dt.timezone.utc),
+    )
+    session = FakeSession(query_rows={image_module.Image: [existing]})
+    patch_dependencies.db_factory = lambda: session
+
+    result = ImageService.save_image_stream(io.BytesIO(_jpeg_bytes(64, 64)), dedup=True)
+
+    assert result["img_id"] == str(existing.img_id)
+    assert result["deduplicated"] is True
+    assert existing.ref_count == 2
+    assert session.commits == (2 if save_mode == "pending" else 1)
+    # upload_first では仮レコードを INSERT していないので消すものも無い
+    assert session.deleted == session.added
+    (uploaded,) = [b for b in patch_dependencies.adc_bucket.blobs.values() if getattr(b, "data", None) is not None]
+    assert uploaded.deleted
+
+
+# --- 署名付き URL による直接アップロードのテスト ---
+def test_create_upload_url_records_pending_image(patch_dependencies):
+    """正常系: 申告値を 'pending' で記録し、署名付き PUT URL を返すケース"""
+    session = FakeSession()
+    patch_dependencies.db_factory = lambda: session
+
+    result = ImageService.create_upload_url("image/png", 1234, "AB" * 32)
+
+    image = session.added[0]
+    assert result["img_id"] == str(image.img_id)
+    assert result["method"] == "PUT"
+    assert result["headers"] == {"Content-Type": "image/png", "x-goog-content-length-range": "0,1234"}
+    assert "method=PUT" in result["upload_url"]
+    assert (image.status, image.size_bytes, image.sha256_hex) == ("pending", 1234, "ab" * 32)
+    assert image.gcs_uri.endswith(f"images/{image.img_id}.png")
+    # 申告サイズを超える PUT を GCS に拒否させるため、上限のヘッダを署名に含める
+    signed = patch_dependencies.adc_bucket.blobs[f"images/{image.img_id}.png"]
+    assert signed.signed_headers == {"x-goog-content-length-range": "0,1234"}
+
+
+@pytest.mark.parametrize(
+    "args",
+    [("text/plain", 10, None), ("image/png", 0, None), ("image/png", 10**12, None), ("image/png", 10, "xyz")],
+)
+def test_create_upload_url_invalid_input(patch_dependencies, args):
+    """異常系: MIME・サイズ・ハッシュが不正なら ValueError を送出するケース"""
+    patch_dependencies.db_factory = lambda: FakeSession()
+    with pytest.raises(ValueError):
+        ImageService.create_upload_url(*args)
+
+
+def _pending_upload(patch_dependencies, data, *, declared_size=None, declared_sha=""):
+    img_id = uuid.uuid4()
+    object_name = f"images/{img_id}.jpg"
+    pending = SimpleNamespace(
+        img_id=img_id,
+        gcs_uri=f"gs://{image_module.GCS_BUCKET}/{object_name}",
+        mime_type="image/jpeg",
+        size_bytes=len(data) if declared_size is None else declared_size,
+        sha256_hex=declared_sha,
+        status="pending",
+        ref_count=1,
+        created_at=dt.datetime.now(dt.timezone.utc),
+    )
+    patch_dependencies.adc_bucket.blob(object_name).data = data
+    session = FakeSession(get_returns={img_id: pending})
+    patch_dependencies.db_factory = lambda: session
+    return pending, session
+
+
+def test_finalize_upload_verifies_and_stores(patch_dependencies):
+    """正常系: アップロード済みオブジェクトのサイズ・ハッシュを照合して 'stored' にするケース"""
+    data = _jpeg_bytes(600, 400)
+    pending, session = _pending_upload(patch_dependencies, data, declared_sha=hashlib.sha256(data).hexdigest())
+
+    result = ImageService.finalize_upload(pending.img_id, dedup=False)
+
+    assert result["status"] == "stored"
+    assert result["renditions"] == [512, 128]
+    assert pending.status == "stored"
+    assert pending.sha256_hex == hashlib.sha256(data).hexdigest()
+
+
+def test_finalize_upload_rejects_hash_mismatch(patch_dependencies):
+    """異常系: SHA-256 が申告値と異なれば 'failed' にしてオブジェクトを削除するケース"""
+    data = _jpeg_bytes(64, 64)
+    pending, _ = _pending_upload(patch_dependencies, data, declared_sha="0" * 64)
+
+    with pytest.raises(ValueError):
+        ImageService.finalize_upload(pending.img_id)
+
+    assert pending.status == "failed"
+    assert patch_dependencies.adc_bucket.blobs[ImageService._object_name(pending.gcs_uri)].deleted
+
+
+def test_finalize_upload_rejects_size_mismatch_without_download(patch_dependencies, monkeypatch):
+    """異常系: メタデータのサイズが申告値と異なればダウンロードせずに失敗させるケース"""
+    pending, _ = _pending_upload(patch_dependencies, _jpeg_bytes(64, 64), declared_size=1)
+    monkeypatch.setattr(FakeBlob, "open", lambda *a, **k: pytest.fail("should not download"))
+
+    with pytest.raises(ValueError):
+        ImageService.finalize_upload(pending.img_id)
+    assert pending.status == "failed"
+
+
+def test_finalize_upload_before_put_raises(patch_dependencies):
+    """異常系: まだアップロードされていなければ ValueError で、'pending' のまま残すケース"""
+    img_id = uuid.uuid4()
+    pending = SimpleNamespace(img_id=img_id, gcs_uri=f"gs://fake-bucket/images/{img_id}.jpg", status="pending")
+    patch_dependencies.db_factory = lambda: FakeSession(get_returns={img_id: pending})
+
+    with pytest.raises(ValueError):
+        ImageService.finalize_upload(img_id)
+    assert pending.status == "pending"
+
+
 def test_save_image_db_failure_returns_none(patch_dependencies, sample_image_data):
     """異常系: DBへのコミットが失敗し、Noneが返るケース"""
     patch_dependencies.db_factory = lambda: FakeSession(should_fail_on_commit=True)
@@ -199,6 +615,43 @@ def test_get_image_found(patch_dependencies, sample_img_id):
     assert result["signed_url"].startswith("https://fake-signed-url.com/")
 
 
+def test_get_image_with_size_returns_rendition(patch_dependencies, sample_img_id):
+    """正常系: size 指定時はレンディションの署名付きURLを返し、無いサイズは元画像にフォールバックするケース"""
+    found_image = SimpleNamespace(
+        img_id=sample_img_id,
+        gcs_uri=f"gs://fake-bucket/images/{sample_img_id}.jpg",
+        mime_type="image/jpeg",
+        size_bytes=12345,
+        status="stored",
+        created_at=dt.datetime.now(dt.timezone.utc),
+    )
+    rendition = SimpleNamespace(
+        size=128,
+        gcs_uri=f"gs://fake-bucket/images/{sample_img_id}/128.webp",
+        mime_type="image/webp",
+        width=128,
+        height=96,
+        size_bytes=2048,
+    )
+    patch_dependencies.db_factory = lambda: FakeSession(
+        get_returns={sample_img_id: found_image, (sample_img_id, 128): rendition}
+    )
+
+    thumb = ImageService.get_image(sample_img_id, size=128)
+    assert thumb["signed_url"].split("?")[0].endswith(f"{sample_img_id}/128.webp")
+    assert thumb["rendition"] == {
+        "size": 128,
+        "mime_type": "image/webp",
+        "width": 128,
+        "height": 96,
+        "size_bytes": 2048,
+    }
+
+    fallback = ImageService.get_image(sample_img_id, size=512)
+    assert fallback["signed_url"].split("?")[0].endswith(f"{sample_img_id}.jpg")
+    assert "rendition" not in fallback
+
+
 def test_get_image_not_found(patch_dependencies, sample_img_id):
     """異常系: 指定したIDの画像がDBに存在せず、Noneが返るケース"""
     patch_dependencies.db_factory = lambda: FakeSession(get_returns={})  # 空の辞書を返す
@@ -216,10 +669,167 @@ def test_get_image_status_not_stored_returns_none(patch_dependencies, sample_img
     assert result is None
 
 
+def test_get_image_reuses_cached_signed_url(patch_dependencies, sample_img_id, monkeypatch):
+    """正常系: 同じ画像の2回目以降は署名を行わずキャッシュ済みURLを返すケース"""
+    found_image = SimpleNamespace(
+        img_id=sample_img_id,
+        gcs_uri=f"gs://fake-bucket/images/{sample_img_id}.jpg",
+        mime_type="image/jpeg",
+        size_bytes=12345,
+        status="stored",
+        created_at=dt.datetime.now(dt.timezone.utc),
+    )
+    patch_dependencies.db_factory = lambda: FakeSession(get_returns={sample_img_id: found_image})
+    calls = []
+    original = FakeBlob.generate_signed_url
+
+    def counting_sign(self, *args, **kwargs):
+        calls.append(self.name)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeBlob, "generate_signed_url", counting_sign)
+
+    before = ImageService.signed_url_cache_stats()
+    first = ImageService.get_image(sample_img_id)
+    second = ImageService.get_image(sample_img_id)
+    after = ImageService.signed_url_cache_stats()
+
+    assert first["signed_url"] == second["signed_url"]
+    assert len(calls) == 1
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+
+
+# --- get_images のテスト ---
+def test_get_images_returns_map_keyed_by_id(patch_dependencies):
+    """正常系: 複数の画像を1回のクエリで取得し、img_id をキーにした dict で返るケース"""
+    ids = [uuid.uuid4(), uuid.uuid4()]
+    rows = [
+        SimpleNamespace(
+            img_id=i,
+            gcs_uri=f"gs://fake-bucket/images/{i}.jpg",
+            mime_type="image/jpeg",
+            size_bytes=100,
+            status="stored",
+            created_at=dt.datetime.now(dt.timezone.utc),
+        )
+        for i in ids
+    ]
+    sessions = []
+
+    def factory():
+        sessions.append(FakeSession(query_rows=rows))
+        return sessions[-1]
+
+    patch_dependencies.db_factory = factory
+    result = ImageService.get_images(ids + [ids[0]])
+
+    assert set(result) == {str(i) for i in ids}
+    assert all(r["signed_url"].startswith("https://fake-signed-url.com/") for r in result.values())
+    assert len(sessions) == 1
+
+
+def test_get_images_signs_concurrently_with_remote_signer(patch_dependencies, monkeypatch):
+    """正常系: IAM サイナー（リモート署名）の場合はスレッドプールで署名するケース"""
+    ids = [uuid.uuid4(), uuid.uuid4()]
+    rows = [
+        SimpleNamespace(
+            img_id=i,
+            gcs_uri=f"gs://fake-bucket/images/{i}.jpg",
+            mime_type="image/jpeg",
+            size_bytes=100,
+            status="stored",
+            created_at=dt.datetime.now(dt.timezone.utc),
+        )
+        for i in ids
+    ]
+    mapped = []
+
+    class FakeExecutor:
+        def map(self, fn, items):
+            mapped.extend(items)
+            return [fn(x) for x in items]
+
+    monkeypatch.setattr(image_module, "_signs_locally", lambda _creds: False)
+    monkeypatch.setattr(image_module, "_sign_executor", FakeExecutor())
+    patch_dependencies.db_factory = lambda: FakeSession(query_rows=rows)
+
+    result = ImageService.get_images(ids)
+
+    assert len(result) == 2
+    assert [m.rsplit("/", 1)[-1] for m in mapped] == [f"{i}.jpg" for i in ids]
+
+
+def test_get_images_with_size_uses_joined_rendition(patch_dependencies):
+    """正常系: size 指定の一括取得で、結合したレンディションがあればそのURLを返すケース"""
+    with_thumb, without_thumb = uuid.uuid4(), uuid.uuid4()
+    now = dt.datetime.now(dt.timezone.utc)
+    base = dict(mime_type="image/jpeg", size_bytes=100, status="stored", created_at=now)
+    rows = [
+        SimpleNamespace(
+            img_id=with_thumb,
+            gcs_uri=f"gs://fake-bucket/images/{with_thumb}.jpg",
+            rendition_gcs_uri=f"gs://fake-bucket/images/{with_thumb}/128.webp",
+            rendition_mime_type="image/webp",
+            rendition_width=128,
+            rendition_height=128,
+            rendition_size_bytes=10,
+            **base,
+        ),
+        SimpleNamespace(
+            img_id=without_thumb,
+            gcs_uri=f"gs://fake-bucket/images/{without_thumb}.jpg",
+            rendition_gcs_uri=None,
+            rendition_mime_type=None,
+            rendition_width=None,
+            rendition_height=None,
+            rendition_size_bytes=None,
+            **base,
+        ),
+    ]
+    patch_dependencies.db_factory = lambda: FakeSession(query_rows=rows)
+
+    result = ImageService.get_images([with_thumb, without_thumb], size=128)
+
+    assert result[str(with_thumb)]["signed_url"].split("?")[0].endswith("128.webp")
+    assert result[str(with_thumb)]["rendition"]["size"] == 128
+    assert result[str(without_thumb)]["signed_url"].split("?")[0].endswith(".jpg")
+    assert "rendition" not in result[str(without_thumb)]
+
+
+def test_get_images_empty_skips_db(patch_dependencies):
+    """正常系: 空のリストなら DB にアクセスせず空の dict を返すケース"""
+    assert ImageService.get_images([]) == {}
+
+
+def test_attach_signed_urls_signs_each_object_once(patch_dependencies, monkeypatch):
+    """正常系: 投稿に結合済みの画像へ署名付きURLを付け、同じ画像は1回だけ署名するケース"""
+    signed = []
+    original = ImageService._sign_url
+
+    def counting_sign_url(object_name, method="GET"):
+        signed.append(object_name)
+        return original(object_name, method)
+
+    monkeypatch.setattr(ImageService, "_sign_url", staticmethod(counting_sign_url))
+    img_id = uuid.uuid4()
+    image = {"img_id": str(img_id), "gcs_uri": f"gs://fake-bucket/images/{img_id}.jpg", "mime_type": "image/jpeg"}
+    posts = [{"post_id": "a", "image": image}, {"post_id": "b", "image": dict(image)}, {"post_id": "c", "image": None}]
+
+    ImageService.attach_signed_urls(posts)
+
+    assert posts[0]["image"]["signed_url"].startswith("https://fake-signed-url.com/")
+    assert posts[1]["image"]["signed_url"] == posts[0]["image"]["signed_url"]
+    assert posts[2]["image"] is None
+    assert len(signed) == 1
+
+
 # --- delete_image のテスト ---
 def test_delete_image_success(patch_dependencies, sample_img_id):
     """正常系: 画像の削除が成功し、Trueが返るケース"""
-    existing_image = SimpleNamespace(img_id=sample_img_id, gcs_uri=f"gs://fake-bucket/images/{sample_img_id}.jpg")
+    existing_image = SimpleNamespace(
+        img_id=sample_img_id, gcs_uri=f"gs://fake-bucket/images/{sample_img_id}.jpg", ref_count=1
+    )
     patch_dependencies.db_factory = lambda: FakeSession(get_returns={sample_img_id: existing_image})
 
     ok = ImageService.delete_image(sample_img_id)
@@ -227,6 +837,25 @@ def test_delete_image_success(patch_dependencies, sample_img_id):
     assert ok is True
 
 
+def test_delete_shared_image_only_releases_reference(patch_dependencies, sample_img_id, monkeypatch):
+    """正常系: 重複排除で共有中の画像は参照カウントを減らすだけで、GCS とレコードは残すケース"""
+    shared_image = SimpleNamespace(
+        img_id=sample_img_id, gcs_uri=f"gs://fake-bucket/images/{sample_img_id}.jpg", ref_count=2
+    )
+    session = FakeSession(get_returns={sample_img_id: shared_image})
+    patch_dependencies.db_factory = lambda: session
+    deleted_blobs = []
+    monkeypatch.setattr(FakeBlob, "delete", lambda self: deleted_blobs.append(self.name))
+
+    ok = ImageService.delete_image(sample_img_id)
+
+    assert ok is True
+    assert shared_image.ref_count == 1
+    assert session.committed
+    assert session.deleted == []
+    assert deleted_blobs == []
+
+
 def test_delete_image_not_found_returns_false(patch_dependencies, sample_img_id):
     """異常系: 削除対象の画像が存在せず、Falseが返るケース"""
     patch_dependencies.db_factory = lambda: FakeSession(get_returns={})
@@ -0,0 +1,145 @@
+import datetime as dt
+import uuid
+from types import SimpleNamespace
+
+import pytest
+import src.services.image.reap_images as reap_module
+from src.services.image.reap_images import ReapStats, img_id_of, reap_dead_rows, reap_orphan_objects
+
+NOW = dt.datetime(2025, 9, 20, tzinfo=dt.timezone.utc)
+CUTOFF = NOW - dt.timedelta(hours=24)
+
+
+# ----------------------------
+# ヘルパ: フェイク Session / Bucket / Client
+# ----------------------------
+class FakeQuery:
+    def __init__(self, pages):
+        self._pages = pages
+
+    def filter(self, *_args, **_kwargs):
+        return self
+
+    def order_by(self, *_args, **_kwargs):
+        return self
+
+    def limit(self, *_args, **_kwargs):
+        return self
+
+    def all(self):
+        return self._pages.pop(0) if self._pages else []
+
+
+class FakeSession:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def query(self, *_entities):
+        return FakeQuery(self.db.query_pages)
+
+    def execute(self, _stmt):
+        # DELETE ... RETURNING: 実際に削除できた行（確定済みの行は除かれる想定）を返す
+        deleted = self.db.delete_returns.pop(0)
+        return SimpleNamespace(all=lambda: deleted)
+
+    def commit(self):
+        self.db.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class FakeBucket:
+    def __init__(self):
+        self.deleted = []
+
+    def blob(self, name):
+        return SimpleNamespace(name=name)
+
+    def delete_blobs(self, blobs, on_error=None):
+        self.deleted.extend(b.name for b in blobs)
+
+
+class FakeClient:
+    def __init__(self, pages):
+        self._pages = pages
+
+    def list_blobs(self, bucket, prefix, page_size):
+        return SimpleNamespace(pages=self._pages)
+
+
+@pytest.fixture
+def fake_env(monkeypatch):
+    db = SimpleNamespace(query_pages=[], delete_returns=[], commits=0)
+    bucket = FakeBucket()
+    monkeypatch.setattr(reap_module, "SessionLocal", lambda: FakeSession(db))
+    monkeypatch.setattr(reap_module, "adc_bucket", bucket)
+    return SimpleNamespace(db=db, bucket=bucket)
+
+
+def _blob(name, *, age_hours=48, size=10):
+    return SimpleNamespace(name=name, time_created=NOW - dt.timedelta(hours=age_hours), size=size)
+
+
+# ----------------------------
+# テストケース
+# ----------------------------
+def test_img_id_of():
+    img_id = uuid.uuid4()
+    assert img_id_of(f"images/{img_id}.jpg") == img_id
+    assert img_id_of(f"images/{img_id}/128.webp") == img_id
+    assert img_id_of("metadata/metadata.jsonl") is None
+    assert img_id_of("images/not-a-uuid.jpg") is None
+
+
+def test_reap_dead_rows_pages_and_deletes_only_returned_rows(fake_env):
+    ids = [uuid.uuid4() for _ in range(3)]
+    rows = [SimpleNamespace(img_id=i, gcs_uri=f"gs://{reap_module.GCS_BUCKET}/images/{i}.jpg") for i in ids]
+    fake_env.db.query_pages = [rows[:2], rows[2:]]
+    # 1ページ目の2件目は取得後に確定されたため削除されなかった想定
+    fake_env.db.delete_returns = [[rows[0]], [rows[2]]]
+    stats = ReapStats()
+
+    reap_dead_rows(CUTOFF, batch_size=2, dry_run=False, stats=stats)
+
+    assert (stats.rows_scanned, stats.rows_deleted) == (3, 2)
+    assert fake_env.bucket.deleted == [f"images/{ids[0]}.jpg", f"images/{ids[2]}.jpg"]
+    assert fake_env.db.commits == 2
+
+
+def test_reap_dead_rows_dry_run_deletes_nothing(fake_env):
+    rows = [SimpleNamespace(img_id=uuid.uuid4(), gcs_uri="gs://b/images/x.jpg")]
+    fake_env.db.query_pages = [rows]
+    stats = ReapStats(dry_run=True)
+
+    reap_dead_rows(CUTOFF, batch_size=10, dry_run=True, stats=stats)
+
+    assert stats.rows_deleted == 1
+    assert fake_env.bucket.deleted == []
+    assert fake_env.db.commits == 0
+
+
+@pytest.mark.parametrize("dry_run", [False, True])
+def test_reap_orphan_objects(fake_env, monkeypatch, dry_run):
+    kept, orphan, recent = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    pages = [
+        [_blob(f"images/{kept}.jpg"), _blob(f"images/{orphan}.jpg", size=100)],
+        [_blob(f"images/{orphan}/128.webp", size=5), _blob(f"images/{recent}.jpg", age_hours=1), _blob("images/x")],
+    ]
+    monkeypatch.setattr(reap_module, "adc_storage_client", FakeClient(pages))
+    # 行が残っているのは kept だけ
+    fake_env.db.query_pages = [[SimpleNamespace(img_id=kept)], []]
+    stats = ReapStats(dry_run=dry_run)
+
+    reap_orphan_objects(CUTOFF, batch_size=2, dry_run=dry_run, stats=stats)
+
+    assert stats.objects_scanned == 5
+    assert (stats.objects_deleted, stats.bytes_freed) == (2, 105)
+    expected = [] if dry_run else [f"images/{orphan}.jpg", f"images/{orphan}/128.webp"]
+    assert fake_env.bucket.deleted == expected
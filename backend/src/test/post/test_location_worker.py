@@ -0,0 +1,222 @@
+import uuid
+
+import pytest
+import src.routes.post_route as post_route
+from flask import Flask
+from src.services.post.location_worker import LOCATION_PENDING, LOCATION_UNKNOWN, LocationWorker, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeStore:
+    """post_location_claims の代わり: 予約中・再試行待ちの投稿は claim で返さない"""
+
+    def __init__(self, n):
+        self.rows = [
+            {"post_id": uuid.uuid4(), "latitude": 43.0 + i, "longitude": 141.0, "location": LOCATION_PENDING}
+            for i in range(n)
+        ]
+        self.attempts = {}
+        self.waiting = set()
+        self.completes = []
+
+    def claim(self, limit, lease_seconds):
+        rows = [r for r in self.rows if r["location"] == LOCATION_PENDING and r["post_id"] not in self.waiting]
+        out = []
+        for r in rows[:limit]:
+            self.attempts[r["post_id"]] = self.attempts.get(r["post_id"], 0) + 1
+            self.waiting.add(r["post_id"])
+            out.append((r["post_id"], r["latitude"], r["longitude"], self.attempts[r["post_id"]]))
+        return out
+
+    def complete(self, locations, retry_ids, retry_seconds):
+        self.completes.append((dict(locations), list(retry_ids)))
+        for r in self.rows:
+            if r["post_id"] in locations:
+                r["location"] = locations[r["post_id"]]
+                self.waiting.discard(r["post_id"])
+
+    def expire_retries(self):
+        self.waiting.clear()
+
+
+def _worker(store, reverse, batch_size=10, max_attempts=2):
+    clock = FakeClock()
+    bucket = TokenBucket(rate=100, capacity=100, clock=clock, sleep=clock.sleep)
+    return LocationWorker(
+        reverse, bucket, batch_size=batch_size, poll_seconds=0.01, max_attempts=max_attempts, store=store
+    )
+
+
+def test_token_bucket_allows_burst_then_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_token_bucket_rejects_invalid_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0, capacity=1)
+
+
+def test_run_once_writes_batch_in_one_call():
+    store = FakeStore(3)
+    worker = _worker(store, lambda lat, lon: f"addr {lat:.0f}")
+
+    assert worker.run_once() == 3
+    assert [r["location"] for r in store.rows] == ["addr 43", "addr 44", "addr 45"]
+    assert len(store.completes) == 1
+
+
+def test_failed_lookup_is_retried_then_marked_unknown():
+    store = FakeStore(2)
+    worker = _worker(store, lambda lat, lon: "札幌" if lat < 43.5 else None, max_attempts=2)
+
+    assert worker.run_once() == 1
+    assert store.rows[0]["location"] == "札幌"
+    assert store.rows[1]["location"] == LOCATION_PENDING
+    assert store.completes[-1][1] == [store.rows[1]["post_id"]]
+    # 再試行待ちの間は予約されない
+    assert worker.run_once() == 0
+
+    store.expire_retries()
+    assert worker.run_once() == 1
+    assert store.rows[1]["location"] == LOCATION_UNKNOWN
+
+
+def test_invalid_coordinates_are_marked_unknown_immediately():
+    store = FakeStore(1)
+
+    def reverse(_lat, _lon):
+        raise ValueError("緯度経度が範囲外です")
+
+    worker = _worker(store, reverse)
+    assert worker.run_once() == 1
+    assert store.rows[0]["location"] == LOCATION_UNKNOWN
+
+
+def test_drain_processes_every_batch_and_stops_when_nothing_is_claimable():
+    store = FakeStore(5)
+    worker = _worker(store, lambda lat, lon: "札幌" if lat < 46.5 else None, batch_size=2)
+
+    assert worker.drain() == 4
+    assert store.rows[4]["location"] == LOCATION_PENDING
+    assert len(store.completes) == 3
+
+
+def test_workers_sharing_a_store_do_not_geocode_the_same_post_twice():
+    store = FakeStore(4)
+    calls = []
+
+    def reverse(lat, lon):
+        calls.append(lat)
+        return "札幌"
+
+    first, second = _worker(store, reverse, batch_size=2), _worker(store, reverse, batch_size=2)
+    assert first.run_once() + second.run_once() == 4
+    assert sorted(calls) == [43.0, 44.0, 45.0, 46.0]
+
+
+class LeaseStore(FakeStore):
+    """予約の期限を clock で管理する FakeStore（期限切れの予約は別のワーカーが引き直せる）"""
+
+    def __init__(self, n, clock):
+        super().__init__(n)
+        self.clock = clock
+        self.until = {}
+        self.extends = []
+
+    def claim(self, limit, lease_seconds):
+        now = self.clock()
+        rows = [
+            r
+            for r in self.rows
+            if r["location"] == LOCATION_PENDING and self.until.get(r["post_id"], float("-inf")) < now
+        ]
+        for r in rows[:limit]:
+            self.until[r["post_id"]] = now + lease_seconds
+        return [(r["post_id"], r["latitude"], r["longitude"], 1) for r in rows[:limit]]
+
+    def extend(self, post_ids, lease_seconds):
+        self.extends.append(list(post_ids))
+        for post_id in post_ids:
+            self.until[post_id] = self.clock() + lease_seconds
+
+    def complete(self, locations, retry_ids, retry_seconds):
+        for r in self.rows:
+            if r["post_id"] in locations:
+                r["location"] = locations[r["post_id"]]
+
+
+def test_claim_is_not_reissued_while_a_slow_batch_is_still_being_worked():
+    # 共有の Nominatim の枠待ちで1件に 40 秒かかっても、処理中の予約を延ばすので他のワーカーは同じ投稿を引かない
+    clock = FakeClock()
+    store = LeaseStore(4, clock)
+    stolen = []
+
+    def slow_reverse(lat, lon):
+        clock.now += 40
+        stolen.extend(store.claim(10, 60))
+        return "札幌"
+
+    bucket = TokenBucket(rate=100, capacity=100, clock=clock, sleep=clock.sleep)
+    worker = LocationWorker(
+        slow_reverse, bucket, batch_size=4, poll_seconds=1, max_attempts=2, store=store, clock=clock
+    )
+
+    assert worker.run_once() == 4
+    assert stolen == []
+    assert store.extends
+
+
+def test_create_post_deferred_saves_placeholder_without_geocoding(monkeypatch: pytest.MonkeyPatch):
+    captured = {}
+    notified = []
+
+    def fake_create_post(**kwargs):
+        captured.update(kwargs)
+        return {"post_id": str(kwargs["post_id"]), "location": kwargs["location"]}
+
+    def fail_geocode(*_args):
+        raise AssertionError("deferred モードではリクエスト中に逆ジオコーディングしない")
+
+    monkeypatch.setattr(post_route, "POST_GEOCODE_MODE", "deferred")
+    monkeypatch.setattr(post_route, "_reverse_geocode", fail_geocode)
+    monkeypatch.setattr(post_route.PostService, "create_post", staticmethod(fake_create_post))
+    monkeypatch.setattr(post_route.location_worker, "notify", lambda: notified.append(True))
+
+    app = Flask(__name__)
+    app.register_blueprint(post_route.post_bp)
+    r = app.test_client().post(
+        "/api/posts",
+        json={
+            "user_id": "u1",
+            "img_id": str(uuid.uuid4()),
+            "user_question": "これは？",
+            "object_label": "木",
+            "ai_answer": "ハルニレです",
+            "ai_question": "何科？",
+            "latitude": 43.07,
+            "longitude": 141.34,
+        },
+    )
+
+    assert r.status_code == 201
+    assert captured["location"] == LOCATION_PENDING
+    assert notified == [True]
@@ -6,6 +6,7 @@ import pytest
 
 # ここが重要：ファイルモジュールを直接 import
 import src.services.post.post as post_module
+from sqlalchemy.dialects import postgresql
 from src.services.post.post import PostService
 
 
@@ -13,13 +14,22 @@ from src.services.post.post import PostService
 # ヘルパ: フェイク Session/Query
 # ----------------------------
 class FakeQuery:
-    def __init__(self, rows):
+    def __init__(self, rows, entities=()):
         self._rows = rows
+        self.entities = entities
+        # 組み立てられた WHERE / ORDER BY 句（_sql でコンパイルして検証する）
+        self.filters = []
+        self.orders = []
 
-    def order_by(self, *_args, **_kwargs):
+    def order_by(self, *args, **_kwargs):
+        self.orders.extend(args)
+        return self
+
+    def outerjoin(self, *_args, **_kwargs):
         return self
 
     def filter(self, *args, **_kwargs):
+        self.filters.extend(args)
         # TODO: 文字列ではなく直接取れるようになりたい
         # 簡易解釈: SQLAlchemy式の文字列表現から is_public = true を検知してフィルタ
         key = " ".join(str(a).lower() for a in args)
@@ -36,6 +46,9 @@ class FakeQuery:
     def all(self):
         return self._rows
 
+    def one_or_none(self):
+        return self._rows[0] if self._rows else None
+
 
 class FakeSession:
     def __init__(self, *, get_returns=None, query_rows=None, should_fail_on_commit=False):
@@ -49,6 +62,7 @@ class FakeSession:
         self._get_returns = get_returns  # dict[uuid.UUID -> obj or None]
         self._query_rows = query_rows or []
         self._should_fail_on_commit = should_fail_on_commit
+        self.queries = []
 
     def __enter__(self):
         return self
@@ -81,13 +95,20 @@ class FakeSession:
             return None
         return self._get_returns.get(key)
 
-    def query(self, model):
-        return FakeQuery(self._query_rows)
+    def query(self, *entities):
+        # Post エンティティでも列の射影でも、行は属性アクセスできる SimpleNamespace を返す
+        self.queries.append(FakeQuery(self._query_rows, entities))
+        return self.queries[-1]
 
     def delete(self, obj):
         self.deleted.append(obj)
 
 
+def _sql(clause):
+    """SQLAlchemy の式を PostgreSQL 方言でコンパイルした SQL 文字列にする"""
+    return str(clause.compile(dialect=postgresql.dialect()))
+
+
 # ----------------------------
 # 共通フィクスチャ: UUID/ペイロード
 # ----------------------------
@@ -116,6 +137,30 @@ def sample_payload(sample_ids):
     )
 
 
+def _row(**overrides):
+    """posts の全列を持つ行（SimpleNamespace）。必要な列だけ overrides で差し替える"""
+    now = dt.datetime.now(dt.timezone.utc)
+    values = dict(
+        post_id=uuid.uuid4(),
+        user_id="string_type_user_id",
+        img_id=uuid.uuid4(),
+        user_question="Q",
+        object_label="TGT",
+        ai_answer="ANS",
+        ai_question="TOI",
+        ai_reference=None,
+        location="札幌市 中央区",
+        latitude=43.068,
+        longitude=141.35,
+        is_public=False,
+        post_rarity=0,
+        date=now,
+        updated_at=now,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
 # ----------------------------
 # モンキーパッチ: SessionLocal / engine
 # ----------------------------
@@ -174,23 +219,7 @@ def test_create_post_raises_when_session_not_ready(monkeypatch, sample_payload):
 # get_post
 # ----------------------------
 def test_get_post_found(patch_session_engine, sample_payload):
-    found = SimpleNamespace(
-        post_id=sample_payload["post_id"],
-        user_id=sample_payload["user_id"],  # string_type_user_id
-        img_id=sample_payload["img_id"],
-        user_question="Q",
-        object_label="TGT",
-        ai_answer="ANS",
-        ai_question="TOI",
-        ai_reference=None,
-        location="札幌市 中央区",
-        latitude=43.068,
-        longitude=141.35,
-        is_public=False,
-        post_rarity=0,
-        date=dt.datetime.now(dt.timezone.utc),
-        updated_at=dt.datetime.now(dt.timezone.utc),
-    )
+    found = _row(post_id=sample_payload["post_id"], user_id=sample_payload["user_id"], img_id=sample_payload["img_id"])
     patch_session_engine.factory = lambda: FakeSession(get_returns={sample_payload["post_id"]: found})
     got = PostService.get_post(sample_payload["post_id"])
     assert got is not None
@@ -218,41 +247,9 @@ def test_get_post_raises_when_session_not_ready(monkeypatch, sample_payload):
 # ----------------------------
 def test_list_posts_returns_public_only(patch_session_engine):
     # 公開投稿
-    row1 = SimpleNamespace(
-        post_id=uuid.uuid4(),
-        user_id="string_type_user_id",
-        img_id=uuid.uuid4(),
-        user_question="Q1",
-        object_label="T1",
-        ai_answer="A1",
-        ai_question="TOI1",
-        ai_reference="ref1",
-        location="札幌市1",
-        latitude=43.1,
-        longitude=141.1,
-        is_public=True,
-        post_rarity=2,
-        date=dt.datetime.now(dt.timezone.utc),
-        updated_at=dt.datetime.now(dt.timezone.utc),
-    )
+    row1 = _row(user_question="Q1", is_public=True)
     # 非公開投稿（フィルタで除外される想定）
-    row2 = SimpleNamespace(
-        post_id=uuid.uuid4(),
-        user_id="string_type_user_id",
-        img_id=uuid.uuid4(),
-        user_question="Q2",
-        object_label="T2",
-        ai_answer="A2",
-        ai_question="TOI2",
-        ai_reference=None,
-        location="札幌市2",
-        latitude=43.2,
-        longitude=141.2,
-        is_public=False,
-        post_rarity=0,
-        date=dt.datetime.now(dt.timezone.utc),
-        updated_at=dt.datetime.now(dt.timezone.utc),
-    )
+    row2 = _row(user_question="Q2", is_public=False)
     # 公開/非公開を混在させて投入し、FakeQuery.filter が is_public=true を解釈して除外することを検証
     patch_session_engine.factory = lambda: FakeSession(query_rows=[row1, row2])
     got = PostService.list_posts(limit=10, offset=0)
@@ -263,42 +260,11 @@ def test_list_posts_returns_public_only(patch_session_engine):
 
 
 def test_list_posts_before_filters_old_and_public(patch_session_engine):
+    old = dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=2)
     # 古い公開投稿（表示される）
-    old_public = SimpleNamespace(
-        post_id=uuid.uuid4(),
-        user_id="string_type_user_id",
-        img_id=uuid.uuid4(),
-        user_question="old_public",
-        object_label="t",
-        ai_answer="a",
-        ai_question="TOI",
-        ai_reference="ref-old",
-        location="loc",
-        latitude=1.0,
-        longitude=2.0,
-        is_public=True,
-        post_rarity=0,
-        date=dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=2),
-        updated_at=dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=1),
-    )
+    old_public = _row(user_question="old_public", is_public=True, date=old)
     # 古い非公開投稿（フィルタで除外される）
-    old_private = SimpleNamespace(
-        post_id=uuid.uuid4(),
-        user_id="string_type_user_id",
-        img_id=uuid.uuid4(),
-        user_question="old_private",
-        object_label="t",
-        ai_answer="a",
-        ai_question="TOI",
-        ai_reference="ref-old",
-        location="loc",
-        latitude=1.0,
-        longitude=2.0,
-        is_public=False,
-        post_rarity=0,
-        date=dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=2),
-        updated_at=dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=1),
-    )
+    old_private = _row(user_question="old_private", is_public=False, date=old)
     # 公開/非公開を混在させて投入し、FakeQuery.filter が is_public=true を解釈して非公開を除外することを検証
     patch_session_engine.factory = lambda: FakeSession(query_rows=[old_public, old_private])
     cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=15)
@@ -308,6 +274,269 @@ def test_list_posts_before_filters_old_and_public(patch_session_engine):
     assert got[0]["is_public"] is True
 
 
+def test_list_posts_before_with_visibility_paged(patch_session_engine):
+    own_post = _row(user_id="me", user_question="own_post", is_public=True)
+    session = FakeSession(query_rows=[own_post])
+    patch_session_engine.factory = lambda: session
+    now = dt.datetime.now(dt.timezone.utc)
+    got = PostService.list_posts_before_with_visibility(
+        now - dt.timedelta(minutes=15),
+        current_user_id="me",
+        limit=1,
+        cursor=PostService.encode_cursor(now + dt.timedelta(minutes=1), uuid.uuid4()),
+        since=now - dt.timedelta(days=1),
+    )
+    assert [p["user_question"] for p in got] == ["own_post"]
+    assert PostService.next_cursor(got, limit=1) is not None
+    query = session.queries[-1]
+    assert "(posts.date, posts.post_id) < (%(param_1)s::TIMESTAMP WITH TIME ZONE, %(param_2)s::UUID)" in [
+        _sql(c) for c in query.filters
+    ]
+    assert [_sql(c) for c in query.orders] == ["posts.date DESC", "posts.post_id DESC"]
+
+
+def test_list_posts_before_invalid_cursor_raises(patch_session_engine):
+    patch_session_engine.factory = lambda: FakeSession(query_rows=[])
+    with pytest.raises(ValueError):
+        PostService.list_posts_before(dt.datetime.now(dt.timezone.utc), limit=10, cursor="broken")
+
+
+def test_list_posts_in_bbox_returns_rows(patch_session_engine):
+    row = _row(
+        user_question="in_bbox",
+        latitude=43.05,
+        longitude=141.3,
+        is_public=True,
+        date=dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=1),
+    )
+    session = FakeSession(query_rows=[row])
+    patch_session_engine.factory = lambda: session
+    cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=15)
+    got = PostService.list_posts_in_bbox(43.0, 141.2, 43.1, 141.4, cutoff=cutoff, limit=10)
+    assert [p["user_question"] for p in got] == ["in_bbox"]
+    # 日付変更線をまたがない矩形は経度も BETWEEN で絞る
+    filters = [_sql(c) for c in session.queries[-1].filters]
+    assert filters[:2] == [
+        "posts.latitude BETWEEN %(latitude_1)s AND %(latitude_2)s",
+        "posts.longitude BETWEEN %(longitude_1)s AND %(longitude_2)s",
+    ]
+
+
+def test_list_posts_in_bbox_antimeridian_uses_or(patch_session_engine):
+    session = FakeSession(query_rows=[])
+    patch_session_engine.factory = lambda: session
+    cutoff = dt.datetime.now(dt.timezone.utc)
+    PostService.list_posts_in_bbox(-20.0, 170.0, 0.0, -170.0, cutoff=cutoff, current_user_id="me", limit=10)
+    query = session.queries[-1]
+    # min_lng > max_lng なら経度 170〜180 と -180〜-170 の 2 区間を OR でつなぐ
+    assert [_sql(c) for c in query.filters] == [
+        "posts.latitude BETWEEN %(latitude_1)s AND %(latitude_2)s",
+        "posts.longitude >= %(longitude_1)s OR posts.longitude <= %(longitude_2)s",
+        "posts.user_id = %(user_id_1)s::VARCHAR"
+        " OR posts.is_public IS true AND posts.date < %(date_1)s::TIMESTAMP WITH TIME ZONE",
+    ]
+    assert query.filters[1].compile().params == {"longitude_1": 170.0, "longitude_2": -170.0}
+    assert [_sql(c) for c in query.orders] == ["posts.date DESC", "posts.post_id DESC"]
+
+
+def test_tile_bounds_world_and_invalid():
+    west, south, east, north = PostService.tile_bounds(0, 0, 0)
+    assert (west, east) == (-180.0, 180.0)
+    assert north == pytest.approx(85.0511, abs=1e-4)
+    assert south == pytest.approx(-85.0511, abs=1e-4)
+    with pytest.raises(ValueError):
+        PostService.tile_bounds(1, 2, 0)
+    with pytest.raises(ValueError):
+        PostService.tile_bounds(99, 0, 0)
+
+
+def test_aggregate_tile_serializes_cells(patch_session_engine):
+    post_id = uuid.uuid4()
+    cell = SimpleNamespace(
+        cell_x=3, cell_y=5, count=12, post_id=post_id, max_rarity=3, latitude=43.91, longitude=140.41
+    )
+
+    class AggregateSession(FakeSession):
+        def execute(self, stmt):
+            return SimpleNamespace(all=lambda: [cell])
+
+    patch_session_engine.factory = lambda: AggregateSession()
+    got = PostService.aggregate_tile(10, 911, 372, cutoff=dt.datetime.now(dt.timezone.utc))
+    assert got == [
+        {
+            "cell_x": 3,
+            "cell_y": 5,
+            "count": 12,
+            "post_id": str(post_id),
+            "max_rarity": 3,
+            "latitude": 43.91,
+            "longitude": 140.41,
+        }
+    ]
+
+
+def test_serialize_projected_row_matches_fields():
+    now = dt.datetime.now(dt.timezone.utc)
+    row = _row(date=now, updated_at=None)
+    got = PostService._serialize(row)
+    assert tuple(got) == post_module.POST_FIELDS
+    assert got["post_id"] == str(row.post_id)
+    assert got["date"] == now.isoformat()
+    assert got["updated_at"] is None
+
+
+def test_list_posts_selects_projected_columns(patch_session_engine):
+    session = FakeSession(query_rows=[_row(is_public=True)])
+    patch_session_engine.factory = lambda: session
+    PostService.list_posts(limit=10)
+    # ORM エンティティではなく、POST_FIELDS の列をその順に SELECT する
+    assert [_sql(c) for c in session.queries[-1].entities] == [f"posts.{f}" for f in post_module.POST_FIELDS]
+
+
+def test_parse_fields():
+    assert PostService.parse_fields(None) is None
+    assert PostService.parse_fields(" ") is None
+    # POST_FIELDS の順に並び、post_id / date は常に含まれる
+    assert PostService.parse_fields("longitude, latitude") == ("post_id", "latitude", "longitude", "date")
+    assert PostService.parse_fields(["img_id"]) == ("post_id", "img_id", "date")
+    with pytest.raises(ValueError):
+        PostService.parse_fields("latitude,password")
+
+
+def test_list_posts_with_fields_returns_only_selected(patch_session_engine):
+    row = SimpleNamespace(
+        post_id=uuid.uuid4(),
+        latitude=43.1,
+        longitude=141.1,
+        is_public=True,
+        date=dt.datetime.now(dt.timezone.utc),
+    )
+    session = FakeSession(query_rows=[row])
+    patch_session_engine.factory = lambda: session
+    fields = PostService.parse_fields("latitude,longitude")
+    got = PostService.list_posts(limit=10, fields=fields)
+    # 指定した列（と post_id / date）だけを SELECT する
+    assert [_sql(c) for c in session.queries[-1].entities] == [
+        "posts.post_id",
+        "posts.latitude",
+        "posts.longitude",
+        "posts.date",
+    ]
+    assert got == [
+        {
+            "post_id": str(row.post_id),
+            "latitude": 43.1,
+            "longitude": 141.1,
+            "date": row.date.isoformat(),
+        }
+    ]
+
+
+def test_get_post_with_fields(patch_session_engine, sample_payload):
+    row = SimpleNamespace(post_id=sample_payload["post_id"], object_label="TGT", date=dt.datetime.now(dt.timezone.utc))
+    patch_session_engine.factory = lambda: FakeSession(query_rows=[row])
+    got = PostService.get_post(sample_payload["post_id"], fields=PostService.parse_fields("object_label"))
+    assert set(got) == {"post_id", "object_label", "date"}
+
+
+def test_get_posts_by_ids_preserves_order_and_dedupes(patch_session_engine):
+    ids = [uuid.uuid4() for _ in range(3)]
+    missing = uuid.uuid4()
+    # DB からは順不同で返ってくる想定
+    rows = [
+        SimpleNamespace(post_id=ids[2], object_label="c", date=dt.datetime.now(dt.timezone.utc)),
+        SimpleNamespace(post_id=ids[0], object_label="a", date=dt.datetime.now(dt.timezone.utc)),
+        SimpleNamespace(post_id=ids[1], object_label="b", date=dt.datetime.now(dt.timezone.utc)),
+    ]
+    sessions = []
+
+    def factory():
+        sessions.append(FakeSession(query_rows=rows))
+        return sessions[-1]
+
+    patch_session_engine.factory = factory
+    got = PostService.get_posts_by_ids(
+        [ids[1], missing, ids[0], ids[1], ids[2]], fields=PostService.parse_fields("object_label")
+    )
+    assert [p["object_label"] for p in got] == ["b", "a", "c"]
+    assert len(sessions) == 1  # 1回のセッション（1往復）で取得する
+
+
+def test_get_posts_by_ids_include_image(patch_session_engine):
+    img_id = uuid.uuid4()
+    now = dt.datetime.now(dt.timezone.utc)
+    rows = [
+        SimpleNamespace(
+            post_id=uuid.uuid4(),
+            date=now,
+            image_img_id=img_id,
+            image_gcs_uri=f"gs://bucket/images/{img_id}.jpg",
+            image_mime_type="image/jpeg",
+        ),
+        # 画像が未保存（pending / failed）なら外部結合の列は NULL
+        SimpleNamespace(post_id=uuid.uuid4(), date=now, image_img_id=None, image_gcs_uri=None, image_mime_type=None),
+    ]
+    patch_session_engine.factory = lambda: FakeSession(query_rows=rows)
+    got = PostService.get_posts_by_ids(
+        [r.post_id for r in rows], fields=PostService.parse_fields("date"), include_image=True
+    )
+    assert got[0]["image"] == {
+        "img_id": str(img_id),
+        "gcs_uri": f"gs://bucket/images/{img_id}.jpg",
+        "mime_type": "image/jpeg",
+    }
+    assert got[1]["image"] is None
+
+
+def test_get_posts_by_ids_empty_skips_db(patch_session_engine):
+    patch_session_engine.factory = None
+    assert PostService.get_posts_by_ids([]) == []
+
+
+def test_cursor_roundtrip():
+    date = dt.datetime(2025, 9, 11, 6, 7, 50, 252702, tzinfo=dt.timezone.utc)
+    post_id = uuid.uuid4()
+    cursor = PostService.encode_cursor(date, post_id)
+    assert "=" not in cursor
+    assert PostService.decode_cursor(cursor) == (date, post_id)
+
+
+def test_decode_cursor_invalid_raises():
+    with pytest.raises(ValueError):
+        PostService.decode_cursor("not-a-cursor")
+
+
+def test_next_cursor_only_when_page_is_full():
+    date = dt.datetime.now(dt.timezone.utc)
+    posts = [{"post_id": str(uuid.uuid4()), "date": date.isoformat()} for _ in range(3)]
+    assert PostService.next_cursor(posts, limit=4) is None
+    cursor = PostService.next_cursor(posts, limit=3)
+    assert PostService.decode_cursor(cursor) == (date, uuid.UUID(posts[-1]["post_id"]))
+
+
+def test_list_posts_with_cursor(patch_session_engine):
+    row = _row(is_public=True)
+    session = FakeSession(query_rows=[row])
+    patch_session_engine.factory = lambda: session
+    cursor = PostService.encode_cursor(dt.datetime.now(dt.timezone.utc), uuid.uuid4())
+    got = PostService.list_posts(limit=10, cursor=cursor)
+    assert len(got) == 1
+    assert got[0]["post_id"] == str(row.post_id)
+    # (date, post_id) の行値比較でカーソルより後ろに絞り、同じ date は post_id で並びを決める
+    query = session.queries[-1]
+    assert [_sql(c) for c in query.filters] == [
+        "posts.is_public IS true",
+        "(posts.date, posts.post_id) < (%(param_1)s::TIMESTAMP WITH TIME ZONE, %(param_2)s::UUID)",
+    ]
+    assert [_sql(c) for c in query.orders] == ["posts.date DESC", "posts.post_id DESC"]
+
+
+def test_list_posts_invalid_cursor_raises(patch_session_engine):
+    patch_session_engine.factory = lambda: FakeSession(query_rows=[])
+    with pytest.raises(ValueError):
+        PostService.list_posts(limit=10, cursor="broken")
+
+
 def test_list_posts_raises_when_session_not_ready(monkeypatch):
     monkeypatch.setattr(post_module, "engine", None, raising=False)
     monkeypatch.setattr(post_module, "SessionLocal", None, raising=False)
@@ -0,0 +1,91 @@
+import pytest
+from src.utils.cache import LFUCache, TTLCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_set_and_stats():
+    cache = TTLCache(maxsize=4, ttl=10)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_entry_expires_after_ttl():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=4, ttl=10, timer=timer)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=30)
+    timer.now = 10
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalid_maxsize():
+    with pytest.raises(ValueError):
+        TTLCache(maxsize=0)
+
+
+def test_lfu_cache_keeps_popular_entries():
+    cache = LFUCache(maxsize=2, ttl=60)
+    cache.set("hot", 1)
+    for _ in range(5):
+        assert cache.get("hot") == 1
+    cache.set("warm", 2)
+    cache.get("warm")
+
+    # 一度きりのキーは、既存のエントリより参照回数が少ないので入らない
+    assert cache.set("once", 3) is False
+    assert cache.get("once") is None
+
+    # 何度も参照されるようになれば、参照回数の少ない方（warm）と入れ替わる
+    for _ in range(3):
+        cache.get("new")
+    assert cache.set("new", 4) is True
+    assert cache.get("hot") == 1
+    assert cache.get("warm") is None
+    assert cache.stats()["evictions"] == 1 and cache.stats()["rejections"] == 1
+
+
+def test_lfu_cache_replaces_expired_entries_regardless_of_frequency():
+    timer = FakeTimer()
+    cache = LFUCache(maxsize=1, ttl=10, timer=timer)
+    cache.set("a", 1)
+    cache.get("a")
+    timer.now = 11.0
+    # 期限切れのエントリは参照回数に関係なく置き換えられる
+    assert cache.set("b", 2) is True
+    assert cache.get("b") == 2
+    assert cache.get("a") is None
+
+
+def test_lfu_cache_halves_counts_after_sample_size():
+    cache = LFUCache(maxsize=1, ttl=60, sample_size=4)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("a")  # 4回目でエージング（a: 4 -> 2）
+    assert cache._freq == {"a": 2}
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+from src.utils import clients
+
+
+@pytest.fixture(autouse=True)
+def reset_clients():
+    clients.reset()
+    yield
+    clients.reset()
+
+
+def test_shared_creates_client_once_per_key():
+    created = []
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    a = clients.shared("k", factory)
+    assert clients.shared("k", factory) is a
+    assert clients.shared("other", factory) is not a
+    assert len(created) == 2
+
+
+def test_shared_is_thread_safe():
+    created = []
+
+    def slow_factory():
+        time.sleep(0.01)
+        created.append(object())
+        return created[-1]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(clients.shared("k", slow_factory))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(created) == 1
+    assert all(r is created[0] for r in results)
+
+
+def test_genai_client_is_reused():
+    assert clients.genai_client("dummy-key") is clients.genai_client("dummy-key")
+
+
+def test_registry_is_recreated_after_fork():
+    a = clients.shared("k", object)
+    clients._reset_after_fork()
+    assert clients.shared("k", object) is not a
+
+
+def test_storage_client_uses_pooled_session(monkeypatch):
+    # 接続プールを広げたセッションを storage.Client に渡すこと（_http は非公開引数なので、使えなければ既定で作る）
+    calls = []
+
+    def fake_client(**kwargs):
+        calls.append(kwargs)
+        if "_http" in kwargs and len(calls) > 1:
+            raise TypeError("unexpected keyword argument '_http'")
+        return kwargs
+
+    monkeypatch.setattr(clients.google.auth, "default", lambda scopes: (object(), "proj"))
+    monkeypatch.setattr(clients.storage, "Client", fake_client)
+
+    client = clients._make_storage_client(None)
+    adapter = client["_http"].get_adapter("https://storage.googleapis.com")
+    assert adapter._pool_maxsize == clients.CONFIG.HTTP_POOL_SIZE
+
+    fallback = clients._make_storage_client(None)
+    assert "_http" not in fallback and fallback["project"] == "proj"
@@ -0,0 +1,32 @@
+import pytest
+from src.utils import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_latency_snapshot_reports_percentiles():
+    stats = metrics.latency("x.call")
+    for ms in range(1, 101):
+        stats.observe(ms / 1000)
+
+    snap = metrics.snapshot("x.")["x.call"]
+    assert snap["count"] == 100 and snap["errors"] == 0
+    assert snap["p50_ms"] == pytest.approx(51)
+    assert snap["p95_ms"] == pytest.approx(96)
+    assert snap["max_ms"] == pytest.approx(100)
+
+
+def test_time_counts_exceptions_as_errors():
+    stats = metrics.latency("x.call")
+    with pytest.raises(RuntimeError):
+        with stats.time():
+            raise RuntimeError("boom")
+
+    assert stats.snapshot()["errors"] == 1
+    assert metrics.latency("x.call") is stats
+    assert metrics.snapshot("y.") == {}
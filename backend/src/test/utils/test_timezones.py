@@ -0,0 +1,52 @@
+import pytest
+import src.utils.timezones as tz_mod
+from src.utils.cache import TTLCache
+
+
+class FakeFinder:
+    """一括 API の呼び出しを記録する TimezoneFinder の代わり"""
+
+    def __init__(self):
+        self.batches = []
+
+    def timezone_names_at(self, *, lngs, lats):
+        self.batches.append(list(zip(lats, lngs)))
+        return ["Asia/Tokyo" if lng > 100 else None for lng in lngs]
+
+
+@pytest.fixture
+def finder(monkeypatch):
+    fake = FakeFinder()
+    monkeypatch.setattr(tz_mod, "_finder", lambda: fake)
+    monkeypatch.setattr(tz_mod, "_memo", TTLCache(maxsize=100, ttl=float("inf")))
+    return fake
+
+
+def test_timezones_at_looks_up_each_cell_once_in_one_batch(finder):
+    lats = [43.0701, 43.0702, 35.68, 0.0]
+    lngs = [141.3401, 141.3402, 139.76, -150.0]
+
+    assert tz_mod.timezones_at(lats, lngs) == ["Asia/Tokyo", "Asia/Tokyo", "Asia/Tokyo", None]
+    # 同じセルの2点は1回だけ、3セル分を1回の一括呼び出しで判定する
+    assert len(finder.batches) == 1
+    assert len(finder.batches[0]) == 3
+
+
+def test_timezone_at_uses_memo(finder):
+    assert tz_mod.timezone_at(43.07, 141.34) == "Asia/Tokyo"
+    assert tz_mod.timezone_at(43.0701, 141.3401) == "Asia/Tokyo"
+    assert tz_mod.timezone_at(0.0, -150.0) is None
+    assert tz_mod.timezone_at(0.0, -150.0) is None
+    assert len(finder.batches) == 2
+
+
+def test_timezones_at_validates_input(finder):
+    with pytest.raises(ValueError):
+        tz_mod.timezones_at([1.0], [])
+    with pytest.raises(ValueError):
+        tz_mod.timezones_at([91.0], [0.0])
+
+
+def test_real_finder_resolves_tokyo():
+    # 実際の TimezoneFinder（一括 API の有無にかかわらず）で判定できること
+    assert tz_mod.timezones_at([35.68, 43.07], [139.76, 141.34]) == ["Asia/Tokyo", "Asia/Tokyo"]
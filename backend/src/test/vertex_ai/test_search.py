@@ -5,12 +5,35 @@ import pytest
 
 # テスト対象のモジュールを 'search_module' としてインポート
 import src.services.vertex_ai.search as search_module
+from src.services.vertex_ai import search_cache as search_cache_module
 from src.services.vertex_ai.search import SearchService
+from src.services.vertex_ai.search_cache import SearchCache, clean_query, normalize_query
+from src.utils import clients, metrics
+from src.utils.cache import LFUCache
 
 
 # -------------------------------------------------------------
 # Pytestフィクスチャ (テストの準備・後片付け)
 # -------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def reset_shared_clients():
+    """共有クライアントとレイテンシ計測をテストごとに作り直す（前のテストのモックを使い回さない）"""
+    clients.reset()
+    metrics.reset()
+    yield
+    clients.reset()
+    metrics.reset()
+
+
+@pytest.fixture(autouse=True)
+def fresh_search_cache(monkeypatch):
+    """テスト間で検索結果のキャッシュを共有しない（インポート完了マーカーも見に行かない）"""
+    monkeypatch.setattr(search_cache_module.search_cache, "version_source", lambda: None)
+    search_cache_module.search_cache.invalidate()
+    yield
+    search_cache_module.search_cache.invalidate()
+
+
 @pytest.fixture
 def sample_search_query() -> str:
     """テストで使う共通の検索クエリを返す"""
@@ -46,7 +69,7 @@ def mock_search_response():
 
 # --- search_by_text のテスト ---
 # @patchデコレータを使い、テスト中だけSearchServiceClientをモックに差し替える
-@patch("src.services.vertex_ai.search.SearchServiceClient")
+@patch("src.utils.clients.SearchServiceClient")
 def test_search_by_text_success(mock_client, sample_search_query, mock_search_response, monkeypatch):
     """正常系: テキスト検索が成功し、結果のリストが返されるケース"""
     # --- Arrange (準備) ---
@@ -65,7 +88,7 @@ def test_search_by_text_success(mock_client, sample_search_query, mock_search_re
     mock_instance.search.return_value = mock_search_response
 
 
-@patch("src.services.vertex_ai.search.SearchServiceClient")
+@patch("src.utils.clients.SearchServiceClient")
 def test_search_by_text_no_results(mock_client, sample_search_query, monkeypatch):
     """正常系: 検索結果が0件だった場合、空のリストが返されるケース"""
     monkeypatch.setenv("PROJECT_ID", "fake-project")
@@ -83,7 +106,7 @@ def test_search_by_text_no_results(mock_client, sample_search_query, monkeypatch
     assert results == []
 
 
-@patch("src.services.vertex_ai.search.SearchServiceClient")
+@patch("src.utils.clients.SearchServiceClient")
 def test_search_by_text_api_fails_returns_none(mock_client, sample_search_query, monkeypatch):
     """異常系: Google Cloud APIの呼び出しが失敗し、Noneが返るケース"""
     monkeypatch.setenv("PROJECT_ID", "fake-project")
@@ -99,6 +122,93 @@ def test_search_by_text_api_fails_returns_none(mock_client, sample_search_query,
     assert results is None
 
 
+@patch("src.utils.clients.SearchServiceClient")
+def test_search_client_is_shared_and_calls_are_measured(mock_client, sample_search_query, mock_search_response):
+    """クライアントは1回だけ作られ、検索は期限・再試行付きで呼ばれてレイテンシが記録される"""
+    mock_instance = mock_client.return_value
+    mock_instance.search.return_value = mock_search_response
+
+    SearchService.search_by_text(sample_search_query)
+    SearchService.search_by_text("札幌時計台")
+
+    assert mock_client.call_count == 1
+    _, kwargs = mock_instance.search.call_args
+    assert kwargs["retry"] is search_module.SEARCH_RETRY
+    assert kwargs["timeout"] == search_module.CONFIG.SEARCH_TIMEOUT_SECONDS
+
+    stats = SearchService.latency_stats()
+    assert stats["vertex_search.client_init"]["count"] == 1
+    assert stats["vertex_search.search_by_text"]["count"] == 2
+    assert stats["vertex_search.search_by_text"]["errors"] == 0
+
+
+@patch("src.utils.clients.SearchServiceClient")
+def test_search_failure_is_counted_as_error(mock_client, sample_search_query):
+    mock_client.return_value.search.side_effect = Exception("API call failed (fake)")
+
+    assert SearchService.search_by_text(sample_search_query) is None
+    assert SearchService.latency_stats()["vertex_search.search_by_text"]["errors"] == 1
+
+
+@patch("src.utils.clients.SearchServiceClient")
+def test_search_by_text_serves_normalized_query_from_cache(mock_client, mock_search_response):
+    """表記ゆれのあるクエリは正規化して1回だけ検索し、2回目以降はキャッシュから返す"""
+    mock_instance = mock_client.return_value
+    mock_instance.search.return_value = mock_search_response
+
+    first = SearchService.search_by_text("  とうきょう　ﾀﾜｰ ")
+    second = SearchService.search_by_text("トウキョウ タワー")
+
+    assert first == second and len(first) == 1
+    assert mock_instance.search.call_count == 1
+    # 検索に送るのは NFKC と空白の整理だけ（ひらがなはカタカナにしない）
+    assert mock_instance.search.call_args.kwargs["request"].query == "とうきょう タワー"
+    assert SearchService.search_cache_stats()["hits"] == 1
+
+
+@patch("src.utils.clients.SearchServiceClient")
+def test_search_by_text_does_not_cache_failures(mock_client, sample_search_query, mock_search_response):
+    mock_instance = mock_client.return_value
+    mock_instance.search.side_effect = [Exception("API call failed (fake)"), mock_search_response]
+
+    assert SearchService.search_by_text(sample_search_query) is None
+    assert len(SearchService.search_by_text(sample_search_query)) == 1
+
+
+@patch("src.utils.clients.SearchServiceClient")
+def test_search_by_text_sends_original_wording_to_vertex(mock_client, mock_search_response):
+    """送り仮名などのひらがなを書き換えずに Vertex AI Search へ送る"""
+    mock_instance = mock_client.return_value
+    mock_instance.search.return_value = mock_search_response
+
+    SearchService.search_by_text("赤い実の　なる木 ")
+
+    assert mock_instance.search.call_args.kwargs["request"].query == "赤い実の なる木"
+
+
+def test_normalize_query():
+    assert normalize_query("ＡＢＣ　ｻｸﾗ\tさくら") == "abc サクラ サクラ"
+    assert normalize_query("   ") == ""
+    assert clean_query(" きれいな　花 ") == "きれいな 花"
+
+
+def test_search_cache_is_cleared_when_import_generation_changes():
+    generation = [1]
+    now = [0.0]
+    cache = SearchCache(
+        LFUCache(maxsize=8, ttl=600), version_source=lambda: generation[0], check_interval=60, timer=lambda: now[0]
+    )
+    cache.get("サクラ", 10)
+    cache.set("サクラ", 10, [{"id": "a"}])
+    assert cache.get("サクラ", 10) == [{"id": "a"}]
+
+    generation[0] = 2
+    assert cache.get("サクラ", 10) == [{"id": "a"}]  # 確認間隔の間は古い版のまま
+
+    now[0] = 61.0
+    assert cache.get("サクラ", 10) is None
+
+
 def test_search_by_text_raises_when_env_vars_missing(monkeypatch):
     """異常系: 必要な環境変数が設定されていない場合にRuntimeErrorを送出するケース"""
     # 意図的に環境変数を未設定の状態にする
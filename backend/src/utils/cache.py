@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[V]):
+    """
+    スレッドセーフな TTL 付き LRU キャッシュ（プロセス内）
+
+    - maxsize を超えたら最も長く参照されていないエントリから追い出す
+    - エントリごとに TTL を上書き可能（set(..., ttl=...)）
+    - hits / misses / evictions を stats() で参照できる
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, timer: Callable[[], float] = time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize は 1 以上で指定してください")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        """有効期限内の値を返す（期限切れ・未登録なら default）"""
+        now = self._timer()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        """値を登録する。ttl 未指定ならインスタンス既定の TTL を使う"""
+        expires_at = self._timer() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class LFUCache(Generic[V]):
+    """
+    スレッドセーフな TTL 付き LFU キャッシュ（プロセス内。TinyLFU 風の受け入れ判定つき）
+
+    - get / set のたびにキーの参照回数を数える（キャッシュに無いキーの参照も数える）
+    - 満杯のときは参照回数が最も少ないエントリを追い出す候補にし、
+      新しいキーの参照回数が候補より多いときだけ入れ替える（一度きりのキーで人気のエントリを追い出さない）
+    - 参照回数は sample_size 回ごとに半分にして、昔の人気が残り続けないようにする
+    - hits / misses / evictions / rejections を stats() で参照できる
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60.0,
+        timer: Callable[[], float] = time.monotonic,
+        sample_size: Optional[int] = None,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize は 1 以上で指定してください")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sample_size = sample_size or 10 * maxsize
+        self._timer = timer
+        self._data: Dict[Hashable, Tuple[float, V]] = {}
+        self._freq: Dict[Hashable, int] = {}
+        self._ops = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def _touch(self, key: Hashable) -> int:
+        count = self._freq.get(key, 0) + 1
+        self._freq[key] = count
+        self._ops += 1
+        if self._ops >= self.sample_size:
+            # エージング: 参照回数を半分にし、0 になったキーは忘れる（_freq の大きさも sample_size 以下に保たれる）
+            self._freq = {k: c // 2 for k, c in self._freq.items() if c // 2 > 0}
+            self._ops = 0
+            count = self._freq.get(key, 0)
+        return count
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        """有効期限内の値を返す（期限切れ・未登録なら default）"""
+        now = self._timer()
+        with self._lock:
+            self._touch(key)
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> bool:
+        """値を登録し、登録できたら True（満杯で、既存のエントリより参照回数が少なければ登録しない）"""
+        now = self._timer()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            count = self._touch(key)
+            if key not in self._data and len(self._data) >= self.maxsize:
+                for k in [k for k, (exp, _) in self._data.items() if exp <= now]:
+                    del self._data[k]
+            if key not in self._data and len(self._data) >= self.maxsize:
+                # maxsize 件の走査になるが、set はキャッシュミス（バックエンドへの問い合わせ）の後にしか呼ばれない想定
+                victim = min(self._data, key=lambda k: self._freq.get(k, 0))
+                if count <= self._freq.get(victim, 0):
+                    self.rejections += 1
+                    return False
+                del self._data[victim]
+                self.evictions += 1
+            self._data[key] = (expires_at, value)
+            return True
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self) -> None:
+        """エントリを破棄する（参照回数は残すので、人気のキーは次の set ですぐに戻る）"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejections": self.rejections,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
@@ -0,0 +1,114 @@
+"""
+外部 API のクライアントをプロセス内で共有するレジストリ
+
+- 初回に使われたときに作り（遅延初期化）、以降はすべてのリクエスト・スレッドで同じインスタンスを使い回す
+- 認証情報の取得や TLS 接続の確立をリクエストごとに行わないよう、HTTP 接続はプールして再利用する
+- fork した子プロセスでは親の接続（gRPC チャネルなど）を使わず、作り直す
+"""
+
+import functools
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+import google.auth
+import httpx
+from google import genai
+from google.api_core.client_options import ClientOptions
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from google.cloud.discoveryengine import SearchServiceClient
+from google.cloud.discoveryengine_v1.services.search_service.transports import SearchServiceGrpcTransport
+from google.genai import types
+from requests.adapters import HTTPAdapter
+from src.utils import metrics
+from src.utils.config import CONFIG
+
+T = TypeVar("T")
+
+_STORAGE_SCOPES = ("https://www.googleapis.com/auth/cloud-platform",)
+
+_clients: Dict[Hashable, Any] = {}
+_lock = threading.Lock()
+
+
+def shared(key: Hashable, factory: Callable[[], T]) -> T:
+    """key ごとに factory で作ったクライアントを1つだけ作って返す（同時に呼ばれても作るのは1回）"""
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def reset() -> None:
+    """共有しているクライアントを破棄する（テスト・設定変更用）"""
+    with _lock:
+        _clients.clear()
+
+
+def _reset_after_fork() -> None:
+    # fork の瞬間に他のスレッドがロックを持っていた可能性があるので、ロックごと作り直す
+    global _clients, _lock
+    _clients = {}
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def storage_client(project: Optional[str] = None) -> storage.Client:
+    """Cloud Storage のクライアント（ADC。接続プールのサイズは HTTP_POOL_SIZE）"""
+    return shared(("storage", project), lambda: _make_storage_client(project))
+
+
+def _make_storage_client(project: Optional[str]) -> storage.Client:
+    credentials, default_project = google.auth.default(scopes=_STORAGE_SCOPES)
+    session = AuthorizedSession(credentials)
+    # requests の既定（ホストごとに10接続）では並列アップロード・署名で接続を捨てて張り直すことがあるため広げる
+    adapter = HTTPAdapter(pool_connections=CONFIG.HTTP_POOL_SIZE, pool_maxsize=CONFIG.HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    # _http は storage.Client の非公開引数（google-cloud-storage 3.x で確認。pyproject でメジャーバージョンを固定している）
+    # 受け付けられなくなった場合は、接続プールの設定を諦めて既定のセッションで作る
+    try:
+        return storage.Client(project=project or default_project, credentials=credentials, _http=session)
+    except TypeError as e:
+        print(f"WARN: storage.Client does not accept _http -> default connection pool: {e}")
+        return storage.Client(project=project or default_project, credentials=credentials)
+
+
+def genai_client(api_key: Optional[str] = None) -> genai.Client:
+    """Gemini API のクライアント（api_key 未指定なら GEMINI_API_KEY）"""
+    api_key = api_key or CONFIG.GEMINI_API_KEY
+    return shared(("genai", api_key), lambda: _make_genai_client(api_key))
+
+
+def _make_genai_client(api_key: Optional[str]) -> genai.Client:
+    limits = httpx.Limits(max_connections=CONFIG.HTTP_POOL_SIZE, max_keepalive_connections=CONFIG.HTTP_POOL_SIZE)
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(client_args={"limits": limits}))
+
+
+def search_client(api_endpoint: str) -> SearchServiceClient:
+    """
+    Vertex AI Search のクライアント（gRPC）
+    1本のチャネル（HTTP/2）の上で並行する呼び出しを多重化するので、プロセスで1つを使い回す
+    作成にかかった時間は metrics の "vertex_search.client_init" に記録する
+    """
+    return shared(("discoveryengine", api_endpoint), lambda: _make_search_client(api_endpoint))
+
+
+def _search_channel(*args: Any, options: Any = (), **kwargs: Any) -> Any:
+    keepalive_ms = int(CONFIG.SEARCH_KEEPALIVE_SECONDS * 1000)
+    options = [*options, ("grpc.keepalive_time_ms", keepalive_ms)]
+    return SearchServiceGrpcTransport.create_channel(*args, options=options, **kwargs)
+
+
+def _make_search_client(api_endpoint: str) -> SearchServiceClient:
+    with metrics.latency("vertex_search.client_init").time():
+        return SearchServiceClient(
+            client_options=ClientOptions(api_endpoint=api_endpoint),
+            transport=functools.partial(SearchServiceGrpcTransport, channel=_search_channel),
+        )
@@ -18,8 +18,87 @@ class _Config:
     INLINE_MAX_IMAGE_BYTES: int = int(os.getenv("INLINE_MAX_IMAGE_BYTES", "15000000"))
     MAX_IMAGE_LONG_EDGE: int = int(os.getenv("MAX_IMAGE_LONG_EDGE", "1600"))
 
+    # 地図タイル集計（/api/posts/tiles）のキャッシュ
+    TILE_CACHE_TTL_SECONDS: float = float(os.getenv("TILE_CACHE_TTL_SECONDS", "60"))
+    TILE_CACHE_MAX_ENTRIES: int = int(os.getenv("TILE_CACHE_MAX_ENTRIES", "2048"))
+
+    # Gemini の解析結果キャッシュ（memory: プロセス内 LRU / sql: analysis_cache テーブルで共有 / none: 無効）
+    ANALYSIS_CACHE_BACKEND: str = os.getenv("ANALYSIS_CACHE_BACKEND", "memory").strip().lower()
+    ANALYSIS_CACHE_TTL_SECONDS: float = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400"))
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1024"))
+
+    # 逆ジオコーディング（src/services/geo/geocode.py）
+    # online: Nominatim（GEOCODE_MIN_INTERVAL_SECONDS 秒に1回まで）/ offline: GEOCODE_GAZETTEER_PATH の地名辞書のみ
+    GEOCODE_MODE: str = os.getenv("GEOCODE_MODE", "online").strip().lower()
+    GEOCODE_USER_AGENT: str = os.getenv("GEOCODE_USER_AGENT", "image_analyze_geocoder")
+    GEOCODE_TIMEOUT_SECONDS: float = float(os.getenv("GEOCODE_TIMEOUT_SECONDS", "2"))
+    GEOCODE_MIN_INTERVAL_SECONDS: float = float(os.getenv("GEOCODE_MIN_INTERVAL_SECONDS", "1"))
+    # 1回の問い合わせで枠を待つ上限。超えたら住所なしとして返す（キャッシュはしない）
+    GEOCODE_MAX_WAIT_SECONDS: float = float(os.getenv("GEOCODE_MAX_WAIT_SECONDS", "5"))
+    # 上の間隔を守る範囲（sql: geocode_rate_limit テーブルで全プロセス・全インスタンス共通 / process: プロセスごと）
+    # process のとき、または DB に接続できないときはプロセスごとの制限になるので、
+    # gunicorn のワーカー数 N で動かすなら GEOCODE_MIN_INTERVAL_SECONDS を N 倍（例: -w 4 なら 4）にする
+    GEOCODE_RATE_LIMIT_BACKEND: str = os.getenv("GEOCODE_RATE_LIMIT_BACKEND", "sql").strip().lower()
+    GEOCODE_GAZETTEER_PATH: str = os.getenv("GEOCODE_GAZETTEER_PATH", "")
+    GEOCODE_GAZETTEER_MAX_DISTANCE_METERS: float = float(os.getenv("GEOCODE_GAZETTEER_MAX_DISTANCE_METERS", "1000"))
+    # 住所のキャッシュ（GEOCODE_CELL_METERS 四方のセル単位。memory: プロセス内のみ / sql: geocode_cache テーブルも使う）
+    GEOCODE_CELL_METERS: float = float(os.getenv("GEOCODE_CELL_METERS", "50"))
+    GEOCODE_CACHE_BACKEND: str = os.getenv("GEOCODE_CACHE_BACKEND", "memory").strip().lower()
+    GEOCODE_CACHE_TTL_SECONDS: float = float(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(30 * 86400)))
+    GEOCODE_CACHE_MAX_ENTRIES: int = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "10000"))
+    # 投稿作成時の住所の補完（sync: リクエスト中に逆ジオコーディング / deferred: 仮の値で保存し、ワーカーが後から埋める）
+    POST_GEOCODE_MODE: str = os.getenv("POST_GEOCODE_MODE", "sync").strip().lower()
+    POST_GEOCODE_BATCH_SIZE: int = int(os.getenv("POST_GEOCODE_BATCH_SIZE", "50"))
+    POST_GEOCODE_POLL_SECONDS: float = float(os.getenv("POST_GEOCODE_POLL_SECONDS", "30"))
+    POST_GEOCODE_RATE_PER_SECOND: float = float(os.getenv("POST_GEOCODE_RATE_PER_SECOND", "1"))
+    POST_GEOCODE_BURST: float = float(os.getenv("POST_GEOCODE_BURST", "5"))
+    POST_GEOCODE_MAX_ATTEMPTS: int = int(os.getenv("POST_GEOCODE_MAX_ATTEMPTS", "3"))
+
+    # タイムゾーンの判定（src/utils/timezones.py）。TIMEZONE_CELL_DEGREES 単位のセルごとに結果をメモする
+    TIMEZONE_CELL_DEGREES: float = float(os.getenv("TIMEZONE_CELL_DEGREES", "0.01"))
+    TIMEZONE_CACHE_MAX_ENTRIES: int = int(os.getenv("TIMEZONE_CACHE_MAX_ENTRIES", "100000"))
+
+    # /api/image_analyze で受け付ける画像の上限（バイト）。超えたら読み切る前に 413 を返す
+    ANALYZE_UPLOAD_MAX_BYTES: int = int(os.getenv("ANALYZE_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+    # 非同期の画像解析ジョブ（/api/image_analyze?mode=job）
+    # ジョブの保存先（sql: analyze_jobs テーブルで全プロセスと共有 / memory: プロセス内）
+    ANALYZE_JOB_BACKEND: str = os.getenv("ANALYZE_JOB_BACKEND", "sql").strip().lower()
+    ANALYZE_JOB_WORKERS: int = int(os.getenv("ANALYZE_JOB_WORKERS", "4"))
+    ANALYZE_JOB_TTL_SECONDS: float = float(os.getenv("ANALYZE_JOB_TTL_SECONDS", "600"))
+    ANALYZE_JOB_MAX_ENTRIES: int = int(os.getenv("ANALYZE_JOB_MAX_ENTRIES", "1024"))
+    # 完了を待つ間にジョブストアを読み直す間隔（ANALYZE_JOB_POLL_SECONDS から倍々に ANALYZE_JOB_POLL_MAX_SECONDS まで伸ばす）
+    ANALYZE_JOB_POLL_SECONDS: float = float(os.getenv("ANALYZE_JOB_POLL_SECONDS", "0.5"))
+    ANALYZE_JOB_POLL_MAX_SECONDS: float = float(os.getenv("ANALYZE_JOB_POLL_MAX_SECONDS", "2"))
+    ANALYZE_JOB_SSE_HEARTBEAT_SECONDS: float = float(os.getenv("ANALYZE_JOB_SSE_HEARTBEAT_SECONDS", "5"))
+    # SSE の1接続の長さの上限（gunicorn の同期ワーカーの timeout 30 秒より十分短く。切れたらクライアントが再接続する）
+    ANALYZE_JOB_SSE_MAX_SECONDS: float = float(os.getenv("ANALYZE_JOB_SSE_MAX_SECONDS", "20"))
+    ANALYZE_JOB_SSE_RETRY_MS: int = int(os.getenv("ANALYZE_JOB_SSE_RETRY_MS", "1000"))
+    # 1プロセスで同時に開いておく SSE の上限（超えたら 503。ポーリングに切り替えてもらう）
+    ANALYZE_JOB_SSE_MAX_STREAMS: int = int(os.getenv("ANALYZE_JOB_SSE_MAX_STREAMS", "2"))
+
     # HTTP
     HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "20.0"))
+    # 共有クライアント（src/utils/clients.py）の接続プールのサイズ
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "32"))
+
+    # Vertex AI Search（src/services/vertex_ai/search.py）
+    # 1回の呼び出しの期限と、一時的なエラー（UNAVAILABLE / DEADLINE_EXCEEDED）の再試行（指数バックオフ・全体の期限）
+    SEARCH_TIMEOUT_SECONDS: float = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "5"))
+    SEARCH_RETRY_INITIAL_SECONDS: float = float(os.getenv("SEARCH_RETRY_INITIAL_SECONDS", "0.2"))
+    SEARCH_RETRY_MAX_SECONDS: float = float(os.getenv("SEARCH_RETRY_MAX_SECONDS", "2"))
+    SEARCH_RETRY_DEADLINE_SECONDS: float = float(os.getenv("SEARCH_RETRY_DEADLINE_SECONDS", "10"))
+    # gRPC の keepalive（応答待ちの接続が途中で切られていないかを ping で確かめる間隔）
+    SEARCH_KEEPALIVE_SECONDS: float = float(os.getenv("SEARCH_KEEPALIVE_SECONDS", "60"))
+
+    # /api/search の検索結果キャッシュ（src/services/vertex_ai/search_cache.py。MAX_ENTRIES=0 で無効）
+    SEARCH_CACHE_TTL_SECONDS: float = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+    SEARCH_CACHE_MAX_ENTRIES: int = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+    # インポート完了マーカーを確認する間隔（別インスタンスでのインポート後、最大この秒数だけ古い結果を返しうる）
+    SEARCH_CACHE_VERSION_CHECK_SECONDS: float = float(os.getenv("SEARCH_CACHE_VERSION_CHECK_SECONDS", "60"))
+
+    # レイテンシ計測（src/utils/metrics.py）で統計に使う直近の件数
+    METRICS_WINDOW: int = int(os.getenv("METRICS_WINDOW", "1024"))
 
     # CORS等（必要なら app.py 側で使用）
     ALLOWED_ORIGINS: tuple[str] = tuple(
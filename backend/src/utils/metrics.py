@@ -0,0 +1,87 @@
+"""
+プロセス内のレイテンシ計測
+
+- latency(name) で名前ごとの LatencyStats を取得し（初回に作る）、observe / time で所要時間を記録する
+- 直近 METRICS_WINDOW 件の所要時間から平均・p50・p95・最大を出す（件数・失敗数は累計）
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator
+
+from src.utils.config import CONFIG
+
+
+class LatencyStats:
+    """1種類の処理の所要時間（秒）を記録する（スレッドセーフ）"""
+
+    def __init__(self, window: int):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            if not ok:
+                self.errors += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """with ブロックの所要時間を記録する（例外で抜けたら失敗として数え、例外はそのまま送出）"""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(time.perf_counter() - start, ok)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, errors = self.count, self.errors
+        if not samples:
+            return {"count": count, "errors": errors}
+
+        def pct(p: float) -> float:
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+        return {
+            "count": count,
+            "errors": errors,
+            "avg_ms": sum(samples) / len(samples) * 1000,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": samples[-1] * 1000,
+        }
+
+
+_stats: Dict[str, LatencyStats] = {}
+_lock = threading.Lock()
+
+
+def latency(name: str) -> LatencyStats:
+    """name の LatencyStats を返す（無ければ作る）"""
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = LatencyStats(CONFIG.METRICS_WINDOW)
+        return stats
+
+
+def snapshot(prefix: str = "") -> Dict[str, Dict[str, Any]]:
+    """prefix で始まる名前の計測結果をまとめて返す"""
+    with _lock:
+        items = [(name, stats) for name, stats in _stats.items() if name.startswith(prefix)]
+    return {name: stats.snapshot() for name, stats in sorted(items)}
+
+
+def reset() -> None:
+    """計測結果を破棄する（テスト用）"""
+    with _lock:
+        _stats.clear()
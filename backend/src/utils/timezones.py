@@ -0,0 +1,84 @@
+"""
+緯度経度からタイムゾーン名（IANA 名。例: "Asia/Tokyo"）を引く
+
+- TimezoneFinder（ポリゴンデータの読み込みが重い）はプロセスで1つだけ、初回に使うときに作って共有する
+- 緯度経度を TIMEZONE_CELL_DEGREES 単位のセルに丸めて結果をメモする（セル中心で判定する）
+- timezones_at は配列をまとめて引く。メモに無いセルだけを TimezoneFinder の一括 API で1回に判定する
+"""
+
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.utils.cache import TTLCache
+from src.utils.clients import shared
+from src.utils.config import CONFIG
+from timezonefinder import TimezoneFinder
+
+Cell = Tuple[int, int]
+
+# 海上などタイムゾーンが無いセルをメモするときの値（TTLCache の未登録と区別する）
+_NO_TIMEZONE = ""
+
+# タイムゾーンの境界は変わらないので期限なし（件数の上限だけで追い出す）
+_memo: TTLCache[str] = TTLCache(maxsize=CONFIG.TIMEZONE_CACHE_MAX_ENTRIES, ttl=math.inf)
+# TimezoneFinder のインスタンスはスレッドセーフではないので、判定はロックの中で行う
+_finder_lock = threading.Lock()
+
+
+def _finder() -> TimezoneFinder:
+    return shared("timezonefinder", TimezoneFinder)
+
+
+def _cell(lat: float, lng: float) -> Cell:
+    return math.floor(lat / CONFIG.TIMEZONE_CELL_DEGREES), math.floor(lng / CONFIG.TIMEZONE_CELL_DEGREES)
+
+
+def _center(cell: Cell) -> Tuple[float, float]:
+    step = CONFIG.TIMEZONE_CELL_DEGREES
+    return min(90.0, (cell[0] + 0.5) * step), min(180.0, (cell[1] + 0.5) * step)
+
+
+def _lookup(cells: List[Cell]) -> List[Optional[str]]:
+    """セル中心のタイムゾーンを一括で判定する（一括 API の無い古い timezonefinder では1件ずつ）"""
+    centers = [_center(c) for c in cells]
+    with _finder_lock:
+        tf = _finder()
+        if hasattr(tf, "timezone_names_at"):
+            return tf.timezone_names_at(lngs=[lng for _, lng in centers], lats=[lat for lat, _ in centers])
+        return [tf.timezone_at(lng=lng, lat=lat) for lat, lng in centers]
+
+
+def timezones_at(lats: Sequence[float], lngs: Sequence[float]) -> List[Optional[str]]:
+    """
+    各地点のタイムゾーン名を返す（見つからなければ None）
+    緯度経度が範囲外・長さが揃っていなければ ValueError
+    """
+    if len(lats) != len(lngs):
+        raise ValueError("lats と lngs の長さが一致しません")
+    cells: List[Cell] = []
+    for lat, lng in zip(lats, lngs):
+        lat, lng = float(lat), float(lng)
+        if not (-90.0 <= lat <= 90.0) or not (-180.0 <= lng <= 180.0):
+            raise ValueError(f"緯度経度が範囲外です: ({lat}, {lng})")
+        cells.append(_cell(lat, lng))
+
+    found: Dict[Cell, Optional[str]] = {}
+    misses: List[Cell] = []
+    for cell in dict.fromkeys(cells):
+        name = _memo.get(cell)
+        if name is None:
+            misses.append(cell)
+        else:
+            found[cell] = name or None
+
+    if misses:
+        for cell, name in zip(misses, _lookup(misses)):
+            _memo.set(cell, name or _NO_TIMEZONE)
+            found[cell] = name or None
+    return [found[c] for c in cells]
+
+
+def timezone_at(lat: float, lng: float) -> Optional[str]:
+    """1地点のタイムゾーン名を返す（見つからなければ None）"""
+    return timezones_at([lat], [lng])[0]
@@ -13,6 +13,7 @@ import { useEffect } from "react";
 
 import dynamic from "next/dynamic";
 import DiscoveryCardModal from "@/components/features/map/DiscoveryCardModal";
+import LoadMorePostsButton from "@/components/features/map/LoadMorePostsButton";
 const Map = dynamic(() => import("@/components/features/map/Map"), {
   ssr: false,
 });
@@ -52,7 +53,13 @@ export default function HomeClient({ initialPosts }: HomeClientProps) {
     setSelectedPost(null);
   }, []);
 
-  const { posts: fetchedPosts, isError } = usePosts(
+  const {
+    posts: fetchedPosts,
+    isError,
+    hasMore,
+    loadMore,
+    isLoadingMore,
+  } = usePosts(
     {
       scope: currentScope,
       userId: user?.uid,
@@ -84,6 +91,11 @@ export default function HomeClient({ initialPosts }: HomeClientProps) {
         onQueryChange={handleQueryChange}
       />
 
+      {/* 投稿は1ページずつ取得し、古い投稿は必要になったときに読み込む */}
+      {hasMore && (
+        <LoadMorePostsButton onClick={loadMore} loading={isLoadingMore} />
+      )}
+
       <DiscoveryCardModal
         post={selectedPost}
         currentLocation={currentLocation}
@@ -1,6 +1,6 @@
 "use client";
 
-import { Box, Typography, Stack } from "@mui/material";
+import { Box, Button, Typography, Stack } from "@mui/material";
 import React from "react";
 import { useGeolocation } from "@/hooks/useGeolocation";
 import DiscoveryCard from "@/components/ui/DiscoveryCard";
@@ -50,6 +50,9 @@ export default function ListClient({ initialPosts }: ListClientProps) {
     posts,
     isError: postsIsError,
     isLoading: postsIsLoading,
+    hasMore,
+    loadMore,
+    isLoadingMore,
   } = usePosts(
     {
       sort: currentSort,
@@ -125,6 +128,16 @@ export default function ListClient({ initialPosts }: ListClientProps) {
             条件に合う投稿がありません。
           </Typography>
         )}
+        {/* 続きのページは必要になったときに取得する */}
+        {hasMore && (
+          <Button
+            onClick={loadMore}
+            disabled={isLoadingMore}
+            sx={{ color: "kinako.800" }}
+          >
+            {isLoadingMore ? "読み込み中..." : "さらに古い投稿を表示"}
+          </Button>
+        )}
       </Stack>
     </Box>
   );
@@ -7,46 +7,56 @@ export type RecentPostsResponse = {
   posts: Post[];
   before: string;
   now: string;
+  limit?: number;
+  next_cursor?: string | null;
 };
 
+/** 1ページあたりの取得件数。続きは next_cursor で必要になったときに取得する */
+const RECENT_PAGE_LIMIT = 200;
+
+async function readRecentPage(res: Response): Promise<RecentPostsResponse> {
+  if (!res.ok) {
+    const text = await res.text().catch(() => "");
+    throw new Error(text || `Backend API returned HTTP ${res.status}`);
+  }
+  return (await res.json()) as RecentPostsResponse;
+}
+
 /**
- * 15分より前の投稿一覧（可視性フィルタ付き）を取得するサーバーアクション。
+ * 15分より前の投稿一覧（可視性フィルタ付き）を1ページ取得するサーバーアクション。
  * - 他人の投稿は is_public=true のみ
  * - 自分の投稿は公開/非公開ともに含む
+ * - cursor に前回の next_cursor を渡すと続きのページを返す
  */
 export async function fetchRecentPostsAction(
   userId: string,
+  cursor?: string | null,
 ): Promise<RecentPostsResponse> {
   const res = await backendFetch(`/api/posts/recent`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     cache: "no-store",
-    body: JSON.stringify({ user_id: userId }),
+    body: JSON.stringify({
+      user_id: userId,
+      limit: RECENT_PAGE_LIMIT,
+      ...(cursor ? { cursor } : {}),
+    }),
   });
-
-  if (!res.ok) {
-    const text = await res.text().catch(() => "");
-    throw new Error(text || `Backend API returned HTTP ${res.status}`);
-  }
-
-  const json = (await res.json()) as RecentPostsResponse;
-  return json;
+  return readRecentPage(res);
 }
 
 /**
- * 公開投稿のみ（GET /api/posts/recent）を取得するサーバーアクション。
+ * 公開投稿のみ（GET /api/posts/recent）を1ページ取得するサーバーアクション。
+ * cursor に前回の next_cursor を渡すと続きのページを返す。
  */
-export async function fetchRecentPublicPostsAction(): Promise<RecentPostsResponse> {
-  const res = await backendFetch(`/api/posts/recent`, {
+export async function fetchRecentPublicPostsAction(
+  cursor?: string | null,
+): Promise<RecentPostsResponse> {
+  const params = new URLSearchParams({ limit: String(RECENT_PAGE_LIMIT) });
+  if (cursor) params.set("cursor", cursor);
+  const res = await backendFetch(`/api/posts/recent?${params.toString()}`, {
     method: "GET",
     cache: "no-store",
   });
-
-  if (!res.ok) {
-    const text = await res.text().catch(() => "");
-    throw new Error(text || `Backend API returned HTTP ${res.status}`);
-  }
-
-  const json = (await res.json()) as RecentPostsResponse;
-  return json;
+  return readRecentPage(res);
 }
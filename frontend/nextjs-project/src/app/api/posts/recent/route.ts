@@ -1,8 +1,11 @@
 import { backendFetch } from "@/libs/backendFetch";
-import { NextResponse } from "next/server";
+import { NextRequest, NextResponse } from "next/server";
 
-export const GET = async () => {
-  const res = await backendFetch(`/api/posts/recent`, {
+export const GET = async (req: NextRequest) => {
+  const query = req.nextUrl.searchParams;
+
+  // 1ページ分（最大 limit 件）をそのまま中継する。続きは呼び出し側が next_cursor を cursor に渡して取得する
+  const res = await backendFetch(`/api/posts/recent?${query.toString()}`, {
     method: "GET",
     cache: "no-store",
   });
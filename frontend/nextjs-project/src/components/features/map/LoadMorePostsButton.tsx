@@ -0,0 +1,49 @@
+"use client";
+
+import { Box, Button, CircularProgress } from "@mui/material";
+
+interface LoadMorePostsButtonProps {
+  onClick: () => void;
+  loading: boolean;
+}
+
+/**
+ * 地図に表示する投稿の続き（次のページ）を読み込むボタン。
+ * 投稿は1ページずつ取得するので、古い投稿はこのボタンを押したときにだけ取得する。
+ */
+export default function LoadMorePostsButton({
+  onClick,
+  loading,
+}: LoadMorePostsButtonProps) {
+  return (
+    <Box
+      sx={{
+        position: "absolute",
+        bottom: 36,
+        left: "50%",
+        transform: "translateX(-50%)",
+        zIndex: 1000,
+        pointerEvents: "none",
+      }}
+    >
+      {/* 内側のボタン：クリックイベントを「有効」に戻す */}
+      <Button
+        onClick={onClick}
+        disabled={loading}
+        sx={{
+          pointerEvents: "auto",
+          backgroundColor: "white",
+          color: "kinako.900",
+          borderRadius: 999,
+          px: 2.5,
+          boxShadow: "0 2px 8px rgba(0,0,0,0.04)",
+          "&:hover": {
+            backgroundColor: "gray.100",
+          },
+        }}
+      >
+        {loading ? <CircularProgress size={18} /> : "さらに古い投稿を表示"}
+      </Button>
+    </Box>
+  );
+}
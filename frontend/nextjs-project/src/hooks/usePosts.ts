@@ -1,7 +1,7 @@
 "use client";
 
-import useSWR from "swr";
-import { useMemo } from "react";
+import useSWRInfinite from "swr/infinite";
+import { useCallback, useMemo } from "react";
 import { Post } from "@/types/post";
 import { calculateDistance } from "@/utils/calculateDistance";
 import { useAuthStore, AuthState } from "@/stores/authStore";
@@ -13,6 +13,7 @@ import { searchPostsViaRouteHandler } from "@/libs/searchPosts";
 
 type PostsApiResponse = {
   posts: Post[];
+  next_cursor?: string | null;
 };
 
 type UsePostsParams = {
@@ -25,7 +26,8 @@ type UsePostsParams = {
 
 /**
  * 投稿の一覧を取得し、フロントエンドでフィルタリングとソートを行うSWRカスタムフック
- * 30秒ごとの自動更新機能付き。
+ * 30秒ごとの自動更新機能付き（再検証するのは1ページ目だけ）。
+ * 最近の投稿は1ページ分だけ取得し、続きは loadMore を呼んだときに next_cursor で取得する。
  * @param params sort, scope, userId, currentLocation を含むオブジェクト
  */
 export function usePosts(
@@ -43,10 +45,20 @@ export function usePosts(
       ? `recent:${user.uid}`
       : `recent:public`;
 
-  const { data, error, mutate, isLoading, isValidating } =
-    useSWR<PostsApiResponse>(
-      swrKey,
-      async () => {
+  // ページごとのキー: [swrKey, cursor]。検索結果と next_cursor のないページの続きは取得しない
+  const getKey = (
+    pageIndex: number,
+    previousPage: PostsApiResponse | null,
+  ): [string, string | null] | null => {
+    if (pageIndex === 0) return [swrKey, null];
+    if (isSearchMode || !previousPage?.next_cursor) return null;
+    return [swrKey, previousPage.next_cursor];
+  };
+
+  const { data, error, mutate, isLoading, isValidating, size, setSize } =
+    useSWRInfinite<PostsApiResponse>(
+      getKey,
+      async ([, cursor]: [string, string | null]) => {
         // TODO: これ外側で関数定義したい
         // サーバーアクションをクライアントから呼ぶ（ログイン状態で分岐）
         // 検索クエリがある場合は検索APIを利用
@@ -57,11 +69,11 @@ export function usePosts(
           return { posts } satisfies PostsApiResponse;
         }
 
-        // 検索クエリがない場合は最近の投稿を取得（ログイン状態で分岐）
-        const { posts } = user?.uid
-          ? await fetchRecentPostsAction(user.uid)
-          : await fetchRecentPublicPostsAction();
-        return { posts } satisfies PostsApiResponse;
+        // 検索クエリがない場合は最近の投稿を1ページ取得（ログイン状態で分岐）
+        const { posts, next_cursor } = user?.uid
+          ? await fetchRecentPostsAction(user.uid, cursor)
+          : await fetchRecentPublicPostsAction(cursor);
+        return { posts, next_cursor } satisfies PostsApiResponse;
       },
       {
         // 検索モードの時は、キャッシュを使わず常に再検証する
@@ -71,19 +83,40 @@ export function usePosts(
         refreshInterval: 30000,
         suspense: true,
         // 検索時はfallbackDataを使わない（前回の一覧を誤表示しないため）
-        fallbackData: isSearchMode ? undefined : fallbackData,
+        fallbackData: isSearchMode || !fallbackData ? undefined : [fallbackData],
       },
     );
 
-  const filteredPosts = useMemo(() => {
-    if (!data?.posts) {
+  // 取得済みのページをつなげる。1ページ目の再検証で境界がずれても同じ投稿は1件にまとめる
+  const loadedPosts = useMemo(() => {
+    if (!data) {
       return [];
     }
+    const seen = new Set<string>();
+    const posts: Post[] = [];
+    for (const post of data.flatMap((page) => page.posts)) {
+      if (seen.has(post.post_id)) continue;
+      seen.add(post.post_id);
+      posts.push(post);
+    }
+    return posts;
+  }, [data]);
 
+  const lastPage = data?.[data.length - 1];
+  const hasMore = !isSearchMode && !!lastPage?.next_cursor;
+  // 続きのページを取得中（一覧全体の読み込み中とは区別する）
+  const isLoadingMore = size > 1 && data?.[size - 1] === undefined;
+  const loadMore = useCallback(() => {
+    if (hasMore) {
+      setSize(size + 1);
+    }
+  }, [hasMore, setSize, size]);
+
+  const filteredPosts = useMemo(() => {
     // --- 1. スコープによるフィルタリング ---
-    let postsToFilter = data.posts;
+    let postsToFilter = loadedPosts;
     if (scope === "mine") {
-      postsToFilter = data.posts.filter(
+      postsToFilter = loadedPosts.filter(
         (post: Post) => post.user_id === userId,
       );
     }
@@ -128,13 +161,16 @@ export function usePosts(
 
     return sortedPosts;
 
-    // data, sort, scope, userId, currentLocation のいずれかが変更された場合のみ再計算
-  }, [data, sort, scope, userId, currentLocation]);
+    // loadedPosts, sort, scope, userId, currentLocation のいずれかが変更された場合のみ再計算
+  }, [loadedPosts, sort, scope, userId, currentLocation]);
 
   return {
     posts: filteredPosts, // フィルタリング・ソート済みの結果を返す
     isError: error,
-    isLoading: isLoading || isValidating,
+    isLoading: (isLoading || isValidating) && !isLoadingMore,
+    isLoadingMore,
+    hasMore, // next_cursor があり、続きのページを取得できる
+    loadMore, // 続きの1ページを取得する
     mutate,
   };
 }
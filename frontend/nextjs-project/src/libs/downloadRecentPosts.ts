@@ -48,7 +48,7 @@ function triggerJsonDownload(data: unknown, filename: string) {
 }
 
 /**
- * 公開投稿を取得し、指定のカラムを除去したJSONを端末にダウンロードさせる。
+ * 最近の公開投稿（1ページ分）を取得し、指定のカラムを除去したJSONを端末にダウンロードさせる。
  */
 export async function downloadRecentPostsJson(filename = "recent_posts.json") {
   const { posts } = await fetchRecentPublicPostsAction();
@@ -5,7 +5,7 @@ import { fetchRecentPublicPostsAction } from "@/app/actions/getRecentAndPostUser
  * サーバーサイドで投稿一覧を取得するための関数
  */
 export async function getPosts(): Promise<Post[]> {
-  // サーバーサイド取得は GET /api/posts/recent（公開のみ）
+  // サーバーサイド取得は GET /api/posts/recent（公開のみ）の1ページ目。続きはクライアントの usePosts が取得する
   const { posts } = await fetchRecentPublicPostsAction();
   return posts;
 }